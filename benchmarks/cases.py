@@ -0,0 +1,326 @@
+"""
+The benchmark cases.
+
+Each case is a function registered with @benchmark(name, group). It is
+called with the BenchmarkContext once per repeat and may return the number
+of rows it produced; the runner times every call and counts its queries.
+Views are requested through the Django test client as a superuser, so they
+run the full middleware and template stack.
+"""
+import contextlib
+import io
+from functools import cached_property
+
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+# Cases in registration order: (name, group, function)
+BENCHMARKS = []
+
+# Stays below DATA_UPLOAD_MAX_NUMBER_FIELDS (1000 by default)
+LABEL_EXPORT_SAMPLES = 500
+BENCHMARK_USERNAME = 'benchmark'
+
+
+def benchmark(name, group):
+    def register(function):
+        BENCHMARKS.append((name, group, function))
+        return function
+    return register
+
+
+def select(patterns):
+    """The cases whose name or group matches one of `patterns` (all if empty)."""
+    if not patterns:
+        return list(BENCHMARKS)
+    return [case for case in BENCHMARKS if case[0] in patterns or case[1] in patterns]
+
+
+class BenchmarkContext:
+    """Shared inputs of the cases, built on first use and outside the timings."""
+
+    def __init__(self, workdir, import_rows, harmonize_rows, seed=0):
+        self.workdir = workdir
+        self.import_rows = import_rows
+        self.harmonize_rows = harmonize_rows
+        self.seed = seed
+        self.repeat = 0
+
+    @cached_property
+    def client(self):
+        from django.contrib.auth.models import User
+
+        user = User.objects.filter(username=BENCHMARK_USERNAME).first() or User.objects.create_superuser(
+            BENCHMARK_USERNAME, 'benchmark@example.com', None,
+        )
+        client = Client()
+        client.force_login(user)
+        return client
+
+    @cached_property
+    def sample_subject(self):
+        from sampletracking.models import CrudeSample
+
+        return CrudeSample.objects.order_by('pk').values_list('subject_id', flat=True)[:1].get()
+
+    @cached_property
+    def label_pks(self):
+        from sampletracking.models import Extract
+
+        return list(Extract.objects.order_by('pk').values_list('pk', flat=True)[:LABEL_EXPORT_SAMPLES])
+
+    @cached_property
+    def legacy_frame(self):
+        from synthetic import legacy_import_frame
+
+        return legacy_import_frame(self.import_rows, seed=self.seed)
+
+    @cached_property
+    def harmonization_inputs(self):
+        from synthetic import harmonization_inputs
+
+        dataframes, linkage_key = harmonization_inputs(self.harmonize_rows, seed=self.seed)
+        path = self.workdir / 'linkage_key.csv'
+        linkage_key.to_csv(path, index=False)
+        return dataframes, path
+
+    @cached_property
+    def workbook_paths(self):
+        """The harmonization inputs written as Excel workbooks, one per file key."""
+        import pandas as pd
+
+        workbooks = {}
+        for source_key, df in self.harmonization_inputs[0].items():
+            filename, sheet_name = source_key.split('|')
+            workbooks.setdefault(filename, {})[sheet_name] = df
+        paths = []
+        for filename, sheets in workbooks.items():
+            paths.append(self.workdir / filename)
+            with pd.ExcelWriter(paths[-1]) as writer:
+                for sheet_name, df in sheets.items():
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+        return paths
+
+    @cached_property
+    def id_lookup(self):
+        from run_harmonization import create_lookup_from_linkage_key
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            return create_lookup_from_linkage_key(self.harmonization_inputs[1])
+
+    def get(self, url_name, data=None, args=None):
+        return consume(self.client.get(reverse(url_name, args=args), data))
+
+    def post(self, url_name, data=None):
+        return consume(self.client.post(reverse(url_name), data))
+
+
+def consume(response):
+    """Read a (streamed) response and return the number of lines it sent."""
+    if response.status_code != 200:
+        raise AssertionError(f"{response.request['PATH_INFO']} returned {response.status_code}")
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    return content.count(b'\n')
+
+
+# --- List views ---
+
+@benchmark('crude_sample_list', 'list_views')
+def crude_sample_list(context):
+    return context.get('crude_sample_list')
+
+
+@benchmark('crude_sample_list_last_page', 'list_views')
+def crude_sample_list_last_page(context):
+    return context.get('crude_sample_list', {'page': 'last'})
+
+
+@benchmark('aliquot_list', 'list_views')
+def aliquot_list(context):
+    return context.get('aliquot_list')
+
+
+@benchmark('extract_list', 'list_views')
+def extract_list(context):
+    return context.get('extract_list')
+
+
+@benchmark('library_list', 'list_views')
+def library_list(context):
+    return context.get('library_list')
+
+
+# --- Search ---
+
+@benchmark('search_subject', 'search')
+def search_subject(context):
+    return context.get('search', {'q': context.sample_subject})
+
+
+@benchmark('search_barcode_prefix', 'search')
+def search_barcode_prefix(context):
+    return context.get('search', {'q': 'BENCH-CS00001'})
+
+
+@benchmark('search_no_match', 'search')
+def search_no_match(context):
+    return context.get('search', {'q': 'no-such-sample'})
+
+
+@benchmark('barcode_prefix_lookup', 'search')
+def barcode_prefix_lookup(context):
+    return context.get('barcode_prefix_lookup', {'prefix': 'BENCH-CS0000'})
+
+
+# --- Reports ---
+
+@benchmark('comprehensive_report', 'reports')
+def comprehensive_report(context):
+    return context.get('comprehensive_report')
+
+
+@benchmark('comprehensive_report_filtered', 'reports')
+def comprehensive_report_filtered(context):
+    return context.get('comprehensive_report', {'sample_type': 'Skin', 'date_from': '2022-01-01'})
+
+
+@benchmark('daily_status_report', 'reports')
+def daily_status_report(context):
+    return context.post('daily_status_report', {'report_date': '2022-06-01'})
+
+
+@benchmark('report_file', 'reports')
+def report_file(context):
+    from sampletracking.reports import write_report
+
+    path = write_report(f'benchmark-{context.repeat}', {}, 'csv')
+    with open(path, 'rb') as f:
+        rows = sum(1 for _ in f)
+    path.unlink()
+    return rows
+
+
+# --- Dashboard statistics ---
+
+@benchmark('dashboard_stats', 'dashboard')
+def dashboard_stats(context):
+    from sampletracking.models import CrudeSample
+    from sampletracking.stats import DashboardStats
+
+    stats = DashboardStats()
+    stats.totals()
+    stats.totals(days=7)
+    stats.breakdown(CrudeSample, 'category', 'sample_source')
+    stats.sequencing()
+    stats.quality_metrics()
+    stats.problems()
+
+
+@benchmark('admin_stats', 'dashboard')
+def admin_stats(context):
+    from sampletracking.stats import compute_admin_stats
+
+    compute_admin_stats()
+
+
+@benchmark('snapshot_refresh', 'dashboard')
+def snapshot_refresh(context):
+    from sampletracking.stats import rebuild_snapshot
+
+    rebuild_snapshot()
+
+
+# --- Label and sample exports ---
+
+@benchmark('label_export', 'labels')
+def label_export(context):
+    return context.post('export_labels', {'selected_samples': context.label_pks, 'model_type': 'extract'})
+
+
+@benchmark('extract_export', 'labels')
+def extract_export(context):
+    return context.get('export_samples', args=['extract'])
+
+
+# --- Legacy import ---
+
+@benchmark('legacy_import', 'legacy_import')
+def legacy_import(context):
+    from sampletracking.barcodes import barcode_cache
+    from sampletracking.legacy_import import LegacyImporter
+
+    # Roll back, so every repeat imports the same rows into the same database
+    with transaction.atomic():
+        summary = LegacyImporter().run(context.legacy_frame)
+        transaction.set_rollback(True)
+    barcode_cache.clear()
+    return summary['unique_samples']
+
+
+# --- Harmonization ---
+
+@benchmark('read_workbooks', 'harmonization')
+def read_workbooks(context):
+    from sample_importer.readers import iter_workbooks
+
+    results = iter_workbooks(context.workbook_paths, cache=False)
+    return sum(len(df) for result in results for df in result.sheets.values())
+
+
+@benchmark('read_workbooks_cached', 'harmonization')
+def read_workbooks_cached(context):
+    from sample_importer.cache import SheetCache
+    from sample_importer.readers import iter_workbooks
+
+    # The warm-up run fills the cache
+    results = iter_workbooks(context.workbook_paths, cache=SheetCache(context.workdir / 'sheet_cache'))
+    return sum(len(df) for result in results for df in result.sheets.values())
+
+
+@benchmark('linkage_key_lookup', 'harmonization')
+def linkage_key_lookup(context):
+    from run_harmonization import create_lookup_from_linkage_key
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return len(create_lookup_from_linkage_key(context.harmonization_inputs[1]))
+
+
+@benchmark('linkage_index_load', 'harmonization')
+def linkage_index_load(context):
+    from run_harmonization import create_lookup_from_linkage_key
+
+    # The warm-up run builds and saves the index; the timed runs memory-map it
+    with contextlib.redirect_stdout(io.StringIO()):
+        return len(create_lookup_from_linkage_key(context.harmonization_inputs[1], context.workdir / 'linkage_index'))
+
+
+@benchmark('harmonize_samples', 'harmonization')
+def harmonize_samples(context):
+    from sample_importer.harmonizers import create_harmonized_sample_list
+
+    dataframes = context.harmonization_inputs[0]
+    lookup = context.id_lookup
+    with contextlib.redirect_stdout(io.StringIO()):
+        return len(create_harmonized_sample_list(dataframes, lookup))
+
+
+@benchmark('harmonize_streaming', 'harmonization')
+def harmonize_streaming(context):
+    from run_harmonization import harmonize_files
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return harmonize_files(context.workbook_paths, context.id_lookup, context.workdir / 'harmonized.tsv')
+
+
+@benchmark('harmonize_incremental_unchanged', 'harmonization')
+def harmonize_incremental_unchanged(context):
+    from sample_importer.incremental import harmonize_incrementally
+
+    # The warm-up run harmonizes everything; the timed runs find nothing changed
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = harmonize_incrementally(
+            context.harmonization_inputs[0], context.id_lookup,
+            context.workdir / 'incremental.tsv', context.workdir / 'incremental_manifest.json',
+        )
+    return summary['rows']
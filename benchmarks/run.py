@@ -0,0 +1,175 @@
+"""
+Run the benchmark suite against a synthetic database and write the timings
+to a JSON results file.
+
+Usage: python benchmarks/run.py [--scale N] [--repeat N] [--only NAME ...]
+                                [--output PATH] [--compare PATH] [--keepdb]
+
+The benchmarks never touch the development database: Django's test database
+machinery creates a separate SQLite file (benchmarks/bench_<scale>.sqlite3),
+which synthetic.generate() fills with `--scale` crude samples and their
+lineages. With --keepdb the file is kept and reused by later runs at the
+same scale, skipping the generation.
+
+Every case runs once to warm up and then `--repeat` times; the results file
+records the min, median, mean and max wall time, the query count and
+database time of the last run and the rows produced, together with the scale, seed, git commit and versions, so
+runs can be compared over time with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCHMARKS_DIR.parent
+WEBAPP_DIR = REPO_DIR / 'webapp'
+RESULTS_DIR = BENCHMARKS_DIR / 'results'
+
+for path in (WEBAPP_DIR, REPO_DIR, BENCHMARKS_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sampledb.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+from sampletracking.perf import RequestTimer  # noqa: E402
+
+import cases  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_case(function, context, repeat):
+    """Run `function` once to warm up, then `repeat` times; return its statistics."""
+    function(context)
+    timings = []
+    for context.repeat in range(1, repeat + 1):
+        timer = RequestTimer()
+        with connection.execute_wrapper(timer):
+            started = time.perf_counter()
+            rows = function(context)
+            timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'repeats': repeat,
+        'min_ms': round(min(timings), 2),
+        'median_ms': round(statistics.median(timings), 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'max_ms': round(max(timings), 2),
+        'queries': timer.queries,
+        'db_ms': round(timer.db_seconds * 1000, 2),
+        'rows': rows,
+    }
+
+
+def compare(results, previous_path):
+    """Print the change of every case's median against an earlier results file."""
+    previous = json.loads(Path(previous_path).read_text())
+    print(f"\nCompared with {previous_path} (commit {previous.get('git_commit')}, scale {previous['scale']:,}):")
+    for name, result in results['benchmarks'].items():
+        before = previous['benchmarks'].get(name)
+        if before is None:
+            print(f"  • {name}: new")
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] * 100 if before['median_ms'] else 0.0
+        print(f"  • {name}: {before['median_ms']:,.1f} -> {result['median_ms']:,.1f} ms ({change:+.0f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the sample database on synthetic data.')
+    parser.add_argument('--scale', type=int, default=10000,
+                        help='Number of synthetic crude samples (default: 10000)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic data (default: 0)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case (default: 5)')
+    parser.add_argument('--only', nargs='+', metavar='NAME', help='Run only these cases or groups')
+    parser.add_argument('--import-rows', type=int, default=10000,
+                        help='Rows in the legacy import benchmark (default: 10000)')
+    parser.add_argument('--harmonize-rows', type=int, default=100000,
+                        help='Rows in the harmonization benchmark (default: 100000)')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<timestamp>_<scale>.json)')
+    parser.add_argument('--compare', metavar='PATH', help='Earlier results file to compare against')
+    parser.add_argument('--keepdb', action='store_true', help='Keep the benchmark database for later runs')
+    args = parser.parse_args(argv)
+    if args.scale < 1 or args.repeat < 1 or args.import_rows < 1 or args.harmonize_rows < 1:
+        parser.error('--scale, --repeat, --import-rows and --harmonize-rows must be positive integers.')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = cases.select(args.only)
+    if not selected:
+        sys.exit(f"No benchmark matches {' '.join(args.only)}.")
+
+    started = datetime.now(timezone.utc)
+    results = {
+        'started': started.isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'scale': args.scale,
+        'seed': args.seed,
+        'import_rows': args.import_rows,
+        'harmonize_rows': args.harmonize_rows,
+    }
+
+    setup_test_environment()
+    connection.settings_dict['TEST']['NAME'] = str(BENCHMARKS_DIR / f'bench_{args.scale}.sqlite3')
+    original_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, keepdb=args.keepdb)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            # Keep report files and request statistics out of the webapp's directories
+            from sampletracking import perf, reports
+            reports.REPORTS_DIR = perf.PERF_STATS_DIR = Path(workdir)
+
+            from sampletracking.models import CrudeSample
+            if CrudeSample.objects.count() != args.scale:
+                print(f"Generating {args.scale:,} synthetic crude samples...")
+                results['generation'] = synthetic.generate(args.scale, args.seed, log=print)
+            else:
+                print(f"Reusing the benchmark database with {args.scale:,} crude samples.")
+
+            context = cases.BenchmarkContext(Path(workdir), args.import_rows, args.harmonize_rows, args.seed)
+            results['benchmarks'] = {}
+            for name, group, function in selected:
+                result = time_case(function, context, args.repeat)
+                results['benchmarks'][name] = {'group': group, **result}
+                print(f"  • {name}: median {result['median_ms']:,.1f} ms, {result['queries']} queries")
+    finally:
+        connection.creation.destroy_test_db(original_name, verbosity=0, keepdb=args.keepdb)
+        teardown_test_environment()
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{started.strftime('%Y%m%dT%H%M%S')}_{args.scale}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
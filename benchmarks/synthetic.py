@@ -0,0 +1,287 @@
+"""
+Synthetic sample data for the benchmarks.
+
+generate() writes `scale` crude samples with realistic lineages below them:
+one or two aliquots per crude sample, one extract per aliquot (mostly DNA),
+and a sequencing library on a 96-well plate for most DNA and RNA extracts.
+Subjects give several samples each, and collection dates spread over five
+years. Rows are written with bulk inserts, `chunk_size` crude samples at a
+time, so memory stays flat from 10k to 1M crude samples; the search index,
+barcode registry and dashboard snapshot are rebuilt once at the end.
+
+The same seed always produces the same data. The other helpers build the
+inputs of the legacy import and harmonization benchmarks as DataFrames.
+
+Django must be set up before generate() is called (see run.py).
+"""
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+BARCODE_PREFIX = 'BENCH'
+FIRST_COLLECTION_DATE = date(2020, 1, 1)
+COLLECTION_DAYS = 5 * 365
+SAMPLES_PER_SUBJECT = 3
+DEFAULT_CHUNK_SIZE = 10000
+
+PLATE_ROWS = 'ABCDEFGH'
+PLATE_COLUMNS = 12
+PLATE_WELLS = [f'{row}{column}' for row in PLATE_ROWS for column in range(1, PLATE_COLUMNS + 1)]
+
+# (value, probability) pairs
+SAMPLE_SOURCES = [('Stool', 0.6), ('Oral', 0.1), ('Nasal', 0.08), ('Skin', 0.1), ('Blood', 0.07), ('Tissue', 0.05)]
+STATUSES = [('AVAILABLE', 0.6), ('IN_PROCESS', 0.15), ('AWAITING_RECEIPT', 0.1), ('EXHAUSTED', 0.1),
+            ('ARCHIVED', 0.04), ('CONTAMINATED', 0.01)]
+EXTRACT_TYPES = [('DNA', 0.7), ('RNA', 0.2), ('Metabolomics', 0.1)]
+LIBRARY_TYPES = [('Nextera', 0.6), ('TruSeq', 0.25), ('Nanopore', 0.15)]
+ANALYSIS_TYPES = {'DNA': 'MSS', 'RNA': 'MTS'}
+SEQUENCED_EXTRACT_TYPES = [('DNA', 0.8), ('RNA', 0.2)]
+LIBRARY_FRACTION = 0.8
+SEQUENCED_FRACTION = 0.5
+
+
+def _choice(rng, weighted, size):
+    values, probabilities = zip(*weighted)
+    return rng.choice(np.array(values, dtype=object), size=size, p=probabilities)
+
+
+def _dates(offsets):
+    return [FIRST_COLLECTION_DATE + timedelta(days=int(offset)) for offset in offsets]
+
+
+def crude_barcode(index):
+    return f'{BARCODE_PREFIX}-CS{index:07d}'
+
+
+def subject_id(index):
+    return f'SUBJ-{index // SAMPLES_PER_SUBJECT:07d}'
+
+
+class LineageGenerator:
+    """Writes synthetic lineages chunk by chunk, numbering rows across chunks."""
+
+    def __init__(self, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.rng = np.random.default_rng(seed)
+        self.chunk_size = chunk_size
+        self.libraries = 0
+        self.plates = {}
+        self.counts = {'crude_samples': 0, 'aliquots': 0, 'extracts': 0, 'libraries': 0, 'plates': 0}
+
+    def run(self, scale, log=None):
+        from django.db import transaction
+
+        log = log or (lambda message: None)
+        for start in range(0, scale, self.chunk_size):
+            with transaction.atomic():
+                self.write_chunk(range(start, min(start + self.chunk_size, scale)))
+            log(f"  {min(start + self.chunk_size, scale):,} / {scale:,} crude samples")
+        return self.counts
+
+    def write_chunk(self, indexes):
+        from sampletracking.models import Aliquot, CrudeSample, Extract, Plate, SequenceLibrary
+
+        rng = self.rng
+        n = len(indexes)
+        offsets = rng.integers(0, COLLECTION_DAYS, n)
+        collected = _dates(offsets)
+        crudes = [
+            CrudeSample(
+                barcode=crude_barcode(i),
+                subject_id=subject_id(i),
+                collection_date=day,
+                date_created=day,
+                sample_source=source,
+                status=status,
+                freezer_ID=f'FRZ-{i % 20:02d}',
+                box_ID=f'BOX-{i // 81:06d}',
+            )
+            for i, day, source, status in zip(indexes, collected, _choice(rng, SAMPLE_SOURCES, n),
+                                              _choice(rng, STATUSES, n))
+        ]
+
+        # One or two aliquots per crude sample, processed within a week
+        per_crude = rng.integers(1, 3, n)
+        parents = np.repeat(np.arange(n), per_crude)
+        numbers = np.concatenate([np.arange(1, k + 1) for k in per_crude])
+        aliquot_days = _dates(np.repeat(offsets, per_crude) + rng.integers(1, 8, len(parents)))
+        aliquots = [
+            Aliquot(
+                barcode=f'{crudes[p].barcode}-ALIQ{k:02d}',
+                parent_barcode_id=crudes[p].barcode,
+                root_crude_barcode=crudes[p].barcode,
+                root_subject_id=crudes[p].subject_id,
+                date_created=day,
+                status=status,
+                volume=round(float(volume), 1),
+                concentration=round(float(concentration), 2),
+            )
+            for p, k, day, status, volume, concentration in zip(
+                parents, numbers, aliquot_days, _choice(rng, STATUSES, len(parents)),
+                rng.uniform(50, 500, len(parents)), rng.uniform(0.5, 50, len(parents)),
+            )
+        ]
+
+        # One extract per aliquot
+        m = len(aliquots)
+        extract_types = _choice(rng, EXTRACT_TYPES, m)
+        extract_days = [day + timedelta(days=int(lag)) for day, lag in zip(aliquot_days, rng.integers(1, 15, m))]
+        extracts = [
+            Extract(
+                barcode=f'{aliquot.barcode}-EXT01',
+                parent_id=aliquot.barcode,
+                root_crude_barcode=aliquot.root_crude_barcode,
+                root_subject_id=aliquot.root_subject_id,
+                date_created=day,
+                status=status,
+                extract_type=extract_type,
+                quality_score=round(float(quality), 1),
+                concentration=round(float(concentration), 2),
+            )
+            for aliquot, day, status, extract_type, quality, concentration in zip(
+                aliquots, extract_days, _choice(rng, STATUSES, m), extract_types,
+                rng.uniform(40, 100, m), rng.uniform(1, 200, m),
+            )
+        ]
+
+        CrudeSample.objects.bulk_create(crudes)
+        Aliquot.objects.bulk_create(aliquots)
+        Extract.objects.bulk_create(extracts)
+
+        # Most DNA and RNA extracts are sequenced, 96 libraries to a plate
+        sequenced = (np.isin(extract_types, list(ANALYSIS_TYPES))) & (rng.random(m) < LIBRARY_FRACTION)
+        chosen = [extracts[i] for i in np.flatnonzero(sequenced)]
+        positions = range(self.libraries, self.libraries + len(chosen))
+        new_plates = sorted({position // len(PLATE_WELLS) for position in positions} - self.plates.keys())
+        self.plates.update(zip(new_plates, Plate.objects.bulk_create([
+            Plate(barcode=f'{BARCODE_PREFIX}-PL{number:06d}', freezer_ID=f'FRZ-{number % 20:02d}')
+            for number in new_plates
+        ])))
+        run_dates = rng.random(len(chosen)) < SEQUENCED_FRACTION
+        libraries = [
+            SequenceLibrary(
+                barcode=f'{extract.barcode}-LIB01',
+                parent=extract,
+                root_crude_barcode=extract.root_crude_barcode,
+                root_subject_id=extract.root_subject_id,
+                date_created=extract.date_created + timedelta(days=7),
+                status='AVAILABLE',
+                library_type=library_type,
+                analysis_type=ANALYSIS_TYPES[extract.extract_type],
+                nindex=f'N7{position % 24 + 1:02d}',
+                sindex=f'S5{position % 16 + 2:02d}',
+                qubit_conc=round(float(qubit), 2),
+                date_sequenced=extract.date_created + timedelta(days=30) if is_run else None,
+                sequencing_platform='NovaSeq' if is_run else None,
+                plate=self.plates[position // len(PLATE_WELLS)],
+                well=PLATE_WELLS[position % len(PLATE_WELLS)],
+            )
+            for extract, position, library_type, qubit, is_run in zip(
+                chosen, positions, _choice(rng, LIBRARY_TYPES, len(chosen)),
+                rng.uniform(0.5, 100, len(chosen)), run_dates,
+            )
+        ]
+        SequenceLibrary.objects.bulk_create(libraries)
+        self.libraries += len(libraries)
+
+        self.counts['crude_samples'] += len(crudes)
+        self.counts['aliquots'] += len(aliquots)
+        self.counts['extracts'] += len(extracts)
+        self.counts['libraries'] += len(libraries)
+        self.counts['plates'] += len(new_plates)
+
+
+def generate(scale, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, log=None):
+    """
+    Write `scale` synthetic crude samples with their lineages and rebuild the
+    derived tables. Returns the row counts and the seconds each step took.
+    """
+    from sampletracking.barcodes import rebuild_barcode_registry
+    from sampletracking.search import rebuild_search_index
+    from sampletracking.stats import rebuild_snapshot
+
+    log = log or (lambda message: None)
+    timings = {}
+    started = time.perf_counter()
+    counts = LineageGenerator(seed, chunk_size).run(scale, log)
+    timings['insert_seconds'] = time.perf_counter() - started
+
+    for name, rebuild in (
+        ('search_index_seconds', rebuild_search_index),
+        ('barcode_registry_seconds', rebuild_barcode_registry),
+        ('snapshot_seconds', rebuild_snapshot),
+    ):
+        step_started = time.perf_counter()
+        rebuild()
+        timings[name] = time.perf_counter() - step_started
+        log(f"  {name.replace('_seconds', '').replace('_', ' ')} rebuilt in {timings[name]:.1f}s")
+    return {**counts, **timings}
+
+
+def legacy_import_frame(rows, seed=0, prefix='LEGACY'):
+    """A harmonized legacy TSV, as import_legacy_data reads it, with `rows` samples."""
+    rng = np.random.default_rng(seed)
+    extract_types = _choice(rng, SEQUENCED_EXTRACT_TYPES, rows)
+    return pd.DataFrame({
+        'subject_id': [f'SUBJ-L{i // SAMPLES_PER_SUBJECT:07d}' for i in range(rows)],
+        'collection_date': pd.to_datetime(_dates(rng.integers(0, COLLECTION_DAYS, rows))).strftime('%Y-%m-%d'),
+        'sample_source': _choice(rng, SAMPLE_SOURCES, rows),
+        'sequence_filename': [f'{prefix}-{i:07d}' for i in range(rows)],
+        'Extract Type': extract_types,
+        'Analysis Type': [ANALYSIS_TYPES[extract_type] for extract_type in extract_types],
+    })
+
+
+# Column names used by the different spreadsheet layouts the importer meets
+RAW_LAYOUTS = [
+    {'id': 'MRN', 'date': 'Collection Date', 'source': 'Sample Type', 'file': 'FASTQ', 'project': None},
+    {'id': 'UPN', 'date': 'collection_dt', 'source': 'source', 'file': 'sequence_file', 'project': 'Project'},
+    {'id': 'patient_id', 'date': 'sample_date', 'source': 'sample_type', 'file': 'filename', 'project': 'PI'},
+]
+ID_TYPES = {'MRN': 'mrn', 'UPN': 'upn', 'patient_id': 'pmid'}
+
+
+def _legacy_id(id_type, person):
+    return {'mrn': f'{10000000 + person}', 'upn': f'UPN_{person:07d}', 'pmid': f'PMID-{person:07d}'}[id_type]
+
+
+def harmonization_inputs(rows, sheets=6, seed=0):
+    """
+    Raw spreadsheet DataFrames keyed 'file|sheet', in the layouts of
+    RAW_LAYOUTS, holding `rows` samples between them, and the linkage key
+    DataFrame (subject_id, mrn, upn, pmid) for the people they mention.
+    """
+    rng = np.random.default_rng(seed)
+    people = max(rows // SAMPLES_PER_SUBJECT, 1)
+    sheet_rows = np.array_split(np.arange(rows), sheets)
+    dataframes = {}
+    for number, indexes in enumerate(sheet_rows):
+        layout = RAW_LAYOUTS[number % len(RAW_LAYOUTS)]
+        n = len(indexes)
+        persons = rng.integers(0, people, n)
+        days = _dates(rng.integers(0, COLLECTION_DAYS, n))
+        sources = [source.lower() if flip else source
+                   for source, flip in zip(_choice(rng, SAMPLE_SOURCES, n), rng.random(n) < 0.3)]
+        df = pd.DataFrame({
+            layout['id']: [_legacy_id(ID_TYPES[layout['id']], int(person)) for person in persons],
+            layout['date']: pd.to_datetime(days).strftime('%m/%d/%Y' if number % 2 else '%Y-%m-%d'),
+            layout['source']: sources,
+            layout['file']: [f'p{person:07d}_s{i}.fq.gz' for person, i in zip(persons, indexes)],
+        })
+        if layout['project']:
+            df[layout['project']] = f'Cohort_{number}'
+        dataframes[f'bench_{number // 2}.xlsx|Sheet{number % 2 + 1}'] = df
+
+    person_ids = np.arange(people)
+    linkage_key = pd.DataFrame({
+        'subject_id': [f'SUBJ-{person:08X}' for person in person_ids],
+        'mrn': [_legacy_id('mrn', person) for person in person_ids],
+        'upn': [_legacy_id('upn', person) for person in person_ids],
+        'pmid': [_legacy_id('pmid', person) for person in person_ids],
+    })
+    # Some people have two MRNs on record
+    merged = rng.random(people) < 0.05
+    linkage_key.loc[merged, 'mrn'] = linkage_key.loc[merged, 'mrn'] + ';' + (
+        linkage_key.loc[merged, 'mrn'].astype(int) + 50000000).astype(str)
+    return dataframes, linkage_key
@@ -1,10 +1,17 @@
+import hashlib
+import numpy as np
 import pandas as pd
-import uuid
 import os
+import random
+import stat
+import uuid
 from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog
 
+# The tool is copied to, and run on, machines that only hold this directory,
+# so it imports nothing from the rest of the repository.
+
 # --- Configuration ---
 IDENTIFIER_COLUMN_MAP = {
     'MRN': 'mrn',
@@ -14,14 +21,84 @@ IDENTIFIER_COLUMN_MAP = {
     'patient_id': 'pmid'
 }
 
-def load_all_sheets_from_files(file_paths):
+SUBJECT_ID_PREFIX = 'SUBJ-'
+SUBJECT_ID_ALPHABET = '0123456789ABCDEF'
+SUBJECT_ID_LENGTH = 8
+
+# Parsed workbooks are cached in this directory when it is set (see sheet_cache_dir)
+SHEET_CACHE_ENV = 'SHEET_CACHE_DIR'
+# Bump whenever a change to how workbooks are read changes the cached DataFrames
+SHEET_CACHE_VERSION = 1
+
+def sheet_cache_dir():
+    """
+    The directory parsed workbooks are cached in: a subdirectory of
+    $SHEET_CACHE_DIR, or None (no caching) when that is not set. The cached
+    sheets hold the same identifiers as the raw files.
+    """
+    directory = os.environ.get(SHEET_CACHE_ENV)
+    return Path(directory) / 'deidentification_tool' if directory else None
+
+def file_digest(path):
+    """SHA-256 of a file's content, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def is_private(directory):
+    """True when `directory` exists, belongs to the current user and no one else can write to it."""
+    try:
+        info = Path(directory).stat()
+    except OSError:
+        return False
+    if not hasattr(os, 'getuid'):
+        # No POSIX ownership to check (Windows)
+        return True
+    return info.st_uid == os.getuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+def load_cached_sheets(cache_dir, digest):
+    """
+    Returns the cached {sheet name: DataFrame} of a workbook, or None. The
+    cache holds pickles, so a directory others can write to is never read.
+    """
+    if not is_private(cache_dir):
+        return None
+    try:
+        return pd.read_pickle(Path(cache_dir) / f"{digest}-v{SHEET_CACHE_VERSION}.pkl")
+    except Exception:
+        return None
+
+def store_cached_sheets(cache_dir, digest, sheets):
+    """Caches a workbook's sheets, creating the cache directory private to the current user."""
+    cache_dir = Path(cache_dir)
+    partial = cache_dir / f".{digest}.{uuid.uuid4().hex}"
+    try:
+        cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if not is_private(cache_dir):
+            return
+        pd.to_pickle(sheets, partial)
+        os.replace(partial, cache_dir / f"{digest}-v{SHEET_CACHE_VERSION}.pkl")
+    except OSError:
+        partial.unlink(missing_ok=True)
+
+def load_all_sheets_from_files(file_paths, cache_dir=None):
     """
     Loads all sheets from a list of Excel files into a single dictionary.
+
+    With a `cache_dir` (see sheet_cache_dir), files parsed by an earlier run
+    are read from the cache instead.
     """
     all_dfs = {}
     for path in file_paths:
         try:
-            sheets_dict = pd.read_excel(path, sheet_name=None)
+            digest = file_digest(path) if cache_dir else None
+            sheets_dict = load_cached_sheets(cache_dir, digest) if cache_dir else None
+            if sheets_dict is None:
+                sheets_dict = pd.read_excel(path, sheet_name=None)
+                if cache_dir:
+                    store_cached_sheets(cache_dir, digest, sheets_dict)
             for sheet_name, df in sheets_dict.items():
                 source_key = f"{os.path.basename(path)}|{sheet_name}"
                 all_dfs[source_key] = df
@@ -29,28 +106,91 @@ def load_all_sheets_from_files(file_paths):
             print(f"Could not read or process file: {path}. Error: {e}")
     return all_dfs
 
-def create_identifier_linkage_key(dataframes_dict):
+class DisjointSet:
+    """
+    Union-find over integer element codes, with path compression and union by rank.
+    """
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.rank = [0] * size
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression: point every node on the walk directly at the root
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return
+        if self.rank[root_a] < self.rank[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        if self.rank[root_a] == self.rank[root_b]:
+            self.rank[root_a] += 1
+
+    def roots(self):
+        return [self.find(x) for x in range(len(self.parent))]
+
+def allocate_subject_ids(count, existing_ids=None, seed=None):
+    """
+    Mints `count` unique random subject IDs, avoiding `existing_ids`. Pass
+    `seed` for a reproducible sequence; otherwise the operating system's
+    random source is used.
+    """
+    taken = set(existing_ids or ())
+    if count > len(SUBJECT_ID_ALPHABET) ** SUBJECT_ID_LENGTH - len(taken):
+        raise ValueError(f"Cannot mint {count} more unique subject IDs.")
+    rng = random.SystemRandom() if seed is None else random.Random(seed)
+    new_ids = []
+    while len(new_ids) < count:
+        candidate = SUBJECT_ID_PREFIX + ''.join(rng.choices(SUBJECT_ID_ALPHABET, k=SUBJECT_ID_LENGTH))
+        if candidate not in taken:
+            taken.add(candidate)
+            new_ids.append(candidate)
+    return new_ids
+
+def create_identifier_linkage_key(dataframes_dict, existing_subject_ids=None, seed=None):
     """
     Scans all dataframes to find unique individuals and creates a master
     linkage key mapping all known legacy IDs to a new, random subject_id.
+
+    Subject IDs never collide with each other or with `existing_subject_ids`
+    (e.g. those in a previously issued linkage key); pass `seed` for a
+    reproducible assignment.
+
+    Every identifier value is factorized to an integer code and all identifiers
+    that appear on the same row are unioned, so a row that bridges two
+    previously separate people merges them into one subject.
     """
     print("--- Phase 1: Creating Identifier Linkage Key ---")
     
+    id_cols = ['mrn', 'upn', 'pmid']
     all_identifiers_list = []
+    row_offset = 0
     for source_key, df in dataframes_dict.items():
         df_renamed = df.rename(columns=IDENTIFIER_COLUMN_MAP)
-        id_cols = ['mrn', 'upn', 'pmid']
-        present_id_cols = [col for col in id_cols if col in df_renamed.columns]
-        if not present_id_cols:
+        id_positions = [i for i, col in enumerate(df_renamed.columns) if col in id_cols]
+        if not id_positions:
             continue
             
-        df_ids = df_renamed[present_id_cols].copy()
-        df_ids.dropna(how='all', inplace=True)
-        
-        for col in present_id_cols:
-            df_ids[col] = df_ids[col].astype(str)
-
-        all_identifiers_list.append(df_ids)
+        # Several source columns can map to the same identifier type (e.g. PMID and
+        # Internal_ID), so stack them by position into (row, id_type, id_val) entries.
+        rows = np.arange(row_offset, row_offset + len(df_renamed))
+        row_offset += len(df_renamed)
+        for i in id_positions:
+            df_ids = pd.DataFrame({
+                'row': rows,
+                'id_type': df_renamed.columns[i],
+                'id_val': df_renamed.iloc[:, i].to_numpy(),
+            })
+            df_ids.dropna(subset=['id_val'], inplace=True)
+            df_ids['id_val'] = df_ids['id_val'].astype(str)
+            all_identifiers_list.append(df_ids)
 
     if not all_identifiers_list:
         print("No identifiers found. Exiting.")
@@ -59,50 +199,39 @@ def create_identifier_linkage_key(dataframes_dict):
     master_ids_df = pd.concat(all_identifiers_list, ignore_index=True)
     master_ids_df.drop_duplicates(inplace=True)
 
-    id_to_person_map = {}
-    person_data = []
-    
-    for _, row in master_ids_df.iterrows():
-        ids_in_row = {col: val for col, val in row.items() if pd.notna(val)}
-        found_person_idx = None
-        
-        for id_type, id_val in ids_in_row.items():
-            if id_val in id_to_person_map:
-                found_person_idx = id_to_person_map[id_val]
-                break
-        
-        if found_person_idx is not None:
-            for id_type, id_val in ids_in_row.items():
-                person_data[found_person_idx][id_type].add(id_val)
-                id_to_person_map[id_val] = found_person_idx
-        else:
-            new_person_idx = len(person_data)
-            new_person = {'mrn': set(), 'upn': set(), 'pmid': set()}
-            for id_type, id_val in ids_in_row.items():
-                new_person[id_type].add(id_val)
-                id_to_person_map[id_val] = new_person_idx
-            person_data.append(new_person)
-
-    linkage_key_records = []
-    for person in person_data:
-        new_subject_id = f"SUBJ-{str(uuid.uuid4())[:8].upper()}"
-        record = {
-            'subject_id': new_subject_id,
-            'mrn': ';'.join(sorted(list(person['mrn']))),
-            'upn': ';'.join(sorted(list(person['upn']))),
-            'pmid': ';'.join(sorted(list(person['pmid'])))
-        }
-        linkage_key_records.append(record)
-        
-    linkage_key_df = pd.DataFrame(linkage_key_records)
+    # Integer-code every identifier value
+    id_codes, id_values = pd.factorize(master_ids_df['id_val'])
+    row_codes = master_ids_df['row'].to_numpy()
+
+    # Link each identifier to the first identifier seen on the same row
+    first_code_per_row = pd.Series(id_codes).groupby(row_codes).transform('first').to_numpy()
+    edges = {(a, b) for a, b in zip(id_codes.tolist(), first_code_per_row.tolist()) if a != b}
+
+    persons = DisjointSet(len(id_values))
+    for a, b in edges:
+        persons.union(a, b)
+    roots = pd.Series(persons.roots())
+
+    master_ids_df['person'] = roots.to_numpy()[id_codes]
+    person_ids = (
+        master_ids_df[['person', 'id_type', 'id_val']]
+        .drop_duplicates()
+        .sort_values('id_val')
+        .groupby(['person', 'id_type'], sort=False)['id_val']
+        .agg(';'.join)
+        .unstack(fill_value='')
+        .reindex(columns=id_cols, fill_value='')
+    )
+    # Keep people in order of first appearance
+    person_ids = person_ids.loc[pd.unique(roots.to_numpy())]
+    person_ids.columns.name = None
+
+    new_subject_ids = allocate_subject_ids(len(person_ids), existing_subject_ids, seed)
+    linkage_key_df = person_ids.reset_index(drop=True)
+    linkage_key_df.insert(0, 'subject_id', new_subject_ids)
 
-    legacy_to_new_id_map = {}
-    for _, row in linkage_key_df.iterrows():
-        new_id = row['subject_id']
-        for id_type in ['mrn', 'upn', 'pmid']:
-            for legacy_id in row[id_type].split(';'):
-                if legacy_id:
-                    legacy_to_new_id_map[legacy_id] = new_id
+    subject_by_person = pd.Series(new_subject_ids, index=person_ids.index)
+    legacy_to_new_id_map = dict(zip(id_values, subject_by_person.loc[roots].to_numpy()))
 
     print("Linkage key created successfully.")
     return linkage_key_df, legacy_to_new_id_map
@@ -127,7 +256,7 @@ def main():
 
     # --- 2. Load and process the selected files ---
     print(f"Processing {len(file_paths)} selected file(s)...")
-    all_dfs_to_process = load_all_sheets_from_files(file_paths)
+    all_dfs_to_process = load_all_sheets_from_files(file_paths, sheet_cache_dir())
 
     # --- 3. Execute Phase 1 ---
     linkage_key, _ = create_identifier_linkage_key(all_dfs_to_process)
@@ -0,0 +1,96 @@
+import contextlib
+import io
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+from .deidentify import SUBJECT_ID_PREFIX, create_identifier_linkage_key, load_all_sheets_from_files
+
+
+def link(dataframes_dict, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return create_identifier_linkage_key(dataframes_dict, **kwargs)
+
+
+class LinkageKeyTestCase(unittest.TestCase):
+    """Identifiers seen together on any row must end up on one subject, and the map must agree with the key."""
+
+    def setUp(self):
+        self.sources = {
+            # PMID and Internal_ID both map to pmid; the same value in both is one ID
+            'clinic.xlsx|Sheet1': pd.DataFrame({
+                'MRN': ['M1', 'M2'],
+                'Internal_ID': ['P1', 'P2'],
+                'PMID': ['P1', 'P2b'],
+            }),
+            'lab.xlsx|Sheet1': pd.DataFrame({
+                'UPN': ['U1', 'U3', 'U9'],
+                'patient_id': ['P1', 'P3', None],
+            }),
+            # M2 -- U3 joins the M2 and U3/P3 people; P3 -- M4 then pulls M4 in as well
+            'bridge.xlsx|Sheet1': pd.DataFrame({
+                'MRN': ['M2', 'M4'],
+                'UPN': ['U3', None],
+                'PMID': [None, 'P3'],
+            }),
+        }
+
+    def test_bridging_rows_merge_people_transitively(self):
+        linkage_key, _ = link(self.sources, seed=1)
+        self.assertEqual(list(linkage_key.columns), ['subject_id', 'mrn', 'upn', 'pmid'])
+        self.assertEqual(
+            linkage_key[['mrn', 'upn', 'pmid']].values.tolist(),
+            [
+                ['M1', 'U1', 'P1'],
+                ['M2;M4', 'U3', 'P2;P2b;P3'],
+                ['', 'U9', ''],
+            ],
+        )
+
+    def test_map_agrees_with_key(self):
+        linkage_key, legacy_to_new_id_map = link(self.sources, seed=1)
+        expected = {}
+        for row in linkage_key.itertuples():
+            for column in ('mrn', 'upn', 'pmid'):
+                for legacy_id in filter(None, getattr(row, column).split(';')):
+                    self.assertNotIn(legacy_id, expected)
+                    expected[legacy_id] = row.subject_id
+        self.assertEqual(legacy_to_new_id_map, expected)
+
+    def test_subject_ids_are_unique_and_avoid_existing(self):
+        linkage_key, _ = link(self.sources, seed=1)
+        existing = set(linkage_key['subject_id'])
+        reissued, _ = link(self.sources, existing_subject_ids=existing, seed=1)
+        self.assertTrue(linkage_key['subject_id'].is_unique)
+        self.assertTrue(all(s.startswith(SUBJECT_ID_PREFIX) for s in reissued['subject_id']))
+        self.assertFalse(existing & set(reissued['subject_id']))
+
+    def test_no_identifier_columns(self):
+        self.assertEqual(link({'notes.xlsx|Sheet1': pd.DataFrame({'comment': ['x']})}), (None, None))
+
+
+class SheetCacheTestCase(unittest.TestCase):
+    """Workbooks are parsed once per content when a cache directory is given, and the directory is private."""
+
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.path = self.workdir / 'clinic.xlsx'
+        pd.DataFrame({'MRN': ['M1'], 'UPN': ['U1']}).to_excel(self.path, sheet_name='Samples', index=False)
+
+    def test_second_read_hits_cache(self):
+        cache_dir = self.workdir / 'cache'
+        first = load_all_sheets_from_files([self.path], cache_dir)
+        self.assertEqual(cache_dir.stat().st_mode & 0o777, 0o700)
+        with mock.patch('pandas.read_excel', side_effect=AssertionError('parsed again')):
+            second = load_all_sheets_from_files([self.path], cache_dir)
+        self.assertEqual(list(second), ['clinic.xlsx|Samples'])
+        pd.testing.assert_frame_equal(second['clinic.xlsx|Samples'], first['clinic.xlsx|Samples'])
+
+    def test_no_cache_without_directory(self):
+        load_all_sheets_from_files([self.path])
+        self.assertEqual(sorted(path.name for path in self.workdir.iterdir()), ['clinic.xlsx'])
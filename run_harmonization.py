@@ -1,50 +1,105 @@
+import argparse
 import pandas as pd
 from pathlib import Path
 
 # Import the necessary functions from our new packages
-from sample_importer.readers import load_all_sheets_from_files
-from sample_importer.harmonizers import create_harmonized_sample_list
+from sample_importer.readers import DEFAULT_CHUNK_ROWS, iter_source_chunks, load_all_sheets_from_files
+from sample_importer.harmonizers import HARMONIZED_COLUMNS, harmonize_chunks
+from sample_importer.cache import file_digest
+from sample_importer.incremental import harmonize_incrementally
+from sample_importer.linkage import LinkageIndex, linkage_pairs
 
 # --- Configuration ---
 # Define the location of the sensitive linkage key file.
 # This file is generated by the `deidentification_tool`.
 LINKAGE_KEY_PATH = Path(__file__).parent / 'SECURE_linkage_key.csv'
 
+# Memory-mapped lookup built from the linkage key; it holds the legacy IDs too.
+LINKAGE_INDEX_DIR = Path(__file__).parent / 'SECURE_linkage_index'
+
 # Define the output path for the final, de-identified data.
 OUTPUT_TSV_PATH = Path(__file__).parent / 'harmonized_deidentified_samples.tsv'
 
-def create_lookup_from_linkage_key(key_path):
+# Per-source fingerprints of the last run, for incremental runs.
+MANIFEST_PATH = Path(__file__).parent / 'harmonization_manifest.json'
+
+def create_lookup_from_linkage_key(key_path, index_dir=None):
     """
     Loads the sensitive linkage key and creates a lookup map from any legacy ID
     to the new, random subject_id.
+
+    With `index_dir`, the lookup is persisted there as a memory-mapped
+    LinkageIndex and later runs load it instantly instead of re-reading the
+    key; it is rebuilt whenever the key file changes. Without it, a dict is
+    returned.
     """
     if not key_path.exists():
         print(f"Error: Linkage key file not found at {key_path}")
         print("Please run the deidentification_tool first to generate it.")
         return None
 
+    if index_dir is not None:
+        key_digest = file_digest(key_path)
+        index = LinkageIndex.load(index_dir, key_digest)
+        if index is not None:
+            print(f"ID lookup index loaded from {index_dir} ({len(index)} legacy IDs).")
+            return index
+
     print(f"Loading linkage key from {key_path}...")
     # Explicitly read identifier columns as strings to avoid type mismatches (e.g., '123' vs '123.0')
     linkage_df = pd.read_csv(key_path, dtype={'mrn': str, 'upn': str, 'pmid': str})
-    
-    legacy_to_new_id_map = {}
-    for _, row in linkage_df.iterrows():
-        new_id = row['subject_id']
-        for id_type in ['mrn', 'upn', 'pmid']:
-            # Handle cases where a person might not have all ID types
-            if pd.notna(row[id_type]):
-                for legacy_id in str(row[id_type]).split(';'):
-                    if legacy_id:
-                        legacy_to_new_id_map[legacy_id] = new_id
+    pairs = linkage_pairs(linkage_df)
+
+    if index_dir is not None:
+        try:
+            LinkageIndex.from_pairs(pairs).save(index_dir, key_digest)
+        except OSError as e:
+            print(f"Warning: could not save the ID lookup index to {index_dir}: {e}")
+        else:
+            print(f"ID lookup index saved to {index_dir}.")
+            return LinkageIndex.load(index_dir, key_digest)
+
     print("ID lookup map created.")
-    return legacy_to_new_id_map
+    return dict(zip(pairs['legacy_id'], pairs['subject_id']))
+
+def harmonize_files(file_paths, id_lookup, output_path, manifest_path=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Streams CSV, TSV and Excel sources through harmonization into a TSV,
+    `chunk_rows` rows at a time, so memory stays bounded however large the
+    sources are. Returns the number of harmonized rows written.
+
+    When `output_path` is also the output of incremental runs, pass their
+    `manifest_path`: it no longer describes the rewritten TSV, so it is
+    removed and the next incremental run starts from scratch.
+    """
+    print("\n--- Phase 2: Creating De-identified Sample List (streaming) ---")
+    if manifest_path is not None:
+        # Before writing, so an interrupted rewrite never leaves a manifest behind either
+        Path(manifest_path).unlink(missing_ok=True)
+    rows_written = 0
+    with open(output_path, 'w', newline='') as output:
+        for chunk in harmonize_chunks(iter_source_chunks(file_paths, chunk_rows), id_lookup):
+            chunk.to_csv(output, sep='\t', index=False, header=rows_written == 0)
+            rows_written += len(chunk)
+        if not rows_written:
+            output.write('\t'.join(HARMONIZED_COLUMNS) + '\n')
+    print(f"{rows_written} de-identified samples written to {output_path}.")
+    return rows_written
 
 def main():
     """
     Main function to execute the harmonization process.
+
+    By default only sources that are new or changed since the last run are
+    harmonized and merged into the existing output (see
+    sample_importer.incremental); --full rebuilds it from scratch.
     """
+    parser = argparse.ArgumentParser(description="Harmonize and de-identify legacy sample sheets.")
+    parser.add_argument('--full', action='store_true', help="Re-harmonize every source and rewrite the output")
+    args = parser.parse_args()
+
     # --- 1. Create the ID lookup map ---
-    id_lookup = create_lookup_from_linkage_key(LINKAGE_KEY_PATH)
+    id_lookup = create_lookup_from_linkage_key(LINKAGE_KEY_PATH, LINKAGE_INDEX_DIR)
     if id_lookup is None:
         return # Stop if the linkage key wasn't found
 
@@ -53,6 +108,8 @@ def main():
     # In a real scenario, you would provide the paths to your actual data files.
     # file_paths = ["path/to/data/project_A.xlsx", "path/to/data/project_B.xlsx"]
     # all_dfs_raw = load_all_sheets_from_files(file_paths)
+    # For sources too large to load whole (e.g. multi-GB CSV/TSV manifests), stream them instead:
+    # harmonize_files(file_paths, id_lookup, OUTPUT_TSV_PATH, MANIFEST_PATH)
     data_a = {'MRN': ['11223344', '11223344', '55667788'], 'Internal_ID': ['PMID-01', 'PMID-01', 'PMID-02'], 'Collection Date': ['10/05/2024', '11/15/2024', '10/08/2024'], 'Sample Type': ['Stool', 'Skin', 'stool'], 'FASTQ': ['p01_s1.fq.gz', 'p01_s2.fq.gz', 'p02_s1.fq.gz']}
     df_a = pd.DataFrame(data_a)
     data_b = {'UPN': ['UPN_A5', 'UPN_B9', 'UPN_B9'], 'PMID': ['PMID-03', 'PMID-04', 'PMID-04'], 'collection_dt': pd.to_datetime(['2023-11-01', '2023-11-02', '2023-12-01']), 'source': ['oral', 'stool', 'stool'], 'sequence_file': ['p03_s1.fq.gz', 'p04_s1.fq.gz', 'p04_s2.fq.gz'], 'Project': ['IBD_Cohort', 'IBD_Cohort', 'IBD_Cohort']}
@@ -65,15 +122,11 @@ def main():
         'collab_lab_B.xlsx|2024_Samples': df_c,
     }
 
-    # --- 3. Execute Phase 2 (Harmonization) ---
-    harmonized_samples = create_harmonized_sample_list(all_dfs_raw, id_lookup)
-    
-    # --- 4. Save the final de-identified data ---
-    if harmonized_samples is not None:
-        harmonized_samples.to_csv(OUTPUT_TSV_PATH, sep='\t', index=False)
+    # --- 3. Execute Phase 2 (Harmonization) and save the de-identified data ---
+    summary = harmonize_incrementally(all_dfs_raw, id_lookup, OUTPUT_TSV_PATH, MANIFEST_PATH, full=args.full)
+    if summary['rows']:
         print(f"\n--- Harmonized Samples Output (`{OUTPUT_TSV_PATH}`) ---")
         print("This file is de-identified and ready for analysis and database import.")
-        print(harmonized_samples)
 
 if __name__ == "__main__":
     main()
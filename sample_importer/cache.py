@@ -0,0 +1,148 @@
+"""
+On-disk cache of parsed spreadsheets.
+
+Parsing Excel is by far the slowest step of harmonization, and most source
+files do not change between runs. Parsed sheets are stored under the SHA-256
+of the file's content and READER_VERSION, so an unchanged file is never
+parsed twice (wherever it is moved or however it is renamed), while any edit
+to it, or a change to how files are read, misses the cache.
+
+Each cached workbook is a directory holding one file per sheet and a
+manifest listing the sheet names in order. Sheets are stored as Feather when
+pyarrow is installed, and pickled otherwise or when Feather cannot represent
+them (e.g. non-string column names or mixed-type columns).
+
+The cached sheets contain whatever the source files contain, identifiers
+included, so nothing is cached unless a directory is named for it: pass a
+SheetCache explicitly, or set SHEET_CACHE_DIR (see cache_from_environment),
+on the same protected storage as the raw data. Loading a pickle can run
+code, so the cache directory is created private to its owner, and a
+directory that other users can write to is never read from or written to.
+"""
+import hashlib
+import json
+import os
+import shutil
+import stat
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Bump whenever a change to the readers changes the DataFrames they produce
+READER_VERSION = 1
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def cache_from_environment():
+    """
+    Returns a SheetCache in the SHEET_CACHE_DIR directory, or None when the
+    variable is not set.
+    """
+    directory = os.environ.get('SHEET_CACHE_DIR')
+    return SheetCache(directory) if directory else None
+
+
+def file_digest(path):
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_private(directory):
+    """True when `directory` exists, belongs to the current user and no one else can write to it."""
+    try:
+        info = Path(directory).stat()
+    except OSError:
+        return False
+    if not hasattr(os, 'getuid'):
+        # No POSIX ownership to check (Windows)
+        return True
+    return info.st_uid == os.getuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _write_sheet(df, path):
+    """Writes one sheet as Feather if possible, else as a pickle; returns the filename."""
+    if HAS_PYARROW:
+        try:
+            df.reset_index(drop=True).to_feather(path.with_suffix('.feather'))
+            return path.with_suffix('.feather').name
+        except Exception:
+            path.with_suffix('.feather').unlink(missing_ok=True)
+    df.to_pickle(path.with_suffix('.pkl'))
+    return path.with_suffix('.pkl').name
+
+
+def _read_sheet(path):
+    if path.suffix == '.feather':
+        return pd.read_feather(path)
+    return pd.read_pickle(path)
+
+
+class SheetCache:
+    """
+    Parsed sheets of workbooks, keyed by content hash and reader version.
+    """
+
+    def __init__(self, directory, version=READER_VERSION):
+        self.directory = Path(directory)
+        self.version = version
+
+    def entry(self, digest):
+        return self.directory / f"{digest}-v{self.version}"
+
+    def load(self, digest):
+        """
+        Returns the cached {sheet name: DataFrame} for a content digest, or
+        None when it is not cached (or the entry is unreadable, or the cache
+        directory is not private).
+        """
+        if not is_private(self.directory):
+            return None
+        entry = self.entry(digest)
+        try:
+            manifest = json.loads((entry / 'manifest.json').read_text())
+            return {sheet['name']: _read_sheet(entry / sheet['file']) for sheet in manifest['sheets']}
+        except Exception:
+            # Missing, half-deleted or undecodable entries count as a miss
+            return None
+
+    def store(self, digest, sheets):
+        """
+        Caches {sheet name: DataFrame} for a content digest. The entry is
+        written under a temporary name and renamed into place, so concurrent
+        readers never see half an entry. Nothing is stored in a directory
+        other users can write to.
+        """
+        entry = self.entry(digest)
+        if entry.exists():
+            return
+        partial = self.directory / f".{entry.name}.{uuid.uuid4().hex}"
+        try:
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            if not is_private(self.directory):
+                return
+            partial.mkdir()
+            manifest = [
+                {'name': name, 'file': _write_sheet(df, partial / str(number))}
+                for number, (name, df) in enumerate(sheets.items())
+            ]
+            (partial / 'manifest.json').write_text(json.dumps({'sheets': manifest}))
+            partial.rename(entry)
+        except OSError:
+            # Another process stored the same file first, or the cache is not writable
+            shutil.rmtree(partial, ignore_errors=True)
+
+    def clear(self):
+        """Removes every cached workbook."""
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -35,6 +35,55 @@ SAMPLE_SOURCE_VOCAB = {
     'other': 'Other',
 }
 
+# Columns of the harmonized sample list, in output order
+HARMONIZED_COLUMNS = [
+    'barcode', 'subject_id', 'collection_date', 'sample_source',
+    'sequence_filename', 'project_name', 'source_file'
+]
+
+def lookup_subject_ids(legacy_ids, id_lookup_map):
+    """
+    Maps a Series of legacy IDs to subject IDs with a dict or a
+    linkage.LinkageIndex (anything with a vectorized `lookup` method).
+    """
+    if hasattr(id_lookup_map, 'lookup'):
+        return id_lookup_map.lookup(legacy_ids)
+    return legacy_ids.map(id_lookup_map)
+
+def harmonize_dataframe(source_key, df_raw, id_lookup_map):
+    """
+    Harmonizes one source DataFrame (a whole sheet or a chunk of one).
+
+    Returns the harmonized rows, or None if the source has no identifier column.
+    """
+    df = df_raw.copy()
+
+    df.rename(columns={**IDENTIFIER_COLUMN_MAP, **SAMPLE_COLUMN_MAP}, inplace=True)
+
+    if 'mrn' in df.columns:
+        df['legacy_id'] = df['mrn'].astype(str)
+    elif 'upn' in df.columns:
+        df['legacy_id'] = df['upn'].astype(str)
+    elif 'pmid' in df.columns:
+        df['legacy_id'] = df['pmid'].astype(str)
+    else:
+        return None
+
+    df['subject_id'] = lookup_subject_ids(df['legacy_id'], id_lookup_map)
+
+    df['collection_date'] = pd.to_datetime(df['collection_date'], errors='coerce')
+    # As text first: a chunk whose sample types are all blank is read as float
+    df['sample_source'] = df['sample_source'].astype('string').str.lower().map(SAMPLE_SOURCE_VOCAB).fillna('Other')
+
+    # Create unique barcode (harmonized name for sample_id)
+    date_str = df['collection_date'].dt.strftime('%Y-%m-%d')
+    df['barcode'] = df['subject_id'].astype(str) + '_' + date_str + '_' + df['sample_source'].astype(str)
+
+    df['source_file'] = source_key
+
+    cols_to_keep = [col for col in HARMONIZED_COLUMNS if col in df.columns]
+    return df[cols_to_keep]
+
 def create_harmonized_sample_list(dataframes_dict, id_lookup_map):
     """
     Processes all dataframes, using the linkage key to replace legacy IDs
@@ -44,39 +93,11 @@ def create_harmonized_sample_list(dataframes_dict, id_lookup_map):
 
     cleaned_dfs = []
     for source_key, df_raw in dataframes_dict.items():
-        df = df_raw.copy()
-        
-        df.rename(columns={**IDENTIFIER_COLUMN_MAP, **SAMPLE_COLUMN_MAP}, inplace=True)
-
-        if 'mrn' in df.columns:
-            df['legacy_id'] = df['mrn'].astype(str)
-        elif 'upn' in df.columns:
-            df['legacy_id'] = df['upn'].astype(str)
-        elif 'pmid' in df.columns:
-            df['legacy_id'] = df['pmid'].astype(str)
-        else:
+        df_cleaned = harmonize_dataframe(source_key, df_raw, id_lookup_map)
+        if df_cleaned is None:
             print(f"Skipping source '{source_key}' as no identifiable column was found.")
             continue
 
-        df['subject_id'] = df['legacy_id'].map(id_lookup_map)
-
-        df['collection_date'] = pd.to_datetime(df['collection_date'], errors='coerce')
-        df['sample_source'] = df['sample_source'].str.lower().map(SAMPLE_SOURCE_VOCAB).fillna('Other')
-        
-        # Create unique barcode (harmonized name for sample_id)
-        date_str = df['collection_date'].dt.strftime('%Y-%m-%d')
-        df['barcode'] = df['subject_id'].astype(str) + '_' + date_str + '_' + df['sample_source'].astype(str)
-        
-        df['source_file'] = source_key
-
-        final_columns = [
-            'barcode', 'subject_id', 'collection_date', 'sample_source',
-            'sequence_filename', 'project_name', 'source_file'
-        ]
-        
-        cols_to_keep = [col for col in final_columns if col in df.columns]
-        df_cleaned = df[cols_to_keep]
-
         cleaned_dfs.append(df_cleaned)
 
     if not cleaned_dfs:
@@ -87,4 +108,30 @@ def create_harmonized_sample_list(dataframes_dict, id_lookup_map):
     master_df.drop_duplicates(subset=['barcode'], keep='first', inplace=True)
     
     print("De-identified sample list created successfully.")
-    return master_df
\ No newline at end of file
+    return master_df
+
+def harmonize_chunks(chunks, id_lookup_map):
+    """
+    Harmonizes a stream of (source_key, DataFrame) chunks, such as
+    readers.iter_source_chunks produces, one chunk at a time.
+
+    Yields harmonized chunks with every column of HARMONIZED_COLUMNS. A
+    barcode is only yielded the first time it is seen, as in
+    create_harmonized_sample_list; only the set of barcodes is kept, so
+    memory does not grow with the size of the rows.
+    """
+    seen_barcodes = set()
+    skipped_sources = set()
+    for source_key, df_raw in chunks:
+        df_cleaned = harmonize_dataframe(source_key, df_raw, id_lookup_map)
+        if df_cleaned is None:
+            if source_key not in skipped_sources:
+                skipped_sources.add(source_key)
+                print(f"Skipping source '{source_key}' as no identifiable column was found.")
+            continue
+
+        df_cleaned = df_cleaned.drop_duplicates(subset=['barcode'], keep='first')
+        df_cleaned = df_cleaned[~df_cleaned['barcode'].isin(seen_barcodes)]
+        seen_barcodes.update(df_cleaned['barcode'])
+        if len(df_cleaned):
+            yield df_cleaned.reindex(columns=HARMONIZED_COLUMNS)
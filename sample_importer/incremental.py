@@ -0,0 +1,174 @@
+"""
+Incremental harmonization.
+
+A manifest next to the harmonized TSV records, for every source sheet
+('file|sheet'), a fingerprint of its content and its row counts, plus a
+fingerprint of the harmonization settings (column maps, vocabulary and ID
+lookup). A run then only harmonizes the sources that are new or whose
+content changed:
+
+- rows of new sources are appended to the TSV when none of their barcodes
+  is in it yet;
+- otherwise the TSV is rewritten with barcode-level deduplication in source
+  order, as a full run does, taking the rows of unchanged sources from the
+  TSV where that gives the same result.
+
+Sources missing from a run are left in the dataset (their rows win over
+the others'), so a daily run can be given only the new files. When the
+settings change, or the TSV or manifest is missing, everything given is
+harmonized from scratch.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from .harmonizers import (
+    HARMONIZED_COLUMNS, IDENTIFIER_COLUMN_MAP, SAMPLE_COLUMN_MAP, SAMPLE_SOURCE_VOCAB, harmonize_dataframe,
+)
+from .linkage import lookup_fingerprint
+
+MANIFEST_VERSION = 2
+
+
+def source_fingerprint(df):
+    """Returns a SHA-256 fingerprint of a DataFrame's column names and values."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(col) for col in df.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def settings_fingerprint(id_lookup_map):
+    """Returns a fingerprint of everything besides the sources that shapes the output."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(
+        [IDENTIFIER_COLUMN_MAP, SAMPLE_COLUMN_MAP, SAMPLE_SOURCE_VOCAB, HARMONIZED_COLUMNS], sort_keys=True,
+    ).encode())
+    digest.update(lookup_fingerprint(id_lookup_map).encode())
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def _write_atomically(path, write):
+    partial = path.with_name(path.name + '.part')
+    write(partial)
+    os.replace(partial, path)
+
+
+def _harmonized_rows(source_key, df_raw, id_lookup_map):
+    df = harmonize_dataframe(source_key, df_raw, id_lookup_map)
+    if df is None:
+        print(f"Skipping source '{source_key}' as no identifiable column was found.")
+        return None
+    df = df.reindex(columns=HARMONIZED_COLUMNS)
+    # Match the dates as a full run writes them to the TSV
+    df['collection_date'] = df['collection_date'].dt.strftime('%Y-%m-%d')
+    df = df.astype(str).where(df.notna(), '')
+    # A source's own repeated barcodes never reach the dataset
+    return df.drop_duplicates(subset=['barcode'], keep='first')
+
+
+def _read_dataset(output_path, **kwargs):
+    return pd.read_csv(output_path, sep='\t', dtype=str, keep_default_na=False, **kwargs)
+
+
+def harmonize_incrementally(dataframes_dict, id_lookup_map, output_path, manifest_path, full=False):
+    """
+    Brings the harmonized TSV at `output_path` up to date with `dataframes_dict`
+    ({'file|sheet': DataFrame}), harmonizing only new or changed sources.
+    `full=True` rebuilds the dataset from the given sources.
+
+    The result is the dataset a full run over the same sources gives. For
+    that, the manifest records how many of each source's barcodes were
+    taken by another source: such a source is harmonized again whenever the
+    dataset is merged, as a changed source may have given those barcodes up.
+
+    Returns a summary dict: the new, changed and unchanged source keys and
+    the number of rows in the dataset.
+    """
+    print("\n--- Phase 2: Updating De-identified Sample List (incremental) ---")
+    settings = settings_fingerprint(id_lookup_map)
+    manifest = None if full else load_manifest(manifest_path)
+    if manifest is None or manifest['settings'] != settings or not output_path.exists():
+        manifest = {'version': MANIFEST_VERSION, 'settings': settings, 'sources': {}}
+        rebuild = True
+    else:
+        rebuild = False
+
+    fingerprints = {key: source_fingerprint(df) for key, df in dataframes_dict.items()}
+    known = manifest['sources']
+    new = [key for key in dataframes_dict if key not in known]
+    changed = [key for key in dataframes_dict if key in known and known[key]['fingerprint'] != fingerprints[key]]
+    unchanged = {key for key in dataframes_dict if key not in new and key not in changed}
+
+    harmonized = {}
+
+    def harmonize(key):
+        df = _harmonized_rows(key, dataframes_dict[key], id_lookup_map)
+        harmonized[key] = df
+        known[key] = {
+            'fingerprint': fingerprints[key],
+            'rows': len(dataframes_dict[key]),
+            'harmonized_rows': 0 if df is None else len(df),
+            'shadowed_rows': 0,
+            'harmonized_at': datetime.now().isoformat(timespec='seconds'),
+        }
+
+    for key in dataframes_dict:
+        if key not in unchanged:
+            harmonize(key)
+    fresh = [df for df in harmonized.values() if df is not None]
+    fresh = pd.concat(fresh, ignore_index=True) if fresh else pd.DataFrame(columns=HARMONIZED_COLUMNS)
+    fresh = fresh.drop_duplicates(subset=['barcode'], keep='first')
+
+    existing_barcodes = None
+    if not rebuild and not changed and new:
+        existing_barcodes = _read_dataset(output_path, usecols=['barcode'])['barcode']
+
+    if not rebuild and not new and not changed:
+        dataset_rows = manifest['dataset_rows']
+    elif existing_barcodes is not None and not fresh['barcode'].isin(existing_barcodes).any():
+        # Only new sources, and none of their barcodes is in the dataset yet: append them
+        fresh.to_csv(output_path, sep='\t', index=False, header=False, mode='a')
+        dataset_rows = len(existing_barcodes) + len(fresh)
+        kept = fresh['source_file'].value_counts()
+        for key in new:
+            known[key]['shadowed_rows'] = known[key]['harmonized_rows'] - int(kept.get(key, 0))
+    else:
+        # Put the dataset together as a full run would: every given source, in
+        # order, first barcode wins. Unchanged sources that kept all their
+        # barcodes are taken from the dataset, the others are harmonized again.
+        existing = pd.DataFrame(columns=HARMONIZED_COLUMNS) if rebuild else _read_dataset(output_path)
+        for key in dataframes_dict:
+            if key not in harmonized and known[key].get('shadowed_rows'):
+                harmonize(key)
+        # Sources missing from this run keep their rows, ahead of the others
+        frames = [existing[~existing['source_file'].isin(dataframes_dict)]]
+        existing_by_source = dict(tuple(existing.groupby('source_file', sort=False)))
+        for key in dataframes_dict:
+            frames.append(harmonized[key] if key in harmonized else existing_by_source.get(key))
+        frames = [df for df in frames if df is not None]
+        merged = pd.concat(frames, ignore_index=True).drop_duplicates(subset=['barcode'], keep='first')
+        dataset_rows = len(merged)
+        _write_atomically(output_path, lambda path: merged.to_csv(path, sep='\t', index=False))
+        kept = merged['source_file'].value_counts()
+        for key in dataframes_dict:
+            known[key]['shadowed_rows'] = known[key]['harmonized_rows'] - int(kept.get(key, 0))
+
+    manifest['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    manifest['dataset_rows'] = dataset_rows
+    _write_atomically(manifest_path, lambda path: path.write_text(json.dumps(manifest, indent=2)))
+
+    print(f"{len(new)} new, {len(changed)} changed and {len(unchanged)} unchanged sources; "
+          f"{dataset_rows} samples in {output_path}.")
+    return {'new': new, 'changed': changed, 'unchanged': sorted(unchanged), 'rows': dataset_rows}
@@ -0,0 +1,167 @@
+"""
+Legacy ID -> subject ID lookups built from the linkage key.
+
+linkage_pairs() turns the linkage key (one row per person, with
+';'-separated legacy IDs in the mrn, upn and pmid columns) into one
+(legacy_id, subject_id) row per legacy ID with vectorized pandas
+operations.
+
+LinkageIndex persists those pairs as numpy arrays sorted by legacy ID: the
+UTF-8 encoded IDs, the code of each one's subject and the distinct subject
+IDs. Loading memory-maps the arrays, so it takes milliseconds however large
+the key is, and lookups are a binary search over the whole column at once.
+The index records the digest of the linkage key it was built from and is
+rebuilt when the key changes. It holds the legacy identifiers, so it is
+written to a directory only the current user can access, like the sheet
+cache, and an index in a directory others can write to is never loaded.
+"""
+import hashlib
+import json
+import shutil
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .cache import is_private
+
+LINKAGE_ID_COLUMNS = ['mrn', 'upn', 'pmid']
+
+INDEX_VERSION = 1
+
+
+def linkage_pairs(linkage_df):
+    """
+    Returns a DataFrame of (legacy_id, subject_id) with one row per legacy ID.
+
+    When a legacy ID appears more than once, the last occurrence (by row,
+    then mrn/upn/pmid order) wins.
+    """
+    id_columns = [col for col in LINKAGE_ID_COLUMNS if col in linkage_df.columns]
+    pairs = linkage_df.melt(
+        id_vars=['subject_id'], value_vars=id_columns, value_name='legacy_id', ignore_index=False,
+    )
+    # melt stacks column by column; restore row order, keeping mrn/upn/pmid order within a row
+    pairs = pairs.sort_index(kind='stable').dropna(subset=['legacy_id'])
+    pairs['legacy_id'] = pairs['legacy_id'].astype(str).str.split(';')
+    pairs = pairs.explode('legacy_id')
+    pairs = pairs[pairs['legacy_id'].notna() & (pairs['legacy_id'] != '')]
+    pairs = pairs.drop_duplicates(subset=['legacy_id'], keep='last')
+    return pairs[['legacy_id', 'subject_id']].reset_index(drop=True)
+
+
+def _pairs_fingerprint(legacy_ids, subject_ids):
+    frame = pd.DataFrame({'legacy_id': legacy_ids, 'subject_id': subject_ids}).astype(str)
+    return hashlib.sha256(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def lookup_fingerprint(id_lookup_map):
+    """
+    Returns a fingerprint of a lookup's content, the same for a dict and a
+    LinkageIndex holding the same pairs.
+    """
+    if isinstance(id_lookup_map, LinkageIndex):
+        return id_lookup_map.fingerprint
+    lookup = pd.Series(id_lookup_map, dtype=object)
+    lookup.index = lookup.index.astype(str)
+    lookup = lookup.sort_index()
+    return _pairs_fingerprint(lookup.index.to_numpy(), lookup.to_numpy())
+
+
+def _encode(values):
+    return np.char.encode(np.asarray(values, dtype=str), 'utf-8')
+
+
+class LinkageIndex:
+    """
+    A read-only legacy ID -> subject ID lookup over sorted numpy arrays.
+    """
+
+    def __init__(self, legacy_ids, subject_codes, subjects, fingerprint):
+        self.legacy_ids = legacy_ids
+        self.subject_codes = subject_codes
+        self.subjects = subjects
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Builds an index from the DataFrame returned by linkage_pairs."""
+        pairs = pairs.sort_values('legacy_id', kind='stable')
+        codes, subjects = pd.factorize(pairs['subject_id'].astype(str))
+        return cls(
+            _encode(pairs['legacy_id']),
+            codes.astype(np.int32),
+            np.asarray(subjects, dtype=str),
+            _pairs_fingerprint(pairs['legacy_id'].to_numpy(), pairs['subject_id'].to_numpy()),
+        )
+
+    def save(self, directory, source_digest):
+        """
+        Writes the index to `directory`, replacing any index already there.
+        `source_digest` identifies the linkage key it was built from. The
+        directory is created readable by the current user only.
+        """
+        directory = Path(directory)
+        partial = directory.with_name(f".{directory.name}.{uuid.uuid4().hex}")
+        partial.mkdir(mode=0o700, parents=True)
+        np.save(partial / 'legacy_ids.npy', self.legacy_ids)
+        np.save(partial / 'subject_codes.npy', self.subject_codes)
+        np.save(partial / 'subjects.npy', self.subjects)
+        (partial / 'meta.json').write_text(json.dumps({
+            'version': INDEX_VERSION,
+            'source_digest': source_digest,
+            'fingerprint': self.fingerprint,
+            'entries': len(self),
+        }))
+        shutil.rmtree(directory, ignore_errors=True)
+        partial.rename(directory)
+
+    @classmethod
+    def load(cls, directory, source_digest=None):
+        """
+        Memory-maps the index saved in `directory`. Returns None when there
+        is none, when it was built from a linkage key other than
+        `source_digest`, or when the directory is not private.
+        """
+        directory = Path(directory)
+        if not is_private(directory):
+            return None
+        try:
+            meta = json.loads((directory / 'meta.json').read_text())
+            if meta['version'] != INDEX_VERSION:
+                return None
+            if source_digest is not None and meta['source_digest'] != source_digest:
+                return None
+            return cls(
+                np.load(directory / 'legacy_ids.npy', mmap_mode='r'),
+                np.load(directory / 'subject_codes.npy', mmap_mode='r'),
+                np.load(directory / 'subjects.npy'),
+                meta['fingerprint'],
+            )
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def __len__(self):
+        return len(self.legacy_ids)
+
+    def __contains__(self, legacy_id):
+        return self.get(legacy_id) is not None
+
+    def get(self, legacy_id, default=None):
+        subject_id = self.lookup(pd.Series([legacy_id])).iloc[0]
+        return default if pd.isna(subject_id) else subject_id
+
+    def lookup(self, legacy_ids):
+        """
+        Maps a Series of legacy IDs to subject IDs (NaN where unknown),
+        like Series.map with a dict.
+        """
+        result = np.full(len(legacy_ids), np.nan, dtype=object)
+        if len(self) and len(legacy_ids):
+            queries = _encode(legacy_ids.astype(str))
+            positions = np.minimum(np.searchsorted(self.legacy_ids, queries), len(self) - 1)
+            found = self.legacy_ids[positions] == queries
+            result[found] = self.subjects[self.subject_codes[positions[found]]]
+        # Explicitly object, as Series.map gives: pandas 3 would infer its string dtype
+        return pd.Series(result, index=legacy_ids.index, dtype=object)
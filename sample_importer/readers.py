@@ -1,25 +1,248 @@
-import pandas as pd
 import os
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from .cache import cache_from_environment, file_digest
+
+# Rows per chunk of the streaming readers
+DEFAULT_CHUNK_ROWS = 50000
 
-def load_all_sheets_from_files(file_paths):
+# Delimited text sources, by file extension
+DELIMITERS = {'.csv': ',', '.tsv': '\t', '.txt': '\t'}
+XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+
+# The outcome of reading one workbook: `sheets` maps 'filename|sheetname' to a
+# DataFrame (empty on failure), `error` is None or 'ExceptionType: message',
+# `seconds` is the time spent reading the file and `cached` tells whether it
+# came from the sheet cache instead of being parsed.
+WorkbookResult = namedtuple('WorkbookResult', ['path', 'sheets', 'seconds', 'error', 'cached'], defaults=[False])
+
+
+def _cache_for(cache):
+    """
+    Resolves the `cache` argument of the readers: True (the SHEET_CACHE_DIR
+    cache, if that is set), False/None or a SheetCache.
+    """
+    if cache is True:
+        return cache_from_environment()
+    return cache or None
+
+
+def read_workbook(path, cache=True):
+    """
+    Reads every sheet of one Excel file, never raising.
+
+    Args:
+        path (str): Path to the Excel file.
+        cache (bool or SheetCache): Where to look for the file's parsed sheets
+            before parsing it, and store them after. The sheets hold the raw
+            identifiers, so True only caches when SHEET_CACHE_DIR is set;
+            False parses the file every time.
+
+    Returns:
+        WorkbookResult: The sheets, or the error that prevented reading them.
+    """
+    started = time.perf_counter()
+    cache = _cache_for(cache)
+    try:
+        digest = file_digest(path) if cache else None
+        sheets_dict = cache.load(digest) if cache else None
+        cached = sheets_dict is not None
+        if not cached:
+            # sheet_name=None tells pandas to read all sheets
+            sheets_dict = pd.read_excel(path, sheet_name=None)
+            if cache:
+                cache.store(digest, sheets_dict)
+    except Exception as e:
+        return WorkbookResult(path, {}, time.perf_counter() - started, f"{type(e).__name__}: {e}")
+    # Create a unique key for traceability
+    sheets = {f"{os.path.basename(path)}|{sheet_name}": df for sheet_name, df in sheets_dict.items()}
+    return WorkbookResult(path, sheets, time.perf_counter() - started, None, cached)
+
+
+def iter_workbooks(file_paths, workers=None, cache=True):
+    """
+    Reads Excel files in parallel, yielding each one as soon as it is parsed.
+
+    Parsing with openpyxl is CPU-bound, so files are spread over a pool of
+    processes; results arrive in completion order, not in the order given.
+
+    Args:
+        file_paths (list): A list of string paths to the Excel files.
+        workers (int): Number of worker processes. Defaults to one per CPU
+            (at most one per file); 0 or 1 reads the files in this process.
+        cache (bool or SheetCache): Sheet cache, as for read_workbook.
+
+    Yields:
+        WorkbookResult: One per file, including the files that failed.
+    """
+    file_paths = list(file_paths)
+    cache = _cache_for(cache)
+    if workers is None:
+        workers = min(len(file_paths), os.cpu_count() or 1)
+    if workers <= 1 or len(file_paths) <= 1:
+        for path in file_paths:
+            yield read_workbook(path, cache)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(read_workbook, path, cache): path for path in file_paths}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # The worker itself died (e.g. out of memory)
+                yield WorkbookResult(futures[future], {}, 0.0, f"{type(e).__name__}: {e}")
+
+
+def load_all_sheets_from_files(file_paths, workers=None, cache=True):
     """
     Loads all sheets from a list of Excel files into a single dictionary.
 
     Args:
         file_paths (list): A list of string paths to the Excel files.
+        workers (int): Number of worker processes, as for iter_workbooks.
+        cache (bool or SheetCache): Sheet cache, as for read_workbook.
 
     Returns:
-        dict: A dictionary where keys are 'filename|sheetname' and values are DataFrames.
+        dict: A dictionary where keys are 'filename|sheetname' and values are DataFrames,
+        in the order of `file_paths`.
     """
+    file_paths = list(file_paths)
+    results = {result.path: result for result in iter_workbooks(file_paths, workers, cache)}
     all_dfs = {}
     for path in file_paths:
-        try:
-            # sheet_name=None tells pandas to read all sheets
-            sheets_dict = pd.read_excel(path, sheet_name=None)
-            for sheet_name, df in sheets_dict.items():
-                # Create a unique key for traceability
-                source_key = f"{os.path.basename(path)}|{sheet_name}"
-                all_dfs[source_key] = df
-        except Exception as e:
-            print(f"Could not read or process file: {path}. Error: {e}")
+        result = results[path]
+        if result.error:
+            print(f"Could not read or process file: {path}. Error: {result.error}")
+        all_dfs.update(result.sheets)
     return all_dfs
+
+
+def iter_delimited_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Streams a CSV or TSV file in chunks of rows.
+
+    Every column is read as text (blank cells stay NaN). pandas would
+    otherwise infer dtypes chunk by chunk, so a chunk whose cells in a column
+    happen to be all blank, or to include a blank, would come back as float:
+    an identifier '123' would then read as '123.0' in that chunk only.
+
+    Args:
+        path (str): Path to the file; the extension picks the delimiter.
+        chunk_rows (int): Maximum rows per chunk.
+
+    Yields:
+        tuple: ('filename', DataFrame) for each chunk.
+    """
+    source_key = os.path.basename(path)
+    separator = DELIMITERS.get(os.path.splitext(path)[1].lower(), ',')
+    with pd.read_csv(path, sep=separator, chunksize=chunk_rows, dtype=str) as reader:
+        for chunk in reader:
+            yield source_key, chunk
+
+
+def _column_names(header):
+    """
+    Names the columns of a header row as pandas.read_excel does: blank
+    cells become 'Unnamed: <position>', and a repeated name gets the first
+    of '.1', '.2'... not already in the header.
+    """
+    names = [f"Unnamed: {i}" if name is None else name for i, name in enumerate(header)]
+    unnamed = [i for i, name in enumerate(header) if name is None]
+    counts = defaultdict(int)
+    # Named columns first, so unnamed ones never take a given name
+    for i in [i for i in range(len(names)) if i not in unnamed] + unnamed:
+        name = original = names[i]
+        count = counts[name]
+        while count > 0:
+            counts[original] = count + 1
+            name = f"{original}.{count}"
+            count = count + 1 if name in names else counts[name]
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+
+def _text_frame(rows, columns):
+    """A DataFrame of `rows` with every non-blank cell as str and blank cells as NaN."""
+    frame = pd.DataFrame(rows, columns=columns, dtype=object)
+    return frame.astype(str).where(frame.notna())
+
+
+def iter_xlsx_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Streams every sheet of an .xlsx file in chunks of rows, using openpyxl's
+    read-only mode so the workbook is never loaded into memory whole.
+
+    The first row of each sheet is its header; blank rows are skipped. As in
+    iter_delimited_chunks, every cell is read as text (blank cells are NaN),
+    so no chunk gets a dtype of its own: a number column with a blank cell
+    would otherwise turn an identifier 123 into '123.0' in that chunk only.
+
+    Args:
+        path (str): Path to the Excel file.
+        chunk_rows (int): Maximum rows per chunk.
+
+    Yields:
+        tuple: ('filename|sheetname', DataFrame) for each chunk.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = _column_names(header)
+            width = len(columns)
+            source_key = f"{os.path.basename(path)}|{worksheet.title}"
+            batch = []
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                if len(row) != width:
+                    row = tuple(row[:width]) + (None,) * (width - len(row))
+                batch.append(row)
+                if len(batch) >= chunk_rows:
+                    yield source_key, _text_frame(batch, columns)
+                    batch = []
+            if batch:
+                yield source_key, _text_frame(batch, columns)
+    finally:
+        workbook.close()
+
+
+def iter_source_chunks(file_paths, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Streams CSV, TSV and Excel sources in chunks of at most `chunk_rows`
+    rows, so they can be harmonized in bounded memory (see
+    harmonizers.harmonize_chunks).
+
+    Legacy .xls workbooks cannot be streamed; they are read whole and then
+    split into chunks.
+
+    Args:
+        file_paths (list): A list of string paths to the source files.
+        chunk_rows (int): Maximum rows per chunk.
+
+    Yields:
+        tuple: (source_key, DataFrame) for each chunk, file by file.
+    """
+    for path in file_paths:
+        extension = os.path.splitext(path)[1].lower()
+        if extension in DELIMITERS:
+            yield from iter_delimited_chunks(path, chunk_rows)
+        elif extension in XLSX_EXTENSIONS:
+            yield from iter_xlsx_chunks(path, chunk_rows)
+        else:
+            result = read_workbook(path)
+            if result.error:
+                raise ValueError(f"Could not read or process file: {path}. Error: {result.error}")
+            for source_key, df in result.sheets.items():
+                for start in range(0, len(df), chunk_rows):
+                    yield source_key, df.iloc[start:start + chunk_rows]
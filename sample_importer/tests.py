@@ -0,0 +1,288 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+from openpyxl import Workbook
+
+from .cache import SheetCache, cache_from_environment
+from .harmonizers import create_harmonized_sample_list, harmonize_chunks
+from .incremental import harmonize_incrementally
+from .linkage import LinkageIndex, linkage_pairs
+from .readers import iter_delimited_chunks, iter_xlsx_chunks, read_workbook
+
+ID_LOOKUP = {'1': 'S1', '2': 'S2', '3': 'S3', '4': 'S4'}
+
+
+def sheet(*rows):
+    return pd.DataFrame(list(rows), columns=['MRN', 'Collection Date', 'Sample Type'])
+
+
+class IncrementalHarmonizationTestCase(unittest.TestCase):
+    """An incremental run must leave the same dataset as a full run over the same sources."""
+
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.workdir)
+
+    def harmonize(self, sources, name='incremental', full=False):
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = harmonize_incrementally(
+                sources, ID_LOOKUP, self.workdir / f'{name}.tsv', self.workdir / f'{name}.json', full=full,
+            )
+        dataset = pd.read_csv(self.workdir / f'{name}.tsv', sep='\t', dtype=str, keep_default_na=False)
+        self.assertEqual(summary['rows'], len(dataset))
+        return dataset
+
+    def assertMatchesFullRun(self, sources):
+        incremental = self.harmonize(sources)
+        full = self.harmonize(sources, name='full', full=True)
+        pd.testing.assert_frame_equal(incremental, full)
+        return incremental
+
+    def test_new_source_appended(self):
+        self.harmonize({'a|s': sheet(['1', '2024-01-01', 'Stool'])})
+        dataset = self.assertMatchesFullRun({
+            'a|s': sheet(['1', '2024-01-01', 'Stool']),
+            'b|s': sheet(['2', '2024-01-02', 'Blood']),
+        })
+        self.assertEqual(list(dataset['source_file']), ['a|s', 'b|s'])
+
+    def test_new_source_with_known_barcode(self):
+        self.harmonize({'b|s': sheet(['1', '2024-01-01', 'Stool'])})
+        # 'a|s' comes first, so it wins the barcode in a full run
+        dataset = self.assertMatchesFullRun({
+            'a|s': sheet(['1', '2024-01-01', 'Stool'], ['2', '2024-01-02', 'Blood']),
+            'b|s': sheet(['1', '2024-01-01', 'Stool']),
+        })
+        self.assertEqual(list(dataset['source_file']), ['a|s', 'a|s'])
+
+    def test_changed_source_adds_rows(self):
+        self.harmonize({'a|s': sheet(['1', '2024-01-01', 'Stool']), 'b|s': sheet(['2', '2024-01-02', 'Blood'])})
+        self.assertMatchesFullRun({
+            'a|s': sheet(['1', '2024-01-01', 'Stool'], ['2', '2024-01-02', 'Blood'], ['3', '2024-01-03', 'Blood']),
+            'b|s': sheet(['2', '2024-01-02', 'Blood']),
+        })
+
+    def test_changed_source_removes_shared_barcode(self):
+        b = sheet(['1', '2024-01-01', 'Stool'], ['3', '2024-01-03', 'Blood'])
+        self.harmonize({'a|s': sheet(['1', '2024-01-01', 'Stool'], ['2', '2024-01-02', 'Blood']), 'b|s': b})
+        # 'a|s' gives up the barcode it shared with 'b|s'
+        dataset = self.assertMatchesFullRun({'a|s': sheet(['2', '2024-01-02', 'Blood']), 'b|s': b})
+        self.assertEqual(len(dataset), 3)
+        self.assertEqual(dataset.set_index('barcode').loc['S1_2024-01-01_Stool', 'source_file'], 'b|s')
+
+    def test_changed_source_removes_rows(self):
+        self.harmonize({'a|s': sheet(['1', '2024-01-01', 'Stool'], ['2', '2024-01-02', 'Blood'])})
+        dataset = self.assertMatchesFullRun({'a|s': sheet(['2', '2024-01-02', 'Blood'])})
+        self.assertEqual(list(dataset['barcode']), ['S2_2024-01-02_Blood'])
+
+    def test_changed_source_takes_barcode(self):
+        b = sheet(['1', '2024-01-01', 'Stool'])
+        self.harmonize({'a|s': sheet(['2', '2024-01-02', 'Blood']), 'b|s': b})
+        self.assertMatchesFullRun({'a|s': sheet(['1', '2024-01-01', 'Stool'], ['2', '2024-01-02', 'Blood']), 'b|s': b})
+        # ... and gives it back on the next run
+        self.assertMatchesFullRun({'a|s': sheet(['2', '2024-01-02', 'Blood']), 'b|s': b})
+
+    def test_unchanged_sources(self):
+        sources = {'a|s': sheet(['1', '2024-01-01', 'Stool']), 'b|s': sheet(['1', '2024-01-01', 'Stool'])}
+        self.harmonize(sources)
+        self.assertMatchesFullRun(sources)
+
+    def test_missing_source_keeps_rows(self):
+        self.harmonize({'a|s': sheet(['1', '2024-01-01', 'Stool']), 'b|s': sheet(['2', '2024-01-02', 'Blood'])})
+        dataset = self.harmonize({'b|s': sheet(['2', '2024-01-02', 'Blood'], ['3', '2024-01-03', 'Blood'])})
+        self.assertEqual(sorted(dataset['barcode']), ['S1_2024-01-01_Stool', 'S2_2024-01-02_Blood', 'S3_2024-01-03_Blood'])
+
+    def test_streaming_rewrite_invalidates_manifest(self):
+        from run_harmonization import harmonize_files
+
+        sources = {'a|s': sheet(['1', '2024-01-01', 'Stool'])}
+        self.harmonize(sources)
+        path = self.workdir / 'b.csv'
+        sheet(['2', '2024-01-02', 'Blood']).to_csv(path, index=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            harmonize_files([path], ID_LOOKUP, self.workdir / 'incremental.tsv', self.workdir / 'incremental.json')
+        self.assertFalse((self.workdir / 'incremental.json').exists())
+        dataset = self.assertMatchesFullRun(sources)
+        self.assertEqual(list(dataset['barcode']), ['S1_2024-01-01_Stool'])
+
+
+class StreamingReaderTestCase(unittest.TestCase):
+    """The streaming readers must give the same DataFrames as reading a sheet whole."""
+
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.workdir)
+
+    def write_workbook(self, *rows):
+        workbook = Workbook()
+        worksheet = workbook.active
+        worksheet.title = 'Samples'
+        for row in rows:
+            worksheet.append(row)
+        path = self.workdir / 'samples.xlsx'
+        workbook.save(path)
+        return path
+
+    def test_duplicate_and_blank_headers(self):
+        path = self.write_workbook(
+            ['MRN', 'MRN', 'MRN.1', None, 'MRN', 'Collection Date', 'Sample Type'],
+            ['1', '2', '3', 'x', '4', '2024-01-01', 'Stool'],
+        )
+        whole = pd.read_excel(path, sheet_name=None)['Samples']
+        [(source_key, chunk)] = list(iter_xlsx_chunks(path))
+        self.assertEqual(source_key, 'samples.xlsx|Samples')
+        self.assertEqual(list(chunk.columns), list(whole.columns))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            streamed = pd.concat(harmonize_chunks(iter_xlsx_chunks(path), ID_LOOKUP))
+            expected = create_harmonized_sample_list({source_key: whole}, ID_LOOKUP)
+        self.assertEqual(list(streamed['barcode']), list(expected['barcode']))
+        self.assertEqual(list(streamed['barcode']), ['S1_2024-01-01_Stool'])
+
+    def test_xlsx_chunks_keep_text_dtypes(self):
+        path = self.write_workbook(
+            ['MRN', 'Collection Date', 'Sample Type'],
+            [1, '2024-01-01', 'Stool'],
+            [2, '2024-01-02', 'Blood'],
+            [3, '2024-01-03', 'Stool'],
+            [None, '2024-01-04', 'Stool'],
+        )
+        # Only the second chunk has a blank MRN
+        chunks = list(iter_xlsx_chunks(path, chunk_rows=2))
+        self.assertEqual(list(chunks[0][1]['MRN']), ['1', '2'])
+        self.assertEqual(list(chunks[1][1]['MRN'].iloc[:1]), ['3'])
+        self.assertTrue(pd.isna(chunks[1][1]['MRN'].iloc[1]))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            streamed = pd.concat(harmonize_chunks(chunks, ID_LOOKUP))
+        self.assertEqual(list(streamed['subject_id'].iloc[:3]), ['S1', 'S2', 'S3'])
+
+    def test_csv_chunks_keep_text_dtypes(self):
+        path = self.workdir / 'samples.csv'
+        path.write_text(
+            'MRN,Collection Date,Sample Type\n'
+            '1,2024-01-01,Stool\n'
+            '2,2024-01-02,blood\n'
+            '3,2024-01-03,\n'
+            ',2024-01-04,\n'
+        )
+        # The second chunk has a blank MRN and only blank sample types
+        chunks = list(iter_delimited_chunks(path, chunk_rows=2))
+        self.assertEqual([len(chunk) for source_key, chunk in chunks], [2, 2])
+        self.assertEqual(list(chunks[1][1]['MRN'].iloc[:1]), ['3'])
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            streamed = pd.concat(harmonize_chunks(chunks, ID_LOOKUP))
+        self.assertEqual(list(streamed['subject_id'].iloc[:3]), ['S1', 'S2', 'S3'])
+        self.assertEqual(list(streamed['sample_source']), ['Stool', 'Blood', 'Other', 'Other'])
+
+
+class SheetCacheTestCase(unittest.TestCase):
+    """Parsed sheets are cached by content digest and reader version, and only when asked to."""
+
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.cache = SheetCache(self.workdir / 'cache')
+        self.sheets = {'Samples': sheet(['1', '2024-01-01', 'Stool']), 'Other': sheet(['2', '2024-01-02', 'Blood'])}
+
+    def write_workbook(self):
+        path = self.workdir / 'samples.xlsx'
+        with pd.ExcelWriter(path) as writer:
+            for name, df in self.sheets.items():
+                df.to_excel(writer, sheet_name=name, index=False)
+        return path
+
+    def test_miss_then_hit(self):
+        self.assertIsNone(self.cache.load('abc'))
+        self.cache.store('abc', self.sheets)
+        loaded = self.cache.load('abc')
+        self.assertEqual(list(loaded), ['Samples', 'Other'])
+        for name, df in self.sheets.items():
+            pd.testing.assert_frame_equal(loaded[name], df)
+        self.assertIsNone(self.cache.load('def'))
+        self.assertEqual(self.cache.directory.stat().st_mode & 0o777, 0o700)
+
+    def test_version_bump_misses(self):
+        self.cache.store('abc', self.sheets)
+        bumped = SheetCache(self.cache.directory, version=self.cache.version + 1)
+        self.assertIsNone(bumped.load('abc'))
+        self.assertIsNotNone(self.cache.load('abc'))
+
+    def test_read_workbook_hits_cache(self):
+        path = self.write_workbook()
+        first = read_workbook(path, self.cache)
+        second = read_workbook(path, self.cache)
+        self.assertEqual((first.error, first.cached, second.cached), (None, False, True))
+        for key, df in first.sheets.items():
+            pd.testing.assert_frame_equal(second.sheets[key], df)
+
+    def test_readers_only_cache_when_configured(self):
+        path = self.write_workbook()
+        environment = {k: v for k, v in os.environ.items() if k != 'SHEET_CACHE_DIR'}
+        with mock.patch.dict(os.environ, environment, clear=True):
+            self.assertIsNone(cache_from_environment())
+            self.assertFalse(read_workbook(path).cached)
+            self.assertFalse(read_workbook(path).cached)
+        self.assertFalse(self.cache.directory.exists())
+
+        with mock.patch.dict(os.environ, {'SHEET_CACHE_DIR': str(self.cache.directory)}):
+            read_workbook(path)
+            self.assertTrue(read_workbook(path).cached)
+
+
+class LinkageIndexTestCase(unittest.TestCase):
+    """A LinkageIndex must answer exactly like the dict it replaces."""
+
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.workdir)
+        linkage_df = pd.DataFrame({
+            'subject_id': ['S1', 'S2', 'S3', 'S4'],
+            'mrn': ['100;101', 'Ünïcødé-7', None, '100'],
+            'upn': ['UPN_A', None, '患者-3;UPN_A', ''],
+            'pmid': ['PMID-01', 'PMID-02', 'PMID-03;PMID-01', 'PMID-04'],
+        })
+        self.pairs = linkage_pairs(linkage_df)
+        self.baseline = dict(zip(self.pairs['legacy_id'], self.pairs['subject_id']))
+
+    def assertLooksUpLikeBaseline(self, index):
+        queries = pd.Series(
+            ['100', '101', 'Ünïcødé-7', 'Unicode-7', '患者-3', '患者', 'UPN_A', 'PMID-01', 'PMID-04', 'PMID-99', '', 'nan'],
+            index=range(10, 22),
+        )
+        pd.testing.assert_series_equal(index.lookup(queries), queries.map(self.baseline).astype(object))
+        self.assertEqual(index.get('Ünïcødé-7'), 'S2')
+        self.assertIsNone(index.get('PMID-99'))
+        self.assertNotIn('', index)
+
+    def test_duplicate_ids_keep_last_occurrence(self):
+        self.assertEqual(len(self.pairs), len(self.baseline))
+        self.assertEqual(self.baseline['100'], 'S4')
+        self.assertEqual(self.baseline['UPN_A'], 'S3')
+        self.assertEqual(self.baseline['PMID-01'], 'S3')
+
+    def test_lookup_matches_dict(self):
+        index = LinkageIndex.from_pairs(self.pairs)
+        self.assertEqual(len(index), len(self.baseline))
+        self.assertLooksUpLikeBaseline(index)
+
+    def test_saved_index_matches_dict(self):
+        directory = self.workdir / 'SECURE_linkage_index'
+        LinkageIndex.from_pairs(self.pairs).save(directory, 'digest')
+        self.assertEqual(directory.stat().st_mode & 0o777, 0o700)
+        self.assertIsNone(LinkageIndex.load(directory, 'other digest'))
+        self.assertLooksUpLikeBaseline(LinkageIndex.load(directory, 'digest'))
+
+    def test_shared_directory_is_not_loaded(self):
+        directory = self.workdir / 'SECURE_linkage_index'
+        LinkageIndex.from_pairs(self.pairs).save(directory, 'digest')
+        directory.chmod(0o777)
+        self.assertIsNone(LinkageIndex.load(directory, 'digest'))
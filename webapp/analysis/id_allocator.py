@@ -0,0 +1,119 @@
+"""
+Batch allocation of random, collision-free identifiers.
+
+Candidates are generated a block at a time and checked against the backing
+unique index with one query per block; only the candidates that collide are
+regenerated. Allocating 100k IDs therefore costs a handful of round trips.
+"""
+import random
+import string
+
+DEFAULT_ALPHABET = string.ascii_uppercase + string.digits
+DEFAULT_BATCH_SIZE = 1000
+MAX_ROUNDS = 20
+
+
+class IDAllocator:
+    """
+    Reserves unique `<prefix><random part>` identifiers in batches.
+
+    Args:
+        prefix: String prepended to every identifier (e.g. 'WGS_').
+        length: Length of the random part.
+        alphabet: Characters used for the random part.
+        exists: Callable taking a list of candidate IDs and returning the subset
+            that is already taken. When omitted, IDs are only unique among
+            those handed out by this allocator.
+        batch_size: Maximum number of candidates checked per `exists` call.
+        seed: Optional seed for reproducible sequences. When omitted, the
+            operating system's random source is used.
+    """
+
+    def __init__(self, prefix='', length=8, alphabet=DEFAULT_ALPHABET, exists=None,
+                 batch_size=DEFAULT_BATCH_SIZE, seed=None):
+        self.prefix = prefix
+        self.length = length
+        self.alphabet = alphabet
+        self.exists = exists
+        self.batch_size = batch_size
+        self.rng = random.SystemRandom() if seed is None else random.Random(seed)
+        self.reserved = set()
+
+    def _candidate(self, prefix):
+        return prefix + ''.join(self.rng.choices(self.alphabet, k=self.length))
+
+    def _taken(self, candidates):
+        if self.exists is None:
+            return set()
+        taken = set()
+        for start in range(0, len(candidates), self.batch_size):
+            taken.update(self.exists(candidates[start:start + self.batch_size]))
+        return taken
+
+    def allocate(self, count):
+        """
+        Return `count` new identifiers that are neither taken in the backing
+        store nor previously returned by this allocator.
+        """
+        return self.allocate_many({self.prefix: count})[self.prefix]
+
+    def allocate_many(self, counts):
+        """
+        Allocate identifiers for several prefixes at once.
+
+        Args:
+            counts: Mapping of prefix to the number of IDs needed.
+
+        Returns:
+            dict: Mapping of prefix to a list of new identifiers. Candidates for
+            all prefixes share the same `exists` checks.
+        """
+        allocated = {prefix: [] for prefix in counts}
+        for _ in range(MAX_ROUNDS):
+            needed = {
+                prefix: count - len(allocated[prefix])
+                for prefix, count in counts.items()
+                if count > len(allocated[prefix])
+            }
+            if not needed:
+                break
+            candidates = []
+            seen = set()
+            for prefix, count in needed.items():
+                generated = 0
+                for _ in range(count * 10):
+                    if generated == count:
+                        break
+                    candidate = self._candidate(prefix)
+                    if candidate not in self.reserved and candidate not in seen:
+                        seen.add(candidate)
+                        candidates.append((prefix, candidate))
+                        generated += 1
+            taken = self._taken([candidate for _, candidate in candidates])
+            for prefix, candidate in candidates:
+                if candidate not in taken:
+                    self.reserved.add(candidate)
+                    allocated[prefix].append(candidate)
+        else:
+            short = [p for p, count in counts.items() if len(allocated[p]) < count]
+            if short:
+                raise RuntimeError(
+                    f"Could not allocate unique IDs for prefix(es) {', '.join(map(repr, short))} "
+                    f"after {MAX_ROUNDS} rounds; the ID space may be exhausted."
+                )
+        return allocated
+
+    def allocate_one(self):
+        return self.allocate(1)[0]
+
+
+def model_field_lookup(model, field):
+    """
+    Build an `exists` callable that checks candidates against a unique model
+    field with a single `__in` query.
+    """
+    def exists(candidates):
+        return set(
+            model.objects.filter(**{f'{field}__in': candidates}).values_list(field, flat=True)
+        )
+    return exists
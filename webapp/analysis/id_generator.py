@@ -1,8 +1,8 @@
-import random
-import string
+from collections import defaultdict
 
 from django.contrib.contenttypes.models import ContentType
 
+from .id_allocator import IDAllocator, model_field_lookup, DEFAULT_BATCH_SIZE
 from .models import AnalysisID
 from sampletracking.models import Extract, SequenceLibrary
 
@@ -22,9 +22,33 @@ ID_PREFIX_MAP = {
     'Antimicrobials': 'TDM_',
 }
 
-def generate_random_string(length=8):
-    """Generates a random alphanumeric string of a given length."""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
+# The field on each analysis-ready model that selects the ID prefix.
+PREFIX_FIELD_MAP = {
+    SequenceLibrary: 'analysis_type',
+    Extract: 'extract_type',
+}
+
+def get_id_allocator(prefix='', seed=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Returns an IDAllocator that checks candidate Analysis IDs against the
+    AnalysisID unique index in batches.
+    """
+    return IDAllocator(
+        prefix=prefix,
+        exists=model_field_lookup(AnalysisID, 'analysis_id'),
+        batch_size=batch_size,
+        seed=seed,
+    )
+
+def get_prefix(source_object):
+    """
+    Returns the Analysis ID prefix for an Extract or SequenceLibrary, or None
+    if the object's type has no prefix defined.
+    """
+    field = PREFIX_FIELD_MAP.get(type(source_object))
+    if field is None:
+        return None
+    return ID_PREFIX_MAP.get(getattr(source_object, field))
 
 def create_analysis_id(source_object):
     """
@@ -36,23 +60,12 @@ def create_analysis_id(source_object):
     Returns:
         The newly created AnalysisID object, or None if a prefix is not defined.
     """
-    if isinstance(source_object, SequenceLibrary):
-        prefix_key = source_object.analysis_type
-    elif isinstance(source_object, Extract):
-        prefix_key = source_object.extract_type
-    else:
-        return None # Or raise an error
-
-    prefix = ID_PREFIX_MAP.get(prefix_key)
+    prefix = get_prefix(source_object)
     if not prefix:
         return None # Or raise an error
 
     # Generate a new unique ID
-    while True:
-        random_part = generate_random_string()
-        new_id = f"{prefix}{random_part}"
-        if not AnalysisID.objects.filter(analysis_id=new_id).exists():
-            break
+    new_id = get_id_allocator(prefix).allocate_one()
 
     # Create the new AnalysisID object
     analysis_id_obj = AnalysisID.objects.create(
@@ -61,3 +74,58 @@ def create_analysis_id(source_object):
     )
 
     return analysis_id_obj
+
+def create_analysis_ids(objects, skip_existing=True, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Generates AnalysisIDs for many Extracts and/or SequenceLibraries at once.
+
+    Objects are grouped by ContentType, candidate IDs for all of them are
+    checked for collisions together, and the new rows are written with
+    bulk_create.
+
+    Args:
+        objects: Saved Extract and/or SequenceLibrary instances.
+        skip_existing: If True, objects that already have an AnalysisID are skipped.
+        batch_size: Number of rows per collision check and per insert.
+
+    Returns:
+        A list of the newly created AnalysisID objects. Objects without a
+        defined prefix are skipped.
+    """
+    by_content_type = defaultdict(list)
+    content_types = ContentType.objects.get_for_models(*{type(obj) for obj in objects})
+    for obj in objects:
+        if get_prefix(obj):
+            by_content_type[content_types[type(obj)]].append(obj)
+
+    if skip_existing:
+        for content_type, group in by_content_type.items():
+            pks = [obj.pk for obj in group]
+            existing = set()
+            for start in range(0, len(pks), batch_size):
+                existing.update(
+                    AnalysisID.objects.filter(
+                        content_type=content_type,
+                        object_id__in=pks[start:start + batch_size],
+                    ).values_list('object_id', flat=True)
+                )
+            by_content_type[content_type] = [obj for obj in group if obj.pk not in existing]
+
+    counts = defaultdict(int)
+    for group in by_content_type.values():
+        for obj in group:
+            counts[get_prefix(obj)] += 1
+    if not counts:
+        return []
+
+    new_ids = get_id_allocator(batch_size=batch_size).allocate_many(counts)
+
+    analysis_ids = []
+    for content_type, group in by_content_type.items():
+        for obj in group:
+            analysis_ids.append(AnalysisID(
+                analysis_id=new_ids[get_prefix(obj)].pop(),
+                content_type=content_type,
+                object_id=obj.pk,
+            ))
+    return AnalysisID.objects.bulk_create(analysis_ids, batch_size=batch_size)
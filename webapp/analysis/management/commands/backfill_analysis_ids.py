@@ -0,0 +1,75 @@
+"""
+Backfill Analysis IDs for analysis-ready samples that do not have one yet.
+Usage: python manage.py backfill_analysis_ids [--dry-run] [--batch-size N]
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from analysis.id_allocator import DEFAULT_BATCH_SIZE
+from analysis.id_generator import ID_PREFIX_MAP, create_analysis_ids
+from analysis.models import AnalysisID
+from sampletracking.models import Extract, SequenceLibrary
+
+
+class Command(BaseCommand):
+    help = 'Generate Analysis IDs for every terminal Extract and SequenceLibrary that lacks one.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Number of samples processed per batch (default: {DEFAULT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many Analysis IDs would be generated'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be a positive integer.')
+
+        total = 0
+        for model, queryset in self.get_candidate_querysets():
+            pks = list(queryset.values_list('pk', flat=True))
+            label = model._meta.verbose_name_plural
+            if options['dry_run']:
+                self.stdout.write(f"{len(pks)} {label} lack an Analysis ID.")
+                continue
+
+            created = 0
+            for start in range(0, len(pks), batch_size):
+                batch = list(model.objects.filter(pk__in=pks[start:start + batch_size]))
+                with transaction.atomic():
+                    created += len(create_analysis_ids(batch, skip_existing=False, batch_size=batch_size))
+            self.stdout.write(f"Generated {created} Analysis IDs for {label}.")
+            total += created
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Backfill complete. {total} new Analysis IDs generated."))
+
+    def get_candidate_querysets(self):
+        """
+        Terminal extracts (no libraries, with a prefixed extract type) and
+        libraries with a prefixed analysis type, excluding those that already
+        have an Analysis ID.
+        """
+        prefix_keys = list(ID_PREFIX_MAP)
+
+        extracts = Extract.objects.filter(
+            extract_type__in=prefix_keys,
+            libraries__isnull=True,
+        )
+        libraries = SequenceLibrary.objects.filter(analysis_type__in=prefix_keys)
+
+        for model, queryset in ((Extract, extracts), (SequenceLibrary, libraries)):
+            has_id = AnalysisID.objects.filter(
+                content_type=ContentType.objects.get_for_model(model),
+                object_id=OuterRef('pk'),
+            )
+            yield model, queryset.filter(~Exists(has_id)).order_by('pk')
@@ -1,3 +1,101 @@
+from datetime import date
+from io import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from sampletracking.models import CrudeSample, Aliquot, Extract, SequenceLibrary
+from .id_allocator import IDAllocator
+from .id_generator import create_analysis_id, create_analysis_ids
+from .models import AnalysisID
+
+
+class IDAllocatorTestCase(TestCase):
+    """Test batch ID allocation."""
+
+    def test_allocated_ids_are_unique(self):
+        """Test that a large block of IDs contains no duplicates."""
+        allocator = IDAllocator(prefix='WGS_', length=4)
+        ids = allocator.allocate(5000)
+        self.assertEqual(len(set(ids)), 5000)
+        self.assertTrue(all(i.startswith('WGS_') for i in ids))
+
+    def test_collisions_are_retried_in_batches(self):
+        """Test that only colliding candidates are regenerated."""
+        taken = {f'X{c}' for c in 'ABCDEFGH'}
+        calls = []
+
+        def exists(candidates):
+            calls.append(len(candidates))
+            return taken.intersection(candidates)
+
+        allocator = IDAllocator(prefix='X', length=1, alphabet='ABCDEFGHIJ', exists=exists, seed=0)
+        self.assertEqual(sorted(allocator.allocate(2)), ['XI', 'XJ'])
+        self.assertTrue(all(size <= 2 for size in calls))
+
+    def test_exhausted_id_space_raises(self):
+        """Test that allocation fails loudly when no IDs are left."""
+        allocator = IDAllocator(prefix='X', length=1, alphabet='AB', exists=lambda c: set(c))
+        with self.assertRaises(RuntimeError):
+            allocator.allocate(1)
+
+    def test_seed_is_reproducible(self):
+        """Test that seeded allocators yield the same sequence."""
+        self.assertEqual(IDAllocator(seed=42).allocate(10), IDAllocator(seed=42).allocate(10))
+
+    def test_request_larger_than_id_space_raises(self):
+        """Test that asking for more IDs than exist does not loop forever."""
+        allocator = IDAllocator(length=1, alphabet='AB')
+        with self.assertRaises(RuntimeError):
+            allocator.allocate(3)
+
+
+class AnalysisIDGenerationTestCase(TestCase):
+    """Test single and batch Analysis ID generation."""
+
+    def setUp(self):
+        """Create one terminal extract, one library and one extract with no prefix."""
+        crude = CrudeSample.objects.create(
+            barcode='CS001', subject_id='SUBJ-0001', date_created=date.today(),
+            collection_date=date.today(), sample_source='Stool',
+        )
+        aliquot = Aliquot.objects.create(barcode='AL001', parent_barcode=crude, date_created=date.today())
+        self.metabolomics = Extract.objects.create(
+            barcode='EX001', parent=aliquot, extract_type='Metabolomics', date_created=date.today(),
+        )
+        self.dna = Extract.objects.create(
+            barcode='EX002', parent=aliquot, extract_type='DNA', date_created=date.today(),
+        )
+        self.library = SequenceLibrary.objects.create(
+            barcode='LIB001', parent=self.dna, analysis_type='MSS', date_created=date.today(),
+        )
+
+    def test_create_analysis_id_uses_prefix(self):
+        """Test that a single ID gets the prefix for its analysis type."""
+        analysis_id = create_analysis_id(self.library)
+        self.assertTrue(analysis_id.analysis_id.startswith('MSS_'))
+        self.assertIsNone(create_analysis_id(self.dna))
+
+    def test_create_analysis_ids_in_batch(self):
+        """Test that a mixed batch is generated with a constant number of queries."""
+        ContentType.objects.get_for_models(Extract, SequenceLibrary)  # warm the content type cache
+        with self.assertNumQueries(4):
+            created = create_analysis_ids([self.metabolomics, self.dna, self.library])
+        self.assertEqual(len(created), 2)
+        prefixes = sorted(a.analysis_id[:4] for a in AnalysisID.objects.all())
+        self.assertEqual(prefixes, ['MET_', 'MSS_'])
+
+    def test_create_analysis_ids_skips_existing(self):
+        """Test that objects which already have an ID are skipped."""
+        create_analysis_id(self.library)
+        created = create_analysis_ids([self.metabolomics, self.library])
+        self.assertEqual(len(created), 1)
+        self.assertEqual(AnalysisID.objects.count(), 2)
+
+    def test_backfill_command(self):
+        """Test that the backfill only covers terminal samples lacking an ID."""
+        call_command('backfill_analysis_ids', stdout=StringIO())
+        self.assertEqual(AnalysisID.objects.count(), 2)
+        call_command('backfill_analysis_ids', stdout=StringIO())
+        self.assertEqual(AnalysisID.objects.count(), 2)
@@ -44,7 +44,7 @@ urlpatterns = [
     path('crude_samples/', CrudeSampleListView.as_view(), name='crude_sample_list'),
     path('crude_samples/new/', CrudeSampleCreateView.as_view(), name='create_crude_sample'),
     path('crude_samples/<int:pk>/', CrudeSampleDetailView.as_view(), name='crude_sample_detail'),
-    path('crude_samples/<int:pk>/edit/', CrudeSampleUpdateView.as_view(), name='crude_sample_edit'),
+    path('crude_samples/<int:pk>/edit/', CrudeSampleUpdateView.as_view(), name='crude_sample_update'),
     
     # Aliquot URLs
     path('aliquots/', AliquotListView.as_view(), name='aliquot_list'),
@@ -62,5 +62,27 @@ urlpatterns = [
     path('libraries/<int:pk>/', SequenceLibraryDetailView.as_view(), name='library_detail'),
     
     # Search
-    path('search/', SampleSearchView.as_view(), name='sample_search'),
+    path('search/', SampleSearchView.as_view(), name='search'),
+
+    # Reports
+    path('reports/daily/', views.ReportView.as_view(), name='daily_status_report'),
+    path('reports/comprehensive/', views.ComprehensiveReportView.as_view(), name='comprehensive_report'),
+    path('reports/download/<slug:token>/', views.report_download, name='report_download'),
+
+    # Background jobs
+    path('jobs/<int:pk>/', views.job_status, name='job_status'),
+
+    # Monitoring
+    path('performance/', views.performance_stats, name='performance_stats'),
+
+    # Exports
+    path('export/labels/', views.ExportLabelsView.as_view(), name='export_labels'),
+    path('export/<str:model_type>/', views.SampleExportView.as_view(), name='export_samples'),
+
+    # Accessioning and barcode scanning
+    path('accessioning/new/', views.AccessioningCreateView.as_view(), name='accessioning_create'),
+    path('receive/', views.find_sample_to_receive, name='find_sample_to_receive'),
+    path('receive/<str:barcode>/', views.ReceiveSampleView.as_view(), name='receive_sample'),
+    path('barcodes/lookup/', views.barcode_lookup, name='barcode_lookup'),
+    path('barcodes/prefix/', views.barcode_prefix_lookup, name='barcode_prefix_lookup'),
 ]
\ No newline at end of file
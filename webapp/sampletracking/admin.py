@@ -10,6 +10,7 @@ from datetime import timedelta
 from django.utils import timezone
 
 from analysis.admin import generate_analysis_ids_action
+from .stats import DashboardStats, refresh_snapshot
 
 # Customize admin site header and title with better styling
 admin.site.site_header = "🧬 MGML Sample Database Administration"
@@ -27,18 +28,15 @@ class MyAdminSite(AdminSite):
     def index(self, request, extra_context=None):
         extra_context = extra_context or {}
         
-        # Total Samples
-        total_samples = CrudeSample.objects.count()
-        
-        # Recent Activity (last 30 days)
-        thirty_days_ago = timezone.localtime() - timedelta(days=30)
-        recent_activity = CrudeSample.objects.filter(created_at__gte=thirty_days_ago).count()
-        
-        # Available Samples
-        available_samples = CrudeSample.objects.filter(status='AVAILABLE').count()
-        
-        # Attention Needed (barcode overrides)
-        attention_needed = CrudeSample.objects.filter(barcode_override_used=True).count()
+        stats = DashboardStats()
+        problems = stats.problems()
+
+        total_samples = stats.count(CrudeSample)
+        recent_activity = stats.count(CrudeSample, days=30)
+        available_samples = stats.count(CrudeSample, status='AVAILABLE')
+
+        # Attention Needed (contaminated or exhausted samples)
+        attention_needed = problems['total_issues']
         
         extra_context['total_samples'] = total_samples
         extra_context['recent_activity'] = recent_activity
@@ -107,9 +105,20 @@ class RecentSamplesFilter(admin.SimpleListFilter):
             return queryset.filter(date_created__gte=start_quarter)
 
 
+def update_status(modeladmin, queryset, status):
+    """
+    Bulk-update the status of the selected samples and refresh the dashboard
+    snapshot for their days (queryset.update() sends no signals).
+    """
+    dates = set(queryset.values_list('date_created', flat=True))
+    updated = queryset.update(status=status)
+    refresh_snapshot(modeladmin.model, dates)
+    return updated
+
+
 @admin.action(description="📦 Mark selected samples as archived")
 def mark_archived(modeladmin, request, queryset):
-    updated = queryset.update(status='ARCHIVED')
+    updated = update_status(modeladmin, queryset, 'ARCHIVED')
     modeladmin.message_user(
         request,
         f"Successfully archived {updated} samples.",
@@ -119,7 +128,7 @@ def mark_archived(modeladmin, request, queryset):
 
 @admin.action(description="✅ Mark selected samples as available")
 def mark_available(modeladmin, request, queryset):
-    updated = queryset.update(status='AVAILABLE')
+    updated = update_status(modeladmin, queryset, 'AVAILABLE')
     modeladmin.message_user(
         request,
         f"Successfully marked {updated} samples as available.",
@@ -129,7 +138,7 @@ def mark_available(modeladmin, request, queryset):
 
 @admin.action(description="⚠️ Mark selected samples as contaminated")
 def mark_contaminated(modeladmin, request, queryset):
-    updated = queryset.update(status='CONTAMINATED')
+    updated = update_status(modeladmin, queryset, 'CONTAMINATED')
     modeladmin.message_user(
         request,
         f"Marked {updated} samples as contaminated.",
@@ -0,0 +1,164 @@
+"""
+Barcode registry: resolve any scanned barcode to the sample or plate that owns it.
+
+BarcodeRegistry holds one row per sample and plate barcode and is maintained
+by signal handlers (see signals.py). Cross-model lookups go through an
+in-process LRU cache because the same tubes are often scanned several times in
+a row at the accessioning bench. Only hits are cached, so a newly registered
+barcode is found immediately.
+
+The cache is only invalidated by the signals of its own process, so code that
+acts on a scan (receiving a sample) does not trust it: get_by_barcode reads
+the model's unique barcode index, and lookup(..., cached=False) reads the
+registry.
+"""
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.db import connection
+
+from .models import CrudeSample, Aliquot, Extract, SequenceLibrary, Plate, BarcodeRegistry
+
+REGISTERED_MODELS = (CrudeSample, Aliquot, Extract, SequenceLibrary, Plate)
+
+MODEL_BY_NAME = {model._meta.model_name: model for model in REGISTERED_MODELS}
+
+BARCODE_CACHE_SIZE = getattr(settings, 'BARCODE_CACHE_SIZE', 4096)
+PREFIX_LOOKUP_LIMIT = 25
+REGISTRY_BATCH_SIZE = 2000
+
+
+class LRUCache:
+    """A small thread-safe least-recently-used mapping."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+barcode_cache = LRUCache(BARCODE_CACHE_SIZE)
+
+
+def register(instance):
+    """Create or update the registry entry for a sample or plate."""
+    BarcodeRegistry.objects.update_or_create(
+        model_name=instance._meta.model_name,
+        object_id=instance.pk,
+        defaults={'barcode': instance.barcode},
+    )
+    barcode_cache.discard(instance.barcode)
+
+
+def unregister(instance):
+    BarcodeRegistry.objects.filter(
+        model_name=instance._meta.model_name, object_id=instance.pk,
+    ).delete()
+    barcode_cache.discard(instance.barcode)
+
+
+def register_objects(model, objects):
+    """Bulk-create registry entries for newly created records of one model."""
+    BarcodeRegistry.objects.bulk_create(
+        [
+            BarcodeRegistry(barcode=obj.barcode, model_name=model._meta.model_name, object_id=obj.pk)
+            for obj in objects
+        ],
+        batch_size=REGISTRY_BATCH_SIZE,
+    )
+
+
+def lookup(barcode, cached=True):
+    """
+    Return the (model_name, object_id) pairs registered for `barcode`.
+
+    Barcodes are unique per model, so this is almost always a single pair.
+    With `cached=False` the registry is always read, and the cache refreshed,
+    so entries made stale by another process are never returned.
+    """
+    entries = barcode_cache.get(barcode) if cached else None
+    if entries is None:
+        entries = tuple(
+            BarcodeRegistry.objects.filter(barcode=barcode)
+            .order_by('model_name')
+            .values_list('model_name', 'object_id')
+        )
+        if entries:
+            barcode_cache.set(barcode, entries)
+        else:
+            barcode_cache.discard(barcode)
+    return entries
+
+
+def get_by_barcode(barcode, model):
+    """
+    Return the `model` instance with `barcode`, or None.
+
+    A single query on the model's unique barcode index; the registry and its
+    cache would cost as much and could be stale.
+    """
+    return model.objects.filter(barcode=barcode).first()
+
+
+def prefix_lookup(prefix, limit=PREFIX_LOOKUP_LIMIT):
+    """
+    Return up to `limit` registry entries whose barcode starts with `prefix`,
+    ordered by barcode, as (barcode, model_name, object_id) tuples.
+    """
+    queryset = BarcodeRegistry.objects.all()
+    if connection.vendor == 'sqlite':
+        # SQLite's LIKE is case-insensitive and cannot use the index; a range
+        # over the binary-collated barcode can. Barcodes are ASCII-only.
+        queryset = queryset.filter(barcode__gte=prefix, barcode__lt=prefix + '\x7f')
+    else:
+        queryset = queryset.filter(barcode__startswith=prefix)
+    return list(
+        queryset.order_by('barcode', 'model_name')
+        .values_list('barcode', 'model_name', 'object_id')[:limit]
+    )
+
+
+def rebuild_barcode_registry():
+    """Rebuild every registry entry from the sample and plate tables."""
+    BarcodeRegistry.objects.all().delete()
+    barcode_cache.clear()
+    counts = {}
+    for model in REGISTERED_MODELS:
+        entries = [
+            BarcodeRegistry(barcode=barcode, model_name=model._meta.model_name, object_id=pk)
+            for pk, barcode in model.objects.values_list('pk', 'barcode').iterator(chunk_size=REGISTRY_BATCH_SIZE)
+        ]
+        BarcodeRegistry.objects.bulk_create(entries, batch_size=REGISTRY_BATCH_SIZE)
+        counts[model] = len(entries)
+    return counts
@@ -0,0 +1,123 @@
+"""
+Streaming CSV/TSV exports.
+
+Rows are read with QuerySet.iterator() and written a block at a time into a
+StreamingHttpResponse, optionally gzip-compressed on the fly, so memory use
+stays flat however many rows are exported.
+"""
+import csv
+import io
+import zlib
+
+from django.http import StreamingHttpResponse
+
+from .models import CrudeSample
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BLOCK_ROWS = 500
+
+# format -> (delimiter, content type)
+EXPORT_FORMATS = {
+    'csv': (',', 'text/csv'),
+    'tsv': ('\t', 'text/tab-separated-values'),
+}
+
+LABEL_HEADER = ['SubjectID', 'Barcode']
+
+
+def iter_blocks(header, rows, delimiter=',', block_rows=EXPORT_BLOCK_ROWS):
+    """Yield the delimited text of `header` and `rows`, `block_rows` rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter)
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % block_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_blocks(blocks, level=6):
+    """Compress text blocks into a gzip stream as they are produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for block in blocks:
+        data = compressor.compress(block.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_blocks(blocks, compress=False):
+    """Encode text blocks as UTF-8, gzip-compressing them when `compress` is true."""
+    if compress:
+        return gzip_blocks(blocks)
+    return (block.encode('utf-8') for block in blocks)
+
+
+def stream_blocks(filename, blocks, fmt='csv', compress=False):
+    """
+    Return a StreamingHttpResponse downloading the text `blocks` as
+    `filename.<fmt>`, gzip-compressed (`.gz`) when `compress` is true.
+    """
+    content_type = f'{EXPORT_FORMATS[fmt][1]}; charset=utf-8'
+    filename = f"{filename}.{fmt}"
+    if compress:
+        content_type = 'application/gzip'
+        filename += '.gz'
+    response = StreamingHttpResponse(encode_blocks(blocks, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def streaming_export(filename, header, rows, fmt='csv', compress=False):
+    """Stream `header` and `rows` as a CSV or TSV download; see stream_blocks."""
+    delimiter = EXPORT_FORMATS[fmt][0]
+    return stream_blocks(filename, iter_blocks(header, rows, delimiter), fmt, compress)
+
+
+def queryset_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream the `fields` of every row of `queryset` as tuples."""
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def exportable_fields(model):
+    """The columns of `model` that can be exported, by attribute name."""
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def resolve_columns(model, columns):
+    """
+    Validate the requested column names for `model`, defaulting to all of
+    them. Raises ValueError for unknown columns.
+    """
+    allowed = exportable_fields(model)
+    if not columns:
+        return allowed
+    unknown = [column for column in columns if column not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns for {model._meta.verbose_name}: {', '.join(unknown)}")
+    return list(columns)
+
+
+def label_fields(model):
+    """The (subject ID, barcode) fields printed on labels for `model`."""
+    subject_field = 'subject_id' if model is CrudeSample else 'root_subject_id'
+    return [subject_field, 'barcode']
+
+
+REPORT_COLUMNS = [
+    ('Subject ID', 'subject_id'),
+    ('Barcode', 'barcode'),
+    ('Sample Type', 'sample_source'),
+    ('Collection Date', 'collection_date'),
+    ('Status', 'status'),
+    ('Aliquots', 'aliquot_count'),
+    ('Extracts', 'extract_count'),
+    ('Libraries', 'library_count'),
+    ('Latest Aliquot', 'latest_aliquot_date'),
+    ('Latest Extract', 'latest_extract_date'),
+    ('Latest Library', 'latest_library_date'),
+]
@@ -257,12 +257,12 @@ class ExtractForm(SampleForm):
         })
         # Display format includes parent's subject ID for better searchability
         self.fields['parent'].label_from_instance = lambda obj: (
-            f"{obj.barcode} | Parent: {obj.parent_barcode.barcode if obj.parent_barcode else 'N/A'} | "
-            f"Subject: {obj.parent_barcode.subject_id if obj.parent_barcode else 'N/A'}"
+            f"{obj.barcode} | Parent: {obj.parent_barcode_id or 'N/A'} | "
+            f"Subject: {obj.root_subject_id or 'N/A'}"
         )
 
-        # Sort by most recent first
-        self.fields['parent'].queryset = Aliquot.objects.select_related('parent_barcode').order_by('-date_created')
+        # Sort by most recent first; the labels need no joins
+        self.fields['parent'].queryset = Aliquot.objects.order_by('-date_created')
 
 
 class SequenceLibraryForm(SampleForm):
@@ -315,14 +315,12 @@ class SequenceLibraryForm(SampleForm):
         # Display format includes parent aliquot info and subject ID
         self.fields['parent'].label_from_instance = lambda obj: (
             f"{obj.barcode} | Type: {obj.get_extract_type_display() if obj.extract_type else 'Unknown'} | "
-            f"Parent: {obj.parent.barcode if obj.parent else 'N/A'} | "
-            f"Subject: {obj.parent.parent_barcode.subject_id if obj.parent and obj.parent.parent_barcode else 'N/A'}"
+            f"Parent: {obj.parent_id or 'N/A'} | "
+            f"Subject: {obj.root_subject_id or 'N/A'}"
         )
 
-        # Sort by most recent first with related data pre-fetched
-        self.fields['parent'].queryset = Extract.objects.select_related(
-            'parent', 'parent__parent_barcode'
-        ).order_by('-date_created')
+        # Sort by most recent first; the labels need no joins
+        self.fields['parent'].queryset = Extract.objects.order_by('-date_created')
 
         # Update field labels
         self.fields['nindex'].label = "N-index"
@@ -0,0 +1,229 @@
+"""
+Database-backed background job queue.
+
+Long-running work (comprehensive report files, legacy imports, security
+audits) is recorded as a Job row and executed by the `run_jobs` management
+command, which claims pending jobs and runs them in a pool of worker
+processes. Handlers report progress and return a JSON-serializable result,
+both stored on the Job so a web page or API client can poll them without
+tying up a web worker.
+
+A job is claimed with a conditional UPDATE from PENDING to RUNNING, so any
+number of workers can share the queue without running a job twice.
+
+While a job runs, its worker refreshes the job's heartbeat every
+JOB_HEARTBEAT_INTERVAL seconds. A RUNNING job whose heartbeat is older than
+JOB_STALE_AFTER seconds lost its worker (killed, or the machine went down)
+and is marked FAILED the next time any worker claims a job. Such jobs are
+not retried, as they may have done part of their work.
+"""
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('sampletracking')
+
+JOB_WORKERS = getattr(settings, 'JOB_WORKERS', 2)
+JOB_POLL_INTERVAL = getattr(settings, 'JOB_POLL_INTERVAL', 2.0)
+JOB_HEARTBEAT_INTERVAL = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 60)
+JOB_STALE_AFTER = getattr(settings, 'JOB_STALE_AFTER', 10 * 60)
+
+# kind -> handler(context, **params)
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register the decorated function as the handler for jobs of `kind`."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+class JobContext:
+    """Passed to handlers to report progress on the job they are running."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def progress(self, done, total=None, message=None):
+        fields = {'progress': done}
+        if total is not None:
+            fields['total'] = total
+        if message is not None:
+            fields['message'] = message[:255]
+        Job.objects.filter(pk=self.job.pk).update(heartbeat_at=timezone.now(), **fields)
+
+    def log(self, message):
+        """Record `message` as the job's latest status line."""
+        message = message.strip()
+        Job.objects.filter(pk=self.job.pk).update(message=message[:255], heartbeat_at=timezone.now())
+
+
+def submit_job(kind, params=None, user=None):
+    """Queue a job of `kind` and return it. Raises ValueError for unknown kinds."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job.objects.create(kind=kind, params=params or {}, created_by=user)
+    logger.info(f"Job {job.pk} ({kind}) submitted")
+    return job
+
+
+def fail_stale_jobs():
+    """
+    Mark RUNNING jobs whose worker stopped sending heartbeats as FAILED.
+    Returns the number of jobs failed.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=JOB_STALE_AFTER)
+    stale = Job.objects.filter(status=Job.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    failed = stale.update(
+        status=Job.FAILED, finished_at=now,
+        error=f"The worker running this job stopped responding for more than {JOB_STALE_AFTER} seconds.",
+    )
+    if failed:
+        logger.error(f"{failed} running job(s) lost their worker and were marked failed")
+    return failed
+
+
+def claim_next_job():
+    """
+    Mark the oldest pending job as running and return its ID, or None when
+    the queue is empty. Jobs abandoned by a dead worker are failed first.
+    """
+    fail_stale_jobs()
+    while True:
+        pk = (
+            Job.objects.filter(status=Job.PENDING)
+            .order_by('created_at', 'pk')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if pk is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=pk, status=Job.PENDING).update(
+            status=Job.RUNNING, started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            return pk
+        # Another worker claimed it first; try the next one
+
+
+@contextmanager
+def heartbeat(pk, interval=JOB_HEARTBEAT_INTERVAL):
+    """Refresh a job's heartbeat from a background thread while the block runs."""
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(interval):
+                try:
+                    Job.objects.filter(pk=pk).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    # e.g. the database is locked by the job itself; try again next time
+                    pass
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job-{pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_job(pk):
+    """Execute a claimed job and record its result or error. Returns the final status."""
+    job = Job.objects.get(pk=pk)
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        with heartbeat(pk):
+            result = handler(JobContext(job), **job.params)
+    except Exception as e:
+        logger.error(f"Job {pk} ({job.kind}) failed: {e}")
+        Job.objects.filter(pk=pk).update(
+            status=Job.FAILED, error=traceback.format_exc(), finished_at=timezone.now(),
+        )
+        return Job.FAILED
+    Job.objects.filter(pk=pk).update(
+        status=Job.DONE, result=result, finished_at=timezone.now(),
+    )
+    return Job.DONE
+
+
+def init_worker():
+    """Process pool initializer: set up Django and drop inherited connections."""
+    django.setup()
+    connections.close_all()
+
+
+def run_job_in_worker(pk):
+    """Pool entry point for run_job; closes the worker's connections afterwards."""
+    try:
+        return run_job(pk)
+    finally:
+        connections.close_all()
+
+
+@job_handler('comprehensive_report')
+def comprehensive_report_job(context, token, filters, fmt='csv', compress=False):
+    from .reports import filter_crude_samples, write_report
+
+    total = filter_crude_samples(**filters).count()
+    context.progress(0, total)
+    path = write_report(
+        token, filters, fmt, compress,
+        progress=lambda rows: context.progress(min(rows, total)),
+    )
+    context.progress(total, message='Report ready')
+    return {'token': token, 'filename': path.name, 'rows': total}
+
+
+@job_handler('import_legacy_data')
+def import_legacy_data_job(context, path, chunk_size=None):
+    import pandas as pd
+    from .legacy_import import DEFAULT_CHUNK_SIZE, LegacyImporter
+
+    df = pd.read_csv(path, sep='\t')
+    context.progress(0, len(df), message=f"Loaded {len(df):,} rows from {path}")
+    # The importer commits and reports after every chunk, so progress written
+    # here is visible to pollers while the import runs
+    importer = LegacyImporter(
+        chunk_size=chunk_size or DEFAULT_CHUNK_SIZE, user=context.job.created_by, log=context.log,
+        progress=context.progress,
+    )
+    missing = importer.missing_columns(df)
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    summary = importer.run(df)
+    context.progress(summary['unique_samples'], message='Import complete')
+    return summary
+
+
+@job_handler('security_audit')
+def security_audit_job(context, days=7):
+    from django.core.management import call_command
+
+    context.progress(0, 1)
+    output = StringIO()
+    call_command('security_audit', days=days, stdout=output)
+    context.progress(1, message='Audit complete')
+    return {'days': days, 'report': output.getvalue()}
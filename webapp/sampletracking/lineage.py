@@ -0,0 +1,142 @@
+"""
+Lineage helpers.
+
+Aliquots, extracts and libraries carry denormalized `root_crude_barcode` and
+`root_subject_id` columns (see models.DerivedSample), so subject-scoped
+queries and exports are single-table index lookups. This module keeps those
+columns consistent when a lineage changes, repairs them in bulk, and
+annotates CrudeSample querysets with facts about their descendants through
+correlated, grouped subqueries, so a report over any number of crude samples
+is a single query.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import CrudeSample, Aliquot, Extract, SequenceLibrary, SampleSearchDocument
+
+# Derived models, parents before children
+DERIVED_MODELS = (Aliquot, Extract, SequenceLibrary)
+
+REPAIR_BATCH_SIZE = 2000
+
+
+def root_values(sample):
+    """Return the (root crude barcode, root subject ID) of any sample."""
+    if isinstance(sample, CrudeSample):
+        return sample.barcode, sample.subject_id
+    return sample.root_crude_barcode, sample.root_subject_id
+
+
+def descendant_querysets(sample):
+    """The samples below `sample` in its lineage, one queryset per level."""
+    if isinstance(sample, CrudeSample):
+        return tuple(model.objects.filter(root_crude_barcode=sample.barcode) for model in DERIVED_MODELS)
+    if isinstance(sample, Aliquot):
+        return (
+            Extract.objects.filter(parent=sample),
+            SequenceLibrary.objects.filter(parent__parent=sample),
+        )
+    if isinstance(sample, Extract):
+        return (SequenceLibrary.objects.filter(parent=sample),)
+    return ()
+
+
+def propagate_lineage(sample):
+    """Copy the root barcode and subject ID of `sample` to all its descendants."""
+    barcode, subject_id = root_values(sample)
+    for queryset in descendant_querysets(sample):
+        queryset.exclude(root_crude_barcode=barcode, root_subject_id=subject_id).update(
+            root_crude_barcode=barcode, root_subject_id=subject_id,
+        )
+
+
+def expected_lineage(model):
+    """
+    Expressions for the root barcode and subject ID a row of `model` should
+    hold, read from its direct parent.
+    """
+    if model is Aliquot:
+        parent = CrudeSample.objects.filter(barcode=OuterRef('parent_barcode_id'))
+        return F('parent_barcode_id'), Subquery(parent.values('subject_id')[:1])
+    if model is Extract:
+        parent = Aliquot.objects.filter(barcode=OuterRef('parent_id'))
+    else:
+        parent = Extract.objects.filter(pk=OuterRef('parent_id'))
+    return (
+        Subquery(parent.values('root_crude_barcode')[:1]),
+        Subquery(parent.values('root_subject_id')[:1]),
+    )
+
+
+def repair_lineage(dry_run=False, batch_size=REPAIR_BATCH_SIZE):
+    """
+    Recompute the root columns level by level and fix every row that
+    disagrees with its parent, along with its search document.
+
+    Returns a {model: number of stale rows} dictionary.
+    """
+    counts = {}
+    for model in DERIVED_MODELS:
+        barcode, subject_id = expected_lineage(model)
+        stale = model.objects.annotate(
+            expected_barcode=barcode, expected_subject=subject_id,
+        ).exclude(
+            root_crude_barcode=F('expected_barcode'), root_subject_id=F('expected_subject'),
+        )
+        pks = list(stale.values_list('pk', flat=True))
+        counts[model] = len(pks)
+        if dry_run:
+            continue
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            with transaction.atomic():
+                model.objects.filter(pk__in=batch).update(
+                    root_crude_barcode=barcode, root_subject_id=subject_id,
+                )
+                SampleSearchDocument.objects.filter(
+                    model_name=model._meta.model_name, object_id__in=batch,
+                ).update(
+                    subject_id=Subquery(model.objects.filter(pk=OuterRef('object_id')).values('root_subject_id')[:1])
+                )
+    return counts
+
+
+def descendant_aggregate(model, aggregate):
+    """
+    A subquery computing `aggregate` over the `model` rows whose root crude
+    sample is the outer row. It is NULL when there are no such rows.
+    """
+    return Subquery(
+        model.objects.filter(root_crude_barcode=OuterRef('barcode'))
+        .order_by()
+        .values('root_crude_barcode')
+        .annotate(value=aggregate)
+        .values('value')[:1]
+    )
+
+
+def with_lineage_dates(queryset):
+    """
+    Annotate a CrudeSample queryset with `first_aliquot_date`,
+    `first_extract_date` and `first_library_date` (None when there is no
+    descendant at that level).
+    """
+    return queryset.annotate(
+        first_aliquot_date=descendant_aggregate(Aliquot, Min('date_created')),
+        first_extract_date=descendant_aggregate(Extract, Min('date_created')),
+        first_library_date=descendant_aggregate(SequenceLibrary, Min('date_created')),
+    )
+
+
+def with_lineage_summary(queryset):
+    """
+    Annotate a CrudeSample queryset with the number of aliquots, extracts and
+    libraries below each sample (`aliquot_count`, ...) and the date the
+    latest of each was created (`latest_aliquot_date`, ...).
+    """
+    annotations = {}
+    for name, model in (('aliquot', Aliquot), ('extract', Extract), ('library', SequenceLibrary)):
+        annotations[f'{name}_count'] = Coalesce(descendant_aggregate(model, Count('pk')), 0)
+        annotations[f'latest_{name}_date'] = descendant_aggregate(model, Max('date_created'))
+    return queryset.annotate(**annotations)
@@ -1,8 +1,8 @@
 from django.core.management.base import BaseCommand
-from django.db.models import Count, Q
+from django.db.models import Count
 from django.utils import timezone
-from datetime import timedelta
-from sampletracking.models import CrudeSample, Aliquot, Extract, SequenceLibrary, Plate
+from sampletracking.models import CrudeSample, Aliquot, Extract, SequenceLibrary
+from sampletracking.stats import DashboardStats, rebuild_snapshot
 
 
 class Command(BaseCommand):
@@ -22,17 +22,21 @@ class Command(BaseCommand):
             default=30,
             help='Number of days to include in recent activity analysis'
         )
+        parser.add_argument(
+            '--refresh',
+            action='store_true',
+            help='Rebuild the dashboard snapshot table before reporting'
+        )
 
     def handle(self, *args, **options):
         format_type = options['format']
         days = options['days']
         
-        # Calculate date range
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
+        if options['refresh']:
+            rebuild_snapshot()
         
         # Gather statistics
-        stats = self.gather_statistics(start_date, end_date)
+        stats = self.gather_statistics(days)
         
         if format_type == 'console':
             self.output_console(stats, days)
@@ -41,98 +45,32 @@ class Command(BaseCommand):
         elif format_type == 'html':
             self.output_html(stats, days)
 
-    def gather_statistics(self, start_date, end_date):
+    def gather_statistics(self, days):
         """Gather comprehensive statistics for the dashboard"""
+        stats = DashboardStats()
         
-        # Sample counts by type
-        crude_samples = CrudeSample.objects.all()
-        aliquots = Aliquot.objects.all()
-        extracts = Extract.objects.all()
-        libraries = SequenceLibrary.objects.all()
-        plates = Plate.objects.all()
-        
-        # Status breakdowns
-        sample_status_counts = crude_samples.values('status').annotate(count=Count('id'))
-        aliquot_status_counts = aliquots.values('status').annotate(count=Count('id'))
-        extract_status_counts = extracts.values('status').annotate(count=Count('id'))
-        library_status_counts = libraries.values('status').annotate(count=Count('id'))
-        
-        # Recent activity
-        recent_crude = crude_samples.filter(date_created__gte=start_date).count()
-        recent_aliquots = aliquots.filter(date_created__gte=start_date).count()
-        recent_extracts = extracts.filter(date_created__gte=start_date).count()
-        recent_libraries = libraries.filter(date_created__gte=start_date).count()
-        recent_plates = plates.filter(created_at__gte=start_date).count()
-        
-        # Sample source breakdown
-        source_counts = crude_samples.values('sample_source').annotate(count=Count('id'))
-        
-        # Extract type breakdown
-        extract_type_counts = extracts.values('extract_type').annotate(count=Count('id'))
-        
-        # Library type breakdown
-        library_type_counts = libraries.values('library_type').annotate(count=Count('id'))
-        
-        # Quality metrics
-        high_quality_extracts = extracts.filter(quality_score__gte=80).count()
-        medium_quality_extracts = extracts.filter(quality_score__gte=60, quality_score__lt=80).count()
-        low_quality_extracts = extracts.filter(quality_score__lt=60).count()
-        
-        # Sequencing status
-        sequenced_libraries = libraries.filter(date_sequenced__isnull=False).count()
-        pending_sequencing = libraries.filter(date_sequenced__isnull=True).count()
-        
-        # Storage utilization
-        storage_locations = crude_samples.values('freezer_ID').annotate(count=Count('id')).order_by('-count')
-        
-        # User activity
-        user_activity = crude_samples.values('created_by__username').annotate(count=Count('id')).order_by('-count')
-        
-        # Problem indicators
-        contaminated_samples = crude_samples.filter(status='CONTAMINATED').count()
-        exhausted_samples = crude_samples.filter(status='EXHAUSTED').count()
-        override_used = crude_samples.filter(barcode_override_used=True).count()
+        # Storage utilization and user activity are not part of the snapshot,
+        # so they are read with one grouped query each.
+        storage_locations = CrudeSample.objects.values('freezer_ID').annotate(count=Count('id')).order_by('-count')
+        user_activity = CrudeSample.objects.values('created_by__username').annotate(count=Count('id')).order_by('-count')
         
         return {
-            'totals': {
-                'crude_samples': crude_samples.count(),
-                'aliquots': aliquots.count(),
-                'extracts': extracts.count(),
-                'libraries': libraries.count(),
-                'plates': plates.count(),
-            },
-            'recent_activity': {
-                'crude_samples': recent_crude,
-                'aliquots': recent_aliquots,
-                'extracts': recent_extracts,
-                'libraries': recent_libraries,
-                'plates': recent_plates,
-            },
+            'totals': stats.totals(),
+            'recent_activity': stats.totals(days),
             'status_breakdowns': {
-                'crude_samples': list(sample_status_counts),
-                'aliquots': list(aliquot_status_counts),
-                'extracts': list(extract_status_counts),
-                'libraries': list(library_status_counts),
-            },
-            'sample_sources': list(source_counts),
-            'extract_types': list(extract_type_counts),
-            'library_types': list(library_type_counts),
-            'quality_metrics': {
-                'high_quality': high_quality_extracts,
-                'medium_quality': medium_quality_extracts,
-                'low_quality': low_quality_extracts,
-            },
-            'sequencing': {
-                'sequenced': sequenced_libraries,
-                'pending': pending_sequencing,
+                'crude_samples': stats.breakdown(CrudeSample, 'status'),
+                'aliquots': stats.breakdown(Aliquot, 'status'),
+                'extracts': stats.breakdown(Extract, 'status'),
+                'libraries': stats.breakdown(SequenceLibrary, 'status'),
             },
+            'sample_sources': stats.breakdown(CrudeSample, 'category', 'sample_source'),
+            'extract_types': stats.breakdown(Extract, 'category', 'extract_type'),
+            'library_types': stats.breakdown(SequenceLibrary, 'category', 'library_type'),
+            'quality_metrics': stats.quality_metrics(),
+            'sequencing': stats.sequencing(),
             'storage_utilization': list(storage_locations[:10]),  # Top 10 freezers
             'user_activity': list(user_activity[:10]),  # Top 10 users
-            'problems': {
-                'contaminated': contaminated_samples,
-                'exhausted': exhausted_samples,
-                'overrides': override_used,
-            }
+            'problems': stats.problems(),
         }
 
     def output_console(self, stats, days):
@@ -182,8 +120,6 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.WARNING(f"  • Contaminated Samples: {problems['contaminated']}"))
             if problems['exhausted']:
                 self.stdout.write(self.style.WARNING(f"  • Exhausted Samples: {problems['exhausted']}"))
-            if problems['overrides']:
-                self.stdout.write(self.style.WARNING(f"  • Barcode Overrides Used: {problems['overrides']}"))
         else:
             self.stdout.write(self.style.SUCCESS(f"\n✅ No Critical Issues Found"))
         
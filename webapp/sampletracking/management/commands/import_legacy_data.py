@@ -1,19 +1,43 @@
+import os
+
 import pandas as pd
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
 
-from sampletracking.models import Subject, CrudeSample, Aliquot, Extract, SequenceLibrary
-from analysis.id_generator import create_analysis_id
+from sampletracking.jobs import submit_job
+from sampletracking.legacy_import import LegacyImporter, DEFAULT_CHUNK_SIZE
 
 class Command(BaseCommand):
     help = 'Imports legacy sample data from a harmonized TSV file and generates analysis IDs.'
 
     def add_arguments(self, parser):
         parser.add_argument('tsv_file', type=str, help='The path to the harmonized_deidentified_samples.tsv file.')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Number of samples imported and committed per transaction (default: {DEFAULT_CHUNK_SIZE})'
+        )
+        parser.add_argument(
+            '--background',
+            action='store_true',
+            help='Queue the import as a background job for `run_jobs` instead of running it now'
+        )
 
-    @transaction.atomic
     def handle(self, *args, **options):
         tsv_file_path = options['tsv_file']
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be a positive integer.')
+
+        if options['background']:
+            if not os.path.isfile(tsv_file_path):
+                raise CommandError(f'File not found at "{tsv_file_path}".')
+            job = submit_job('import_legacy_data', {
+                'path': os.path.abspath(tsv_file_path), 'chunk_size': chunk_size,
+            })
+            self.stdout.write(self.style.SUCCESS(f'Queued import as job #{job.pk}.'))
+            return
+
         self.stdout.write(self.style.SUCCESS(f'Starting import from "{tsv_file_path}"...'))
 
         try:
@@ -21,85 +45,27 @@ class Command(BaseCommand):
         except FileNotFoundError:
             raise CommandError(f'File not found at "{tsv_file_path}".')
 
+        importer = LegacyImporter(chunk_size=chunk_size, log=self.stdout.write)
+
         # --- Verify required columns ---
-        required_cols = [
-            'subject_id', 'collection_date', 'sample_source', 
-            'sequence_filename', 'Extract Type', 'Analysis Type'
-        ]
-        missing_cols = [col for col in required_cols if col not in df.columns]
+        missing_cols = importer.missing_columns(df)
         if missing_cols:
             raise CommandError(f'The TSV file is missing the following required columns: {", ".join(missing_cols)}')
 
-        # --- Define which analysis types require a SequenceLibrary ---
-        library_required_types = ['WGS', 'WGL', 'MSS', 'MTS', 'CFS']
-
-        # --- Process each row ---
-        for index, row in df.iterrows():
-            self.stdout.write(f"Processing sample {row['sequence_filename']}...")
-
-            # 1. Get or create the Subject
-            subject, created = Subject.objects.get_or_create(subject_id=row['subject_id'])
-            if created:
-                self.stdout.write(f"  Created new Subject: {subject.subject_id}")
-
-            # 2. Create placeholder CrudeSample
-            # We use the unique legacy sequence_filename as the barcode for the placeholder crude sample
-            crude, crude_created = CrudeSample.objects.get_or_create(
-                barcode=row['sequence_filename'],
-                defaults={
-                    'subject': subject,
-                    'collection_date': pd.to_datetime(row['collection_date']).date(),
-                    'sample_source': row['sample_source'],
-                    'date_created': pd.to_datetime(row['collection_date']).date(),
-                }
-            )
-
-            # 3. Create placeholder Aliquot
-            aliquot, aliquot_created = Aliquot.objects.get_or_create(
-                barcode=f"{crude.barcode}-ALIQ01",
-                defaults={
-                    'parent_barcode': crude,
-                    'date_created': crude.date_created,
-                }
-            )
-
-            # 4. Create placeholder Extract
-            extract, extract_created = Extract.objects.get_or_create(
-                barcode=f"{aliquot.barcode}-EXT01",
-                defaults={
-                    'parent': aliquot,
-                    'extract_type': row['Extract Type'],
-                    'date_created': crude.date_created,
-                }
-            )
-
-            # 5. Determine the final analysis-ready object
-            analysis_type = row['Analysis Type']
-            final_object = None
-
-            if analysis_type in library_required_types:
-                # This analysis type requires a SequenceLibrary
-                library, lib_created = SequenceLibrary.objects.get_or_create(
-                    barcode=f"{extract.barcode}-LIB01",
-                    defaults={
-                        'parent': extract,
-                        'analysis_type': analysis_type,
-                        'date_created': crude.date_created,
-                    }
-                )
-                final_object = library
-            else:
-                # This is a terminal extract
-                final_object = extract
-
-            # 6. Generate the final Analysis ID
-            if final_object:
-                new_analysis_id = create_analysis_id(final_object)
-                if new_analysis_id:
-                    self.stdout.write(self.style.SUCCESS(f"  Successfully generated Analysis ID: {new_analysis_id.analysis_id}"))
-                else:
-                    self.stdout.write(self.style.WARNING(f"  Could not generate Analysis ID for {final_object.barcode}. Check prefix mapping."))
-            else:
-                self.stdout.write(self.style.ERROR(f"  Could not determine final object for analysis type '{analysis_type}'."))
-
-        self.stdout.write(self.style.SUCCESS(f'\nImport complete. Processed {len(df)} samples.'))
+        summary = importer.run(df)
+
+        if summary['analysis_ids_skipped']:
+            self.stdout.write(self.style.WARNING(
+                f"  Could not generate Analysis IDs for {summary['analysis_ids_skipped']} samples. Check prefix mapping."
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\nImport complete. Processed {summary['rows']} rows "
+            f"({summary['unique_samples']} unique samples) in {summary['seconds']:.1f}s "
+            f"({summary['rows_per_second']:,.0f} rows/s)."
+        ))
+        self.stdout.write(
+            f"  New crude samples: {summary['crude_samples']}, aliquots: {summary['aliquots']}, "
+            f"extracts: {summary['extracts']}, libraries: {summary['libraries']}, "
+            f"analysis IDs: {summary['analysis_ids']}"
+        )
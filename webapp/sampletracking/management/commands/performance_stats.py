@@ -0,0 +1,60 @@
+"""
+Dump the per-view request statistics recorded by PerformanceMiddleware.
+Usage: python manage.py performance_stats [--json] [--limit N]
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sampletracking.perf import PERF_STATS_DIR, PERF_WINDOW_MINUTES, collect_stats, summarize
+
+
+def _format(value, suffix=''):
+    return '-' if value is None else f"{value:,.1f}{suffix}" if isinstance(value, float) else f"{value:,}{suffix}"
+
+
+class Command(BaseCommand):
+    help = 'Show request timings, query counts and response sizes per view, slowest first'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the merged histograms as JSON'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Number of views to show (default: 20)'
+        )
+
+    def handle(self, *args, **options):
+        if options['limit'] < 1:
+            raise CommandError('--limit must be a positive integer.')
+
+        stats = collect_stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        rows = summarize(stats)
+        if not rows:
+            self.stdout.write(f"No requests recorded in the last {PERF_WINDOW_MINUTES} minutes (looked in {PERF_STATS_DIR}).")
+            return
+
+        self.stdout.write(f"📈 Request performance - last {PERF_WINDOW_MINUTES} minutes")
+        self.stdout.write("=" * 50)
+        for row in rows[:options['limit']]:
+            self.stdout.write(f"  • {row['view']} ({row['requests']:,} requests)")
+            self.stdout.write(
+                f"      wall p50/p95/p99/max: {_format(row['p50_ms'])} / {_format(row['p95_ms'])} / "
+                f"{_format(row['p99_ms'])} / {_format(row['max_ms'])} ms"
+            )
+            self.stdout.write(
+                f"      queries avg/max: {_format(row['avg_queries'])} / {_format(row['max_queries'])}, "
+                f"db {_format(row['avg_db_ms'], ' ms')}, templates {_format(row['avg_template_ms'], ' ms')}, "
+                f"size {_format(row['avg_response_bytes'], ' B')}"
+            )
+        if len(rows) > options['limit']:
+            self.stdout.write(f"  ... and {len(rows) - options['limit']} more views")
@@ -0,0 +1,19 @@
+"""
+Rebuild the barcode registry from the sample and plate tables.
+Usage: python manage.py rebuild_barcode_registry
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sampletracking.barcodes import rebuild_barcode_registry
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the barcode registry used for barcode scans and lookups'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = rebuild_barcode_registry()
+        for model, count in counts.items():
+            self.stdout.write(f"  • {model._meta.verbose_name_plural}: {count:,} barcodes")
+        self.stdout.write(self.style.SUCCESS('Barcode registry rebuilt.'))
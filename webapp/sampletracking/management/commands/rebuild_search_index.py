@@ -0,0 +1,19 @@
+"""
+Rebuild the sample search index from the sample tables.
+Usage: python manage.py rebuild_search_index
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sampletracking.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text sample search index'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = rebuild_search_index()
+        for model, count in counts.items():
+            self.stdout.write(f"  • {model._meta.verbose_name_plural}: {count:,} documents")
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,36 @@
+"""
+Backfill or repair the denormalized root_crude_barcode and root_subject_id
+columns on aliquots, extracts and sequence libraries.
+Usage: python manage.py repair_lineage [--dry-run] [--batch-size N]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from sampletracking.lineage import REPAIR_BATCH_SIZE, repair_lineage
+
+
+class Command(BaseCommand):
+    help = 'Recompute the root subject ID and crude barcode columns from each sample\'s parent'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=REPAIR_BATCH_SIZE,
+            help=f'Number of rows updated per statement (default: {REPAIR_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many rows are out of sync'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive integer.')
+
+        counts = repair_lineage(dry_run=options['dry_run'], batch_size=options['batch_size'])
+        verb = 'out of sync' if options['dry_run'] else 'repaired'
+        for model, count in counts.items():
+            self.stdout.write(f"  • {model._meta.verbose_name_plural}: {count:,} {verb}")
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Lineage repair complete. {sum(counts.values()):,} rows updated."))
@@ -0,0 +1,122 @@
+"""
+Run queued background jobs (reports, legacy imports, security audits).
+Usage: python manage.py run_jobs [--workers N] [--once] [--poll SECONDS]
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from sampletracking.jobs import (
+    JOB_POLL_INTERVAL,
+    JOB_WORKERS,
+    claim_next_job,
+    init_worker,
+    run_job,
+    run_job_in_worker,
+)
+from sampletracking.models import Job
+from sampletracking.reports import expire_reports
+
+# Seconds between sweeps of expired report files while the worker runs
+REPORT_SWEEP_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    help = 'Execute queued background jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=JOB_WORKERS,
+            help=f'Number of worker processes; 0 runs jobs in this process (default: {JOB_WORKERS})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs'
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=JOB_POLL_INTERVAL,
+            help=f'Seconds between queue checks while idle (default: {JOB_POLL_INTERVAL})'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 0:
+            raise CommandError('--workers must not be negative.')
+        if options['poll'] <= 0:
+            raise CommandError('--poll must be positive.')
+
+        self.last_sweep = None
+        if options['workers'] == 0:
+            finished = self.run_inline(options['once'], options['poll'])
+        else:
+            finished = self.run_pool(options['workers'], options['once'], options['poll'])
+        self.stdout.write(self.style.SUCCESS(f"Job worker stopped. {finished} jobs run."))
+
+    def report(self, pk, status):
+        job = Job.objects.get(pk=pk)
+        style = self.style.SUCCESS if status == Job.DONE else self.style.ERROR
+        self.stdout.write(style(f"  • {job}"))
+
+    def sweep_reports(self):
+        """Delete expired report files, at most once per REPORT_SWEEP_INTERVAL."""
+        now = time.monotonic()
+        if self.last_sweep is None or now - self.last_sweep >= REPORT_SWEEP_INTERVAL:
+            self.last_sweep = now
+            expire_reports()
+
+    def run_inline(self, once, poll):
+        finished = 0
+        while True:
+            pk = claim_next_job()
+            if pk is None:
+                self.sweep_reports()
+                if once:
+                    return finished
+                time.sleep(poll)
+                continue
+            self.report(pk, run_job(pk))
+            finished += 1
+
+    def run_pool(self, workers, once, poll):
+        finished = 0
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            running = {}
+            try:
+                while True:
+                    while len(running) < workers:
+                        pk = claim_next_job()
+                        if pk is None:
+                            break
+                        running[pool.submit(run_job_in_worker, pk)] = pk
+                    if not running:
+                        self.sweep_reports()
+                        if once:
+                            return finished
+                        time.sleep(poll)
+                        continue
+                    done, _ = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pk = running.pop(future)
+                        try:
+                            status = future.result()
+                        except Exception as e:
+                            # The worker process died before recording the outcome
+                            Job.objects.filter(pk=pk).update(
+                                status=Job.FAILED, error=str(e), finished_at=timezone.now(),
+                            )
+                            status = Job.FAILED
+                        self.report(pk, status)
+                        finished += 1
+            except KeyboardInterrupt:
+                self.stdout.write(f"Interrupted; waiting for {len(running)} running jobs to finish.")
+                wait(running)
+                return finished + len(running)
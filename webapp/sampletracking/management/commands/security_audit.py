@@ -10,6 +10,8 @@ from django.utils import timezone
 from datetime import timedelta
 import logging
 
+from sampletracking.near_duplicates import MAX_BARCODE_DISTANCE, near_duplicate_clusters
+
 logger = logging.getLogger('security')
 
 class Command(BaseCommand):
@@ -27,11 +29,22 @@ class Command(BaseCommand):
             type=str,
             help='Save report to file'
         )
+        parser.add_argument(
+            '--background',
+            action='store_true',
+            help='Queue the audit as a background job for `run_jobs` instead of running it now'
+        )
     
     def handle(self, *args, **options):
         days = options['days']
         report_file = options.get('report_file')
         
+        if options.get('background'):
+            from sampletracking.jobs import submit_job
+            job = submit_job('security_audit', {'days': days})
+            self.stdout.write(self.style.SUCCESS(f"Queued security audit as job #{job.pk}."))
+            return
+        
         self.stdout.write(f"🔍 Security Audit Report - Last {days} days")
         self.stdout.write("=" * 50)
         
@@ -120,35 +133,26 @@ class Command(BaseCommand):
         report_lines.append("\n🔢 Barcode Pattern Audit")
         report_lines.append("-" * 30)
         
-        cutoff_date = timezone.now() - timedelta(days=days)
-        
-        # Check for barcode overrides
-        override_samples = CrudeSample.objects.filter(
-            barcode_override_used=True,
-            created_at__gte=cutoff_date
-        )
-        
-        report_lines.append(f"Samples with barcode overrides: {override_samples.count()}")
-        if override_samples.exists():
-            report_lines.append("⚠️  Recent barcode overrides:")
-            for sample in override_samples[:5]:
-                report_lines.append(f"  - {sample.barcode} by {sample.created_by}")
-        
-        # Check for duplicate-like barcodes
+        # Check for near-duplicate barcodes (likely typos or misreads)
         all_models = [CrudeSample, Aliquot, Extract, SequenceLibrary]
-        similar_barcodes = []
+        similar_clusters = []
         
         for model in all_models:
-            barcodes = model.objects.values_list('barcode', flat=True)
-            for i, barcode1 in enumerate(barcodes):
-                for barcode2 in list(barcodes)[i+1:]:
-                    if self.are_similar_barcodes(barcode1, barcode2):
-                        similar_barcodes.append((barcode1, barcode2))
-        
-        if similar_barcodes:
-            report_lines.append("⚠️  Similar barcodes found:")
-            for bc1, bc2 in similar_barcodes[:5]:
-                report_lines.append(f"  - {bc1} / {bc2}")
+            barcodes = model.objects.values_list('barcode', flat=True).iterator(chunk_size=10000)
+            clusters = near_duplicate_clusters(barcodes)
+            similar_clusters.extend((model, cluster) for cluster in clusters)
+            report_lines.append(
+                f"{model._meta.verbose_name_plural}: {len(clusters)} near-duplicate clusters "
+                f"({sum(len(cluster) for cluster in clusters)} barcodes)"
+            )
+        
+        if similar_clusters:
+            report_lines.append(f"⚠️  Similar barcodes found (within {MAX_BARCODE_DISTANCE} characters):")
+            similar_clusters.sort(key=lambda item: -len(item[1]))
+            for model, cluster in similar_clusters[:5]:
+                shown = ', '.join(cluster[:5])
+                more = f" ... and {len(cluster) - 5} more" if len(cluster) > 5 else ""
+                report_lines.append(f"  - {model._meta.verbose_name}: {shown}{more}")
     
     def audit_login_attempts(self, report_lines, days):
         """Audit login attempts from logs"""
@@ -207,15 +211,3 @@ class Command(BaseCommand):
         
         for rec in recommendations:
             report_lines.append(f"  {rec}")
-    
-    def are_similar_barcodes(self, bc1, bc2):
-        """Check if two barcodes are suspiciously similar"""
-        if len(bc1) != len(bc2):
-            return False
-        
-        if len(bc1) < 3:
-            return False
-        
-        # Check if they differ by only 1-2 characters
-        differences = sum(c1 != c2 for c1, c2 in zip(bc1, bc2))
-        return 1 <= differences <= 2
@@ -5,18 +5,28 @@ Provides additional security layers including:
 - Suspicious activity detection
 - Security headers
 - Audit logging
+It also provides request performance instrumentation.
 """
 
 import time
 import logging
-from collections import defaultdict
-from django.http import HttpResponseTooManyRequests, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
 from django.contrib.auth import logout
-from django.core.cache import cache
+from django.db import connection
+
+from .patterns import is_suspicious
+from .perf import RequestTimer, current_timer, install_template_timer, performance_stats
+from .ratelimit import SlidingWindowRateLimiter, get_backend, rate_limit_cache
 
 logger = logging.getLogger('security')
+perf_logger = logging.getLogger('sampletracking')
+
+
+class HttpResponseTooManyRequests(HttpResponse):
+    status_code = 429
+
 
 class SecurityMiddleware(MiddlewareMixin):
     """
@@ -24,15 +34,22 @@ class SecurityMiddleware(MiddlewareMixin):
     """
     
     def __init__(self, get_response):
-        self.get_response = get_response
-        self.request_counts = defaultdict(list)
-        self.blocked_ips = set()
+        super().__init__(get_response)
         
         # Rate limiting settings
         self.max_requests_per_minute = getattr(settings, 'MAX_REQUESTS_PER_MINUTE', 60)
         self.max_requests_per_hour = getattr(settings, 'MAX_REQUESTS_PER_HOUR', 1000)
         self.block_duration = getattr(settings, 'IP_BLOCK_DURATION', 3600)  # 1 hour
         
+        # Counters and IP blocks are shared by every worker through the rate
+        # limit cache, so a block holds in every worker process
+        self.block_cache = rate_limit_cache()
+        backend = get_backend()
+        self.rate_limiters = [
+            SlidingWindowRateLimiter('minute', self.max_requests_per_minute, 60, backend),
+            SlidingWindowRateLimiter('hour', self.max_requests_per_hour, 3600, backend),
+        ]
+        
     def process_request(self, request):
         """
         Process incoming requests for security threats
@@ -74,52 +91,22 @@ class SecurityMiddleware(MiddlewareMixin):
     
     def is_rate_limited(self, ip, current_time):
         """
-        Check if the IP has exceeded rate limits
+        Count the request and check if the IP has exceeded rate limits
         """
-        # Clean old entries
-        self.request_counts[ip] = [
-            timestamp for timestamp in self.request_counts[ip]
-            if current_time - timestamp < 3600  # Keep last hour
-        ]
-        
-        # Add current request
-        self.request_counts[ip].append(current_time)
-        
-        # Check minute limit
-        minute_requests = sum(
-            1 for timestamp in self.request_counts[ip]
-            if current_time - timestamp < 60
-        )
-        
-        # Check hour limit
-        hour_requests = len(self.request_counts[ip])
-        
-        return (minute_requests > self.max_requests_per_minute or 
-                hour_requests > self.max_requests_per_hour)
+        # Count the request against every limit, even once one is exceeded
+        limited = [limiter.hit(ip, current_time) for limiter in self.rate_limiters]
+        return any(limited)
     
     def detect_suspicious_activity(self, request):
         """
         Detect various types of suspicious activity
         """
         # Check for common attack patterns in URLs
-        suspicious_url_patterns = [
-            '../', '..\\', 'etc/passwd', 'cmd.exe', 'shell',
-            '<script', 'javascript:', 'php', '.jsp', '.asp',
-            'union select', 'drop table', '1=1', 'or 1=1'
-        ]
-        
-        full_path = request.get_full_path().lower()
-        if any(pattern in full_path for pattern in suspicious_url_patterns):
+        if is_suspicious(request.get_full_path(), 'url'):
             return True
         
         # Check User-Agent for suspicious patterns
-        user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
-        suspicious_agents = [
-            'sqlmap', 'nmap', 'nikto', 'burp', 'dirbuster',
-            'wget', 'curl', 'python-requests', 'scanner'
-        ]
-        
-        if any(agent in user_agent for agent in suspicious_agents):
+        if is_suspicious(request.META.get('HTTP_USER_AGENT', ''), 'user_agent'):
             return True
         
         # Check for excessive POST data
@@ -129,12 +116,10 @@ class SecurityMiddleware(MiddlewareMixin):
                 return True
         
         # Check for suspicious headers
-        suspicious_headers = ['x-forwarded-host', 'x-real-ip']
+        suspicious_headers = ['HTTP_X_FORWARDED_HOST', 'HTTP_X_REAL_IP']
         for header in suspicious_headers:
-            if header in request.META:
-                value = request.META[header].lower()
-                if any(pattern in value for pattern in suspicious_url_patterns):
-                    return True
+            if header in request.META and is_suspicious(request.META[header], 'url'):
+                return True
         
         return False
     
@@ -142,13 +127,13 @@ class SecurityMiddleware(MiddlewareMixin):
         """
         Check if an IP is currently blocked
         """
-        return cache.get(f"blocked_ip_{ip}", False)
+        return self.block_cache.get(f"blocked_ip_{ip}", False)
     
     def block_ip(self, ip):
         """
         Block an IP address for a specified duration
         """
-        cache.set(f"blocked_ip_{ip}", True, self.block_duration)
+        self.block_cache.set(f"blocked_ip_{ip}", True, self.block_duration)
         logger.critical(f"IP blocked for {self.block_duration} seconds: {ip}")
     
     def log_security_events(self, request):
@@ -245,3 +230,70 @@ class SessionSecurityMiddleware(MiddlewareMixin):
         else:
             ip = request.META.get('REMOTE_ADDR')
         return ip
+
+class PerformanceMiddleware:
+    """
+    Record per-view wall time, database queries and time, template render
+    time and response size (see perf.py). Install it first in MIDDLEWARE so
+    it measures the whole request. Requests running more queries than the
+    QUERY_BUDGET setting, if set, are logged.
+
+    A streaming response is measured until its body has been sent (or the
+    client went away), so exports and report downloads count the queries,
+    time and bytes of producing the body too.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.query_budget = getattr(settings, 'QUERY_BUDGET', None)
+        install_template_timer()
+    
+    def __call__(self, request):
+        timer = RequestTimer()
+        token = current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timer):
+                response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        
+        if not response.streaming:
+            self.record(request, timer, started, len(response.content))
+        elif getattr(response, 'is_async', False):
+            # Async bodies are sent outside this thread; record what is known now
+            size = int(response['Content-Length']) if response.has_header('Content-Length') else None
+            self.record(request, timer, started, size)
+        else:
+            response.streaming_content = self.measure_stream(request, response.streaming_content, timer, started)
+        return response
+    
+    def measure_stream(self, request, content, timer, started):
+        """Yield the chunks of a streaming body, recording the request once it is exhausted or closed."""
+        size = 0
+        try:
+            with connection.execute_wrapper(timer):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.record(request, timer, started, size)
+    
+    def record(self, request, timer, started, size):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        if self.query_budget is not None and timer.queries > self.query_budget:
+            perf_logger.warning(
+                f"Query budget exceeded: {view} ran {timer.queries} queries "
+                f"(budget {self.query_budget}) for {request.get_full_path()}"
+            )
+        now = time.time()
+        performance_stats.record(view, {
+            'wall_ms': elapsed * 1000,
+            'queries': timer.queries,
+            'db_ms': timer.db_seconds * 1000,
+            'template_ms': timer.template_seconds * 1000,
+            'response_bytes': size,
+        }, now)
+        performance_stats.maybe_flush(now)
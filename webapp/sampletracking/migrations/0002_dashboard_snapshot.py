@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:48
+
+from django.db import migrations, models
+from django.db.models import Case, CharField, Count, F, Value, When
+from django.db.models.functions import TruncDate
+
+EMPTY = Value('', output_field=CharField())
+
+
+def snapshot_dimensions(name):
+    """The (date, status, category, bucket) of stats.snapshot_dimensions, by model name."""
+    if name == 'Plate':
+        return TruncDate('created_at'), EMPTY, F('plate_type'), EMPTY
+    category = {
+        'CrudeSample': F('sample_source'),
+        'Extract': F('extract_type'),
+        'SequenceLibrary': F('library_type'),
+    }.get(name, EMPTY)
+    bucket = {
+        'Extract': Case(
+            When(quality_score__gte=80, then=Value('high')),
+            When(quality_score__gte=60, then=Value('medium')),
+            When(quality_score__lt=60, then=Value('low')),
+            default=EMPTY,
+            output_field=CharField(),
+        ),
+        'SequenceLibrary': Case(
+            When(date_sequenced__isnull=False, then=Value('sequenced')),
+            default=Value('pending'),
+            output_field=CharField(),
+        ),
+    }.get(name, EMPTY)
+    return F('date_created'), F('status'), category, bucket
+
+
+def populate_snapshot(apps, schema_editor):
+    DashboardSnapshot = apps.get_model('sampletracking', 'DashboardSnapshot')
+    for name in ('CrudeSample', 'Aliquot', 'Extract', 'SequenceLibrary', 'Plate'):
+        model = apps.get_model('sampletracking', name)
+        date, status, category, bucket = snapshot_dimensions(name)
+        groups = (
+            model.objects.annotate(snap_date=date, snap_status=status, snap_category=category, snap_bucket=bucket)
+            .order_by()
+            .values('snap_date', 'snap_status', 'snap_category', 'snap_bucket')
+            .annotate(count=Count('pk'))
+        )
+        DashboardSnapshot.objects.bulk_create([
+            DashboardSnapshot(
+                model_name=name.lower(),
+                date=group['snap_date'],
+                status=group['snap_status'] or '',
+                category=group['snap_category'] or '',
+                bucket=group['snap_bucket'] or '',
+                count=group['count'],
+            )
+            for group in groups
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sampletracking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=50)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('status', models.CharField(blank=True, default='', max_length=20)),
+                ('category', models.CharField(blank=True, default='', max_length=100)),
+                ('bucket', models.CharField(blank=True, default='', max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Dashboard Snapshot',
+                'verbose_name_plural': 'Dashboard Snapshots',
+                'indexes': [models.Index(fields=['model_name', 'date'], name='sampletrack_model_n_82f498_idx')],
+            },
+        ),
+        migrations.RunPython(populate_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,122 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:50
+
+from django.db import migrations, models
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE sampletracking_search_fts USING fts5(
+        barcode, subject_id, sample_type, notes, tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER sampletracking_search_ai AFTER INSERT ON sampletracking_samplesearchdocument BEGIN
+        INSERT INTO sampletracking_search_fts(rowid, barcode, subject_id, sample_type, notes)
+        VALUES (new.id, new.barcode,
+                CASE WHEN new.model_name = 'crudesample' THEN new.subject_id ELSE '' END,
+                new.sample_type, new.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER sampletracking_search_ad AFTER DELETE ON sampletracking_samplesearchdocument BEGIN
+        DELETE FROM sampletracking_search_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER sampletracking_search_au AFTER UPDATE ON sampletracking_samplesearchdocument BEGIN
+        DELETE FROM sampletracking_search_fts WHERE rowid = old.id;
+        INSERT INTO sampletracking_search_fts(rowid, barcode, subject_id, sample_type, notes)
+        VALUES (new.id, new.barcode,
+                CASE WHEN new.model_name = 'crudesample' THEN new.subject_id ELSE '' END,
+                new.sample_type, new.notes);
+    END
+    """,
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS sampletracking_search_au",
+    "DROP TRIGGER IF EXISTS sampletracking_search_ad",
+    "DROP TRIGGER IF EXISTS sampletracking_search_ai",
+    "DROP TABLE IF EXISTS sampletracking_search_fts",
+]
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX sampletracking_search_barcode_trgm ON sampletracking_samplesearchdocument USING gin (barcode gin_trgm_ops)",
+    "CREATE INDEX sampletracking_search_subject_trgm ON sampletracking_samplesearchdocument USING gin (subject_id gin_trgm_ops)",
+    "CREATE INDEX sampletracking_search_type_trgm ON sampletracking_samplesearchdocument USING gin (sample_type gin_trgm_ops)",
+    "CREATE INDEX sampletracking_search_notes_trgm ON sampletracking_samplesearchdocument USING gin (notes gin_trgm_ops)",
+]
+
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS sampletracking_search_notes_trgm",
+    "DROP INDEX IF EXISTS sampletracking_search_type_trgm",
+    "DROP INDEX IF EXISTS sampletracking_search_subject_trgm",
+    "DROP INDEX IF EXISTS sampletracking_search_barcode_trgm",
+]
+
+
+def run_vendor_sql(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+# model name -> (root subject ID lookup, type field) at this point in history
+INDEXED_MODELS = {
+    'CrudeSample': ('subject_id', None),
+    'Aliquot': ('parent_barcode__subject_id', None),
+    'Extract': ('parent__parent_barcode__subject_id', 'extract_type'),
+    'SequenceLibrary': ('parent__parent__parent_barcode__subject_id', 'library_type'),
+}
+
+
+def populate_index(apps, schema_editor):
+    SampleSearchDocument = apps.get_model('sampletracking', 'SampleSearchDocument')
+    for name, (subject_lookup, type_field) in INDEXED_MODELS.items():
+        model = apps.get_model('sampletracking', name)
+        fields = ['pk', 'barcode', subject_lookup, 'notes', 'date_created'] + ([type_field] if type_field else [])
+        documents = [
+            SampleSearchDocument(
+                model_name=name.lower(), object_id=pk, barcode=barcode, subject_id=subject_id or '',
+                sample_type=(sample_type[0] or '') if sample_type else '', notes=notes or '', date=date_created,
+            )
+            for pk, barcode, subject_id, notes, date_created, *sample_type
+            in model.objects.values_list(*fields).iterator(chunk_size=2000)
+        ]
+        SampleSearchDocument.objects.bulk_create(documents, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sampletracking', '0002_dashboard_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SampleSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=50)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('barcode', models.CharField(max_length=255)),
+                ('subject_id', models.CharField(blank=True, default='', max_length=50)),
+                ('sample_type', models.CharField(blank=True, default='', max_length=100)),
+                ('notes', models.TextField(blank=True, default='')),
+                ('date', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Sample Search Document',
+                'verbose_name_plural': 'Sample Search Documents',
+                'indexes': [models.Index(fields=['date'], name='sampletrack_date_a8fac8_idx')],
+                'unique_together': {('model_name', 'object_id')},
+            },
+        ),
+        migrations.RunPython(
+            run_vendor_sql({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run_vendor_sql({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE}),
+        ),
+        # After the triggers, so the FTS table is filled too
+        migrations.RunPython(populate_index, migrations.RunPython.noop),
+    ]
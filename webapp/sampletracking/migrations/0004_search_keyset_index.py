@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sampletracking', '0003_sample_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='samplesearchdocument',
+            name='sampletrack_date_a8fac8_idx',
+        ),
+        migrations.AddIndex(
+            model_name='samplesearchdocument',
+            index=models.Index(fields=['date', 'model_name', 'id'], name='sampletrack_date_795156_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:56
+
+from django.db import migrations, models
+
+REGISTERED_MODELS = ['CrudeSample', 'Aliquot', 'Extract', 'SequenceLibrary', 'Plate']
+
+# Lets LIKE 'prefix%' use a btree index regardless of the database collation
+POSTGRESQL_FORWARD = [
+    "CREATE INDEX sampletracking_barcode_prefix ON sampletracking_barcoderegistry (barcode varchar_pattern_ops)",
+]
+
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS sampletracking_barcode_prefix",
+]
+
+
+def run_vendor_sql(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+def populate_registry(apps, schema_editor):
+    BarcodeRegistry = apps.get_model('sampletracking', 'BarcodeRegistry')
+    for name in REGISTERED_MODELS:
+        model = apps.get_model('sampletracking', name)
+        entries = [
+            BarcodeRegistry(barcode=barcode, model_name=name.lower(), object_id=pk)
+            for pk, barcode in model.objects.values_list('pk', 'barcode').iterator(chunk_size=2000)
+        ]
+        BarcodeRegistry.objects.bulk_create(entries, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sampletracking', '0004_search_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarcodeRegistry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(max_length=255)),
+                ('model_name', models.CharField(max_length=50)),
+                ('object_id', models.PositiveBigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Barcode Registry Entry',
+                'verbose_name_plural': 'Barcode Registry',
+                'indexes': [models.Index(fields=['barcode', 'model_name'], name='sampletrack_barcode_59a9ea_idx')],
+                'unique_together': {('model_name', 'object_id')},
+            },
+        ),
+        migrations.RunPython(
+            run_vendor_sql({'postgresql': POSTGRESQL_FORWARD}),
+            run_vendor_sql({'postgresql': POSTGRESQL_REVERSE}),
+        ),
+        migrations.RunPython(populate_registry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def backfill_lineage(apps, schema_editor):
+    """Fill the root columns level by level, parents first."""
+    CrudeSample = apps.get_model('sampletracking', 'CrudeSample')
+    Aliquot = apps.get_model('sampletracking', 'Aliquot')
+    Extract = apps.get_model('sampletracking', 'Extract')
+    SequenceLibrary = apps.get_model('sampletracking', 'SequenceLibrary')
+
+    crude = CrudeSample.objects.filter(barcode=OuterRef('parent_barcode_id'))
+    Aliquot.objects.update(
+        root_crude_barcode=F('parent_barcode_id'),
+        root_subject_id=Subquery(crude.values('subject_id')[:1]),
+    )
+    for model, parent in (
+        (Extract, Aliquot.objects.filter(barcode=OuterRef('parent_id'))),
+        (SequenceLibrary, Extract.objects.filter(pk=OuterRef('parent_id'))),
+    ):
+        model.objects.update(
+            root_crude_barcode=Subquery(parent.values('root_crude_barcode')[:1]),
+            root_subject_id=Subquery(parent.values('root_subject_id')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sampletracking', '0005_barcode_registry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aliquot',
+            name='root_crude_barcode',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Barcode of the crude sample at the root of this lineage', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='aliquot',
+            name='root_subject_id',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Subject ID of the crude sample at the root of this lineage', max_length=50, verbose_name='Subject ID'),
+        ),
+        migrations.AddField(
+            model_name='extract',
+            name='root_crude_barcode',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Barcode of the crude sample at the root of this lineage', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='extract',
+            name='root_subject_id',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Subject ID of the crude sample at the root of this lineage', max_length=50, verbose_name='Subject ID'),
+        ),
+        migrations.AddField(
+            model_name='historicalaliquot',
+            name='root_crude_barcode',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Barcode of the crude sample at the root of this lineage', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='historicalaliquot',
+            name='root_subject_id',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Subject ID of the crude sample at the root of this lineage', max_length=50, verbose_name='Subject ID'),
+        ),
+        migrations.AddField(
+            model_name='historicalextract',
+            name='root_crude_barcode',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Barcode of the crude sample at the root of this lineage', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='historicalextract',
+            name='root_subject_id',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Subject ID of the crude sample at the root of this lineage', max_length=50, verbose_name='Subject ID'),
+        ),
+        migrations.AddField(
+            model_name='historicalsequencelibrary',
+            name='root_crude_barcode',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Barcode of the crude sample at the root of this lineage', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='historicalsequencelibrary',
+            name='root_subject_id',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Subject ID of the crude sample at the root of this lineage', max_length=50, verbose_name='Subject ID'),
+        ),
+        migrations.AddField(
+            model_name='sequencelibrary',
+            name='root_crude_barcode',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Barcode of the crude sample at the root of this lineage', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='sequencelibrary',
+            name='root_subject_id',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Subject ID of the crude sample at the root of this lineage', max_length=50, verbose_name='Subject ID'),
+        ),
+        migrations.AddIndex(
+            model_name='aliquot',
+            index=models.Index(fields=['root_subject_id'], name='sampletrack_root_su_87bc68_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aliquot',
+            index=models.Index(fields=['root_crude_barcode'], name='sampletrack_root_cr_8f6aa8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='extract',
+            index=models.Index(fields=['root_subject_id'], name='sampletrack_root_su_e79750_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='extract',
+            index=models.Index(fields=['root_crude_barcode'], name='sampletrack_root_cr_e7cc29_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sequencelibrary',
+            index=models.Index(fields=['root_subject_id'], name='sampletrack_root_su_28f75c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sequencelibrary',
+            index=models.Index(fields=['root_crude_barcode'], name='sampletrack_root_cr_b4d97b_idx'),
+        ),
+        migrations.RunPython(backfill_lineage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:02
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+populate_snapshot = import_module('sampletracking.migrations.0002_dashboard_snapshot').populate_snapshot
+
+
+def rebuild_snapshot(apps, schema_editor):
+    """Drop rows doubled by concurrent refreshes before the constraint is added."""
+    apps.get_model('sampletracking', 'DashboardSnapshot').objects.all().delete()
+    populate_snapshot(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sampletracking', '0008_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_snapshot, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dashboardsnapshot',
+            constraint=models.UniqueConstraint(
+                fields=('model_name', 'date', 'status', 'category', 'bucket'),
+                name='unique_dashboard_snapshot_row',
+            ),
+        ),
+    ]
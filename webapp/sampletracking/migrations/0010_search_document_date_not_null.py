@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:40
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_index = import_module('sampletracking.migrations.0003_sample_search_index')
+
+# The triggers that keep the FTS5 table in sync (everything after its CREATE)
+SQLITE_TRIGGERS = search_index.SQLITE_FORWARD[1:]
+SQLITE_DROP_TRIGGERS = search_index.SQLITE_REVERSE[:3]
+
+recreate_triggers = search_index.run_vendor_sql({'sqlite': SQLITE_DROP_TRIGGERS + SQLITE_TRIGGERS})
+
+
+def fill_missing_dates(apps, schema_editor):
+    """Copy date_created into any document indexed without a date."""
+    SampleSearchDocument = apps.get_model('sampletracking', 'SampleSearchDocument')
+    missing = SampleSearchDocument.objects.filter(date__isnull=True)
+    for name in search_index.INDEXED_MODELS:
+        model = apps.get_model('sampletracking', name)
+        dates = dict(
+            model.objects.filter(
+                pk__in=missing.filter(model_name=name.lower()).values('object_id'),
+            ).values_list('pk', 'date_created')
+        )
+        for document in missing.filter(model_name=name.lower(), object_id__in=dates):
+            document.date = dates[document.object_id]
+            document.save(update_fields=['date'])
+    # Left over from deleted samples
+    missing.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sampletracking', '0009_dashboard_snapshot_unique_row'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_missing_dates, migrations.RunPython.noop),
+        # SQLite alters a column by rebuilding the table, which drops its
+        # triggers, so they are recreated after the AlterField both ways
+        migrations.RunPython(migrations.RunPython.noop, recreate_triggers),
+        migrations.AlterField(
+            model_name='samplesearchdocument',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.RunPython(recreate_triggers, migrations.RunPython.noop),
+    ]
@@ -14,6 +14,28 @@ class TimeStampedModel(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="%(class)s_created")
     updated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="%(class)s_updated")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored values, so signal handlers can tell what a save changes
+        # without reading the row again (see signals.remember_previous_state)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        saved = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+            and (update_fields is None or field.name in update_fields or field.attname in update_fields)
+        }
+        if update_fields is None:
+            self._loaded_values = saved
+        else:
+            self._loaded_values = {**getattr(self, '_loaded_values', {}), **saved}
+
     class Meta:
         abstract = True
 
@@ -147,10 +169,61 @@ class CrudeSample(Sample):
         ]
 
 
-class Aliquot(Sample):
+class DerivedSample(Sample):
+    """
+    Abstract base class for samples derived from a crude sample.
+
+    Carries denormalized copies of the root crude sample's barcode and
+    subject ID, so subject-scoped queries need no joins up the lineage.
+    They are copied from the parent on save; see lineage.py for how
+    changes are propagated down and for the repair command.
+    """
+    # Name of the foreign key to the direct parent sample
+    lineage_parent_field = None
+
+    root_crude_barcode = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Barcode of the crude sample at the root of this lineage"
+    )
+    root_subject_id = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name="Subject ID",
+        help_text="Subject ID of the crude sample at the root of this lineage"
+    )
+
+    def inherit_lineage(self):
+        """Copy the root crude barcode and subject ID from the parent."""
+        if getattr(self, f'{self.lineage_parent_field}_id') is None:
+            # Orphans are left for the database's NOT NULL constraint to reject
+            return
+        parent = getattr(self, self.lineage_parent_field)
+        if isinstance(parent, CrudeSample):
+            self.root_crude_barcode = parent.barcode
+            self.root_subject_id = parent.subject_id
+        else:
+            self.root_crude_barcode = parent.root_crude_barcode
+            self.root_subject_id = parent.root_subject_id
+
+    def save(self, *args, **kwargs):
+        self.inherit_lineage()
+        super().save(*args, **kwargs)
+
+    class Meta(Sample.Meta):
+        abstract = True
+
+
+class Aliquot(DerivedSample):
     """
     Represents an aliquot derived from a crude sample.
     """
+    lineage_parent_field = 'parent_barcode'
+
     parent_barcode = models.ForeignKey(
         CrudeSample, 
         on_delete=models.PROTECT, 
@@ -176,13 +249,17 @@ class Aliquot(Sample):
         verbose_name_plural = "Aliquots"
         indexes = [
             models.Index(fields=['barcode']),
+            models.Index(fields=['root_subject_id']),
+            models.Index(fields=['root_crude_barcode']),
         ]
 
 
-class Extract(Sample):
+class Extract(DerivedSample):
     """
     Represents an extract derived from an aliquot.
     """
+    lineage_parent_field = 'parent'
+
     EXTRACT_CHOICES = [
         ('DNA', 'DNA'),  
         ('RNA', 'RNA'),
@@ -266,7 +343,7 @@ class Extract(Sample):
     )
 
     def __str__(self):
-        return f"{self.barcode} ({self.parent.parent_barcode.subject_id})"
+        return f"{self.barcode} ({self.root_subject_id})"
     
     history = HistoricalRecords()
     
@@ -275,6 +352,8 @@ class Extract(Sample):
         verbose_name_plural = "Extracts"
         indexes = [
             models.Index(fields=['barcode']),
+            models.Index(fields=['root_subject_id']),
+            models.Index(fields=['root_crude_barcode']),
             models.Index(fields=['extract_type']),
         ]
 
@@ -352,10 +431,12 @@ class Plate(TimeStampedModel):
         ordering = ['-created_at']
 
 
-class SequenceLibrary(Sample):
+class SequenceLibrary(DerivedSample):
     """
     Represents a sequencing library derived from an extract.
     """
+    lineage_parent_field = 'parent'
+
     LIBRARY_CHOICES = [
         ('Nextera', 'Nextera'),
         ('SMARTer', 'SMARTer'),
@@ -506,7 +587,155 @@ class SequenceLibrary(Sample):
         unique_together = [['plate', 'well']]
         indexes = [
             models.Index(fields=['barcode']),
+            models.Index(fields=['root_subject_id']),
+            models.Index(fields=['root_crude_barcode']),
             models.Index(fields=['library_type']),
             models.Index(fields=['analysis_type']),
             models.Index(fields=['date_sequenced']),
-        ]
\ No newline at end of file
+        ]
+
+class DashboardSnapshot(models.Model):
+    """
+    Materialized per-day sample counts used by the dashboards.
+
+    Each row counts the samples of one model created on one day with a given
+    status, category (sample source, extract type, library type or plate type)
+    and bucket (extract quality band or library sequencing state). Rows are
+    refreshed incrementally for the days touched by a change; see stats.py.
+    """
+    model_name = models.CharField(max_length=50)
+    date = models.DateField(null=True, blank=True)
+    status = models.CharField(max_length=20, blank=True, default='')
+    category = models.CharField(max_length=100, blank=True, default='')
+    bucket = models.CharField(max_length=20, blank=True, default='')
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.model_name} {self.date} {self.status}/{self.category}/{self.bucket}: {self.count}"
+
+    class Meta:
+        verbose_name = "Dashboard Snapshot"
+        verbose_name_plural = "Dashboard Snapshots"
+        indexes = [
+            models.Index(fields=['model_name', 'date']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['model_name', 'date', 'status', 'category', 'bucket'],
+                name='unique_dashboard_snapshot_row',
+            ),
+        ]
+
+
+class SampleSearchDocument(models.Model):
+    """
+    One searchable document per sample, kept in sync by signal handlers.
+
+    Holds everything the search results page displays, so results can be
+    rendered straight from the index without joining the sample tables.
+    On SQLite an FTS5 table mirrors these rows; on PostgreSQL trigram
+    indexes cover the searchable columns (see migration 0003).
+    """
+    model_name = models.CharField(max_length=50)
+    object_id = models.PositiveBigIntegerField()
+    barcode = models.CharField(max_length=255)
+    subject_id = models.CharField(max_length=50, blank=True, default='')
+    sample_type = models.CharField(max_length=100, blank=True, default='')
+    notes = models.TextField(blank=True, default='')
+    # The sample's date_created; never null, as the keyset cursors rely on it
+    date = models.DateField()
+
+    def __str__(self):
+        return f"{self.model_name}: {self.barcode}"
+
+    class Meta:
+        verbose_name = "Sample Search Document"
+        verbose_name_plural = "Sample Search Documents"
+        unique_together = [['model_name', 'object_id']]
+        indexes = [
+            # Keyset pagination order, see search.SampleSearchResults.page()
+            models.Index(fields=['date', 'model_name', 'id']),
+        ]
+
+
+class BarcodeRegistry(models.Model):
+    """
+    Maps every sample and plate barcode to the record that owns it.
+
+    Lets a scanned barcode be resolved with a single indexed lookup instead
+    of one query per sample table. Kept in sync by signal handlers; see
+    barcodes.py.
+    """
+    barcode = models.CharField(max_length=255)
+    model_name = models.CharField(max_length=50)
+    object_id = models.PositiveBigIntegerField()
+
+    def __str__(self):
+        return f"{self.barcode} -> {self.model_name} #{self.object_id}"
+
+    class Meta:
+        verbose_name = "Barcode Registry Entry"
+        verbose_name_plural = "Barcode Registry"
+        unique_together = [['model_name', 'object_id']]
+        indexes = [
+            models.Index(fields=['barcode', 'model_name']),
+        ]
+
+
+class Job(models.Model):
+    """
+    A unit of background work: a report, legacy import or security audit.
+
+    Jobs are submitted from views or management commands and executed by the
+    `run_jobs` worker command, which records progress and the result here so
+    any web process can poll them; see jobs.py.
+    """
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    params = models.JSONField(default=dict, blank=True)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    message = models.CharField(max_length=255, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True, blank=True,
+        help_text="Last sign of life from the worker running this job"
+    )
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @property
+    def percent(self):
+        """Progress as a whole percentage, or None while the total is unknown."""
+        if not self.total:
+            return None
+        return min(100, self.progress * 100 // self.total)
+
+    class Meta:
+        verbose_name = "Job"
+        verbose_name_plural = "Jobs"
+        indexes = [
+            # Workers claim the oldest pending job, see jobs.claim_next_job()
+            models.Index(fields=['status', 'created_at']),
+        ]
@@ -0,0 +1,200 @@
+"""
+Near-duplicate barcode detection.
+
+Two barcodes are near-duplicates when they have the same length and differ
+in at most MAX_BARCODE_DISTANCE positions (Hamming distance), which usually
+means a mistyped or misread tube. Comparing every pair is quadratic, so
+barcodes are bucketed by length and then by the pigeonhole principle: split
+into max_distance + 1 blocks of columns, two barcodes within the distance
+agree exactly on at least one block. One pass per block groups the barcodes
+by that block's content, and only barcodes in the same group are compared, so
+the number of passes grows with the distance, not with the barcode length.
+
+Structured barcodes (CS001-ALIQ01, CS001-ALIQ02...) share whole blocks, and
+comparing every pair in a group of thousands would be quadratic again. Such
+groups are instead grouped once for every way of blanking out max_distance
+of their other columns: barcodes that agree on everything else are all
+within the distance of each other. That costs one pass per pair of columns,
+but only over the rows of the large groups.
+
+Matches are merged into clusters (connected components) with a vectorized
+union-find. Grouping keys are 64-bit polynomial hashes of the characters;
+every link is checked character by character, so a hash collision can never
+put unrelated barcodes in the same cluster.
+"""
+from itertools import combinations
+
+import numpy as np
+
+MAX_BARCODE_DISTANCE = 2
+
+# Shorter barcodes are all "similar" to each other; they are not checked
+MIN_BARCODE_LENGTH = 3
+
+# Pigeonhole groups up to this size are compared pair by pair; larger ones
+# are grouped by masked columns instead
+MAX_PAIRWISE_GROUP = 32
+
+
+def _hash_weights(length):
+    """Random odd multipliers per position, fixed so results are reproducible."""
+    rng = np.random.default_rng(length)
+    return rng.integers(1, 2 ** 63, size=length, dtype=np.uint64) | np.uint64(1)
+
+
+def _hash_columns(codes, columns, weights):
+    """64-bit hash of every row of `codes` over `columns`, one column at a time."""
+    keys = np.zeros(len(codes), dtype=np.uint64)
+    for column in columns:
+        keys += codes[:, column].astype(np.uint64) * weights[column]
+    return keys
+
+
+def _groups(keys):
+    """
+    Sort `keys`; returns the sorting order and, for every sorted position,
+    the index of its group (runs of equal keys).
+    """
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    group = np.r_[0, np.cumsum(sorted_keys[1:] != sorted_keys[:-1])]
+    return order, group
+
+
+def _compress(labels):
+    """Point every row straight at the root of its label chain."""
+    while True:
+        compressed = labels[labels]
+        if np.array_equal(compressed, labels):
+            return labels
+        labels = compressed
+
+
+def _union(labels, u, v):
+    """
+    Merge the components of every edge (u[i], v[i]). Each label points at a
+    smaller or equal row index; roots point at themselves.
+    """
+    # Hook the larger root of every edge onto the smaller until each edge's
+    # ends share a root; earlier unions are never undone
+    while True:
+        lu, lv = labels[u], labels[v]
+        split = lu != lv
+        if not split.any():
+            return labels
+        np.minimum.at(labels, np.maximum(lu, lv)[split], np.minimum(lu, lv)[split])
+        labels = _compress(labels)
+        u, v = u[split], v[split]
+
+
+def _pairwise_links(codes, order, group, small, max_distance):
+    """
+    Links between rows in the same small group that are within
+    `max_distance`: sorted position p is compared with p + 1, p + 2... as
+    long as both are in the group.
+    """
+    links_u, links_v = [], []
+    for offset in range(1, MAX_PAIRWISE_GROUP):
+        same = (group[offset:] == group[:-offset]) & small[group[:-offset]]
+        if not same.any():
+            break
+        positions = np.flatnonzero(same)
+        u, v = order[positions + offset], order[positions]
+        close = (codes[u] != codes[v]).sum(axis=1) <= max_distance
+        links_u.append(u[close])
+        links_v.append(v[close])
+    return links_u, links_v
+
+
+def _masked_links(codes, rows, masks, weights):
+    """
+    Links among `rows` that differ at most in the columns of one of `masks`:
+    for every mask, rows that agree on all the other columns are linked to
+    the first of them.
+    """
+    links_u, links_v = [], []
+    sub = codes[rows]
+    full = _hash_columns(sub, range(codes.shape[1]), weights)
+    for mask in masks:
+        keys = full - _hash_columns(sub, mask, weights)
+        order, group = _groups(keys)
+        starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        if len(starts) == len(order):
+            continue
+        firsts = np.repeat(order[starts], np.diff(np.r_[starts, len(order)]))
+        members = np.flatnonzero(np.r_[False, group[1:] == group[:-1]])
+        u, v = order[members], firsts[members]
+        keep = [column for column in range(codes.shape[1]) if column not in mask]
+        valid = (sub[u][:, keep] == sub[v][:, keep]).all(axis=1)
+        links_u.append(rows[u[valid]])
+        links_v.append(rows[v[valid]])
+    return links_u, links_v
+
+
+def _components(codes, max_distance):
+    """
+    Label the rows of the (n, length) character matrix `codes` so rows within
+    `max_distance` of each other, directly or through other rows, share a label.
+    """
+    n, length = codes.shape
+    weights = _hash_weights(length)
+    labels = np.arange(n)
+    blocks = np.array_split(np.arange(length), max_distance + 1)
+    # Every mask leaves at least one block untouched; it is only needed in the
+    # pass over the first such block, as pairs that also match an earlier
+    # block were linked in that block's pass
+    masks_by_block = [[] for block in blocks]
+    block_of = np.repeat(np.arange(len(blocks)), [len(block) for block in blocks])
+    for mask in combinations(range(length), max_distance):
+        touched = set(block_of[list(mask)])
+        masks_by_block[min(set(range(len(blocks))) - touched)].append(mask)
+
+    for block, masks in zip(blocks, masks_by_block):
+        order, group = _groups(_hash_columns(codes, block, weights))
+        sizes = np.bincount(group)
+        if sizes.max() < 2:
+            continue
+        small = sizes <= MAX_PAIRWISE_GROUP
+        links_u, links_v = _pairwise_links(codes, order, group, small, max_distance)
+
+        # Rows of large groups: the block matches, so any differences are elsewhere
+        large = order[~small[group]]
+        if len(large):
+            masked_u, masked_v = _masked_links(codes, large, masks, weights)
+            links_u += masked_u
+            links_v += masked_v
+
+        if links_u:
+            labels = _union(labels, np.concatenate(links_u), np.concatenate(links_v))
+    return labels
+
+
+def near_duplicate_clusters(barcodes, max_distance=MAX_BARCODE_DISTANCE):
+    """
+    Group `barcodes` into clusters of near-duplicates.
+
+    Returns a list of clusters, largest first, each a sorted list of at least
+    two barcodes in which every barcode is within `max_distance` substituted
+    characters of some other member.
+    """
+    by_length = {}
+    for barcode in set(barcodes):
+        if barcode and len(barcode) >= max(MIN_BARCODE_LENGTH, max_distance + 1):
+            by_length.setdefault(len(barcode), []).append(barcode)
+
+    clusters = []
+    for length, group in by_length.items():
+        if len(group) < 2:
+            continue
+        group.sort()
+        # Code points as a fixed-width matrix, one row per barcode
+        codes = np.array(group, dtype=f'<U{length}').view(np.uint32).reshape(len(group), length)
+        labels = _components(codes, max_distance)
+        order = np.argsort(labels, kind='stable')
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        for members in np.split(order, starts[1:]):
+            if len(members) > 1:
+                clusters.append([group[i] for i in members])
+    clusters.sort(key=lambda cluster: (-len(cluster), cluster[0]))
+    return clusters
@@ -0,0 +1,89 @@
+"""
+Suspicious input detection.
+
+Request paths, user agents, barcodes and search queries are screened for
+known attack substrings (path traversal, script injection, SQL keywords,
+scanner user agents). Each rule set is compiled once, at import, into a
+single alternation of its lowercased patterns, so screening a string is
+one lowercasing and one regex scan instead of a substring test per pattern.
+(Lowercasing first is markedly faster than a re.IGNORECASE search; see the
+benchmark_patterns command.)
+
+Rule sets can be replaced or extended per deployment with the
+SUSPICIOUS_PATTERNS setting, a {rule set name: [substrings]} dictionary.
+"""
+import re
+
+from django.conf import settings
+
+DEFAULT_SUSPICIOUS_PATTERNS = {
+    # Request paths and forwarded host headers
+    'url': [
+        '../', '..\\', 'etc/passwd', 'cmd.exe', 'shell',
+        '<script', 'javascript:', 'php', '.jsp', '.asp',
+        'union select', 'drop table', '1=1', 'or 1=1',
+    ],
+    # Scanners and scripted clients
+    'user_agent': [
+        'sqlmap', 'nmap', 'nikto', 'burp', 'dirbuster',
+        'wget', 'curl', 'python-requests', 'scanner',
+    ],
+    # Barcodes entered in forms
+    'barcode': [
+        '<script', 'javascript:', 'DROP', 'DELETE', 'INSERT',
+        'UPDATE', 'SELECT', '--', ';', '/*', '*/',
+    ],
+    # Barcodes scanned to find a sample to receive
+    'scanned_barcode': [
+        '<script', 'javascript:', 'DROP', 'DELETE', 'INSERT', 'UPDATE', '--', ';',
+    ],
+    'search': [
+        '<script', 'javascript:', 'DROP TABLE', 'DELETE FROM', 'INSERT INTO', 'UPDATE ', '--', ';',
+    ],
+    # Free-text search forms also reject common probing strings
+    'strict_search': [
+        '<script', 'javascript:', 'DROP TABLE', 'DELETE FROM',
+        'INSERT INTO', 'UPDATE ', 'SELECT * FROM', '--', ';',
+        'UNION SELECT', '1=1', 'OR 1=1', 'XSS', 'SCRIPT',
+    ],
+    # Login names commonly tried by credential-stuffing scripts
+    'username': ['admin', 'root', 'test', 'guest', 'anonymous'],
+    # User-supplied text rendered back into pages
+    'html': ['<script', 'javascript:', 'onclick', 'onerror'],
+}
+
+SUSPICIOUS_PATTERNS = {
+    **DEFAULT_SUSPICIOUS_PATTERNS,
+    **getattr(settings, 'SUSPICIOUS_PATTERNS', {}),
+}
+
+
+class PatternMatcher:
+    """Finds any of a set of literal substrings, ignoring case, in one scan."""
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        # Longest first, so the reported match is the most specific pattern
+        alternatives = sorted({pattern.lower() for pattern in self.patterns}, key=len, reverse=True)
+        self.regex = re.compile('|'.join(map(re.escape, alternatives))) if alternatives else None
+
+    def search(self, text):
+        """Return the first suspicious substring found in `text` (lowercased), or None."""
+        if self.regex is None or not text:
+            return None
+        match = self.regex.search(text.lower())
+        return match.group(0) if match else None
+
+    def matches(self, text):
+        return self.search(text) is not None
+
+    def __repr__(self):
+        return f"<PatternMatcher: {len(self.patterns)} patterns>"
+
+
+MATCHERS = {name: PatternMatcher(patterns) for name, patterns in SUSPICIOUS_PATTERNS.items()}
+
+
+def is_suspicious(text, rule_set):
+    """True when `text` contains any pattern of the named rule set."""
+    return MATCHERS[rule_set].matches(text)
@@ -0,0 +1,287 @@
+"""
+Request performance statistics.
+
+PerformanceMiddleware measures every request (wall time, number of
+database queries and time spent in them, template rendering time and
+response size) and records them per view in rolling histograms: fixed
+buckets, kept per minute for the last PERF_WINDOW_MINUTES minutes, so
+memory stays constant however many requests are served.
+
+Statistics are collected per process. Each process periodically writes a
+snapshot to PERF_STATS_DIR as `<pid>.json`; the staff endpoint and the
+`performance_stats` command merge the snapshots of every process. Live
+processes rewrite theirs every PERF_FLUSH_INTERVAL seconds, so a snapshot
+not written for a whole window belongs to a process that has exited (or
+served nothing since); each flush deletes those.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.template.base import Template
+
+PERF_STATS_DIR = Path(getattr(settings, 'PERF_STATS_DIR', settings.BASE_DIR / 'perf'))
+PERF_WINDOW_MINUTES = getattr(settings, 'PERF_WINDOW_MINUTES', 60)
+PERF_FLUSH_INTERVAL = getattr(settings, 'PERF_FLUSH_INTERVAL', 30)
+
+SLOT_SECONDS = 60
+
+# Upper bucket bounds per metric; larger values fall in a final overflow bucket
+TIME_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+METRIC_BUCKETS = {
+    'wall_ms': TIME_BUCKETS,
+    'db_ms': TIME_BUCKETS,
+    'template_ms': TIME_BUCKETS,
+    'queries': (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+    'response_bytes': (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+}
+
+
+class RollingHistogram:
+    """
+    Bucketed counts of the values seen in the last `window` seconds, kept
+    in one slot per SLOT_SECONDS so old slots can be dropped.
+    """
+
+    def __init__(self, buckets, window=PERF_WINDOW_MINUTES * 60):
+        self.buckets = buckets
+        self.window = window
+        self.slots = deque()  # [slot start, counts, total, maximum]
+
+    def _bucket(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                return index
+        return len(self.buckets)
+
+    def _expire(self, now):
+        while self.slots and self.slots[0][0] <= now - self.window:
+            self.slots.popleft()
+
+    def add(self, value, now):
+        start = int(now // SLOT_SECONDS) * SLOT_SECONDS
+        if not self.slots or self.slots[-1][0] != start:
+            self.slots.append([start, [0] * (len(self.buckets) + 1), 0, 0])
+            self._expire(now)
+        slot = self.slots[-1]
+        slot[1][self._bucket(value)] += 1
+        slot[2] += value
+        slot[3] = max(slot[3], value)
+
+    def to_dict(self, now):
+        """Merge the live slots into {'buckets', 'counts', 'count', 'sum', 'max'}."""
+        self._expire(now)
+        counts = [0] * (len(self.buckets) + 1)
+        total = maximum = 0
+        for _, slot_counts, slot_total, slot_max in self.slots:
+            counts = [a + b for a, b in zip(counts, slot_counts)]
+            total += slot_total
+            maximum = max(maximum, slot_max)
+        return {'buckets': list(self.buckets), 'counts': counts, 'count': sum(counts), 'sum': total, 'max': maximum}
+
+
+def merge_histograms(histograms):
+    """Add up histogram dictionaries with the same buckets."""
+    merged = None
+    for histogram in histograms:
+        if merged is None:
+            merged = dict(histogram, counts=list(histogram['counts']))
+            continue
+        merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+        merged['count'] += histogram['count']
+        merged['sum'] += histogram['sum']
+        merged['max'] = max(merged['max'], histogram['max'])
+    return merged
+
+
+def percentile(histogram, fraction):
+    """
+    The bucket bound below which `fraction` of the values fall (the maximum
+    for the overflow bucket), or None for an empty histogram.
+    """
+    if not histogram['count']:
+        return None
+    rank = fraction * histogram['count']
+    seen = 0
+    for index, count in enumerate(histogram['counts']):
+        seen += count
+        if seen >= rank and count:
+            if index < len(histogram['buckets']):
+                return min(histogram['buckets'][index], histogram['max'])
+            return histogram['max']
+    return histogram['max']
+
+
+class PerformanceStats:
+    """Thread-safe per-view histograms of request metrics for this process."""
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+        self.last_flush = time.time()
+
+    def record(self, view, metrics, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = {
+                    metric: RollingHistogram(buckets) for metric, buckets in METRIC_BUCKETS.items()
+                }
+            for metric, value in metrics.items():
+                if value is not None:
+                    histograms[metric].add(value, now)
+
+    def snapshot(self, now=None):
+        """{view: {metric: histogram dict}} for the views seen in the window."""
+        now = time.time() if now is None else now
+        with self._lock:
+            snapshot = {
+                view: {metric: histogram.to_dict(now) for metric, histogram in histograms.items()}
+                for view, histograms in self._views.items()
+            }
+        return {view: metrics for view, metrics in snapshot.items() if metrics['wall_ms']['count']}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def flush(self, now=None):
+        """Write this process's snapshot to PERF_STATS_DIR."""
+        now = time.time() if now is None else now
+        self.last_flush = now
+        PERF_STATS_DIR.mkdir(parents=True, exist_ok=True)
+        path = PERF_STATS_DIR / f"{os.getpid()}.json"
+        partial = path.with_name(path.name + '.part')
+        partial.write_text(json.dumps({'written': now, 'views': self.snapshot(now)}))
+        partial.replace(path)
+        expire_snapshots(now)
+
+    def maybe_flush(self, now):
+        if now - self.last_flush >= PERF_FLUSH_INTERVAL:
+            self.flush(now)
+
+
+performance_stats = PerformanceStats()
+
+
+def expire_snapshots(now=None):
+    """
+    Delete the snapshots (and leftover partial writes) in PERF_STATS_DIR
+    that were last written before the window. Returns how many were deleted.
+    """
+    now = time.time() if now is None else now
+    cutoff = now - PERF_WINDOW_MINUTES * 60
+    expired = 0
+    for path in [*PERF_STATS_DIR.glob('*.json'), *PERF_STATS_DIR.glob('*.json.part')]:
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                expired += 1
+        except OSError:
+            # Rewritten or deleted by another process meanwhile
+            continue
+    return expired
+
+
+def collect_stats(now=None):
+    """
+    Merge this process's live statistics with the snapshots other processes
+    wrote within the window. Returns {view: {metric: histogram dict}}.
+    """
+    now = time.time() if now is None else now
+    snapshots = [performance_stats.snapshot(now)]
+    if PERF_STATS_DIR.is_dir():
+        for path in PERF_STATS_DIR.glob('*.json'):
+            if path.stem == str(os.getpid()):
+                continue
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            if data['written'] > now - PERF_WINDOW_MINUTES * 60:
+                snapshots.append(data['views'])
+    merged = {}
+    for snapshot in snapshots:
+        for view, metrics in snapshot.items():
+            for metric, histogram in metrics.items():
+                merged.setdefault(view, {}).setdefault(metric, []).append(histogram)
+    return {
+        view: {metric: merge_histograms(histograms) for metric, histograms in metrics.items()}
+        for view, metrics in merged.items()
+    }
+
+
+def summarize(stats):
+    """One summary row per view, slowest 95th percentile first."""
+    rows = []
+    for view, metrics in stats.items():
+        wall = metrics['wall_ms']
+        row = {
+            'view': view,
+            'requests': wall['count'],
+            'p50_ms': percentile(wall, 0.5),
+            'p95_ms': percentile(wall, 0.95),
+            'p99_ms': percentile(wall, 0.99),
+            'max_ms': round(wall['max'], 1),
+        }
+        for metric in ('queries', 'db_ms', 'template_ms', 'response_bytes'):
+            histogram = metrics[metric]
+            row[f'avg_{metric}'] = round(histogram['sum'] / histogram['count'], 1) if histogram['count'] else None
+        row['max_queries'] = metrics['queries']['max']
+        rows.append(row)
+    rows.sort(key=lambda row: (-(row['p95_ms'] or 0), row['view']))
+    return rows
+
+
+class RequestTimer:
+    """Accumulates the database and template time of the current request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+current_timer = ContextVar('perf_request_timer', default=None)
+
+
+def install_template_timer():
+    """
+    Wrap Template.render so the outermost render of each template tree is
+    timed for the current request. Safe to call more than once.
+    """
+    if getattr(Template.render, 'perf_timed', False):
+        return
+    original_render = Template.render
+
+    def render(self, context):
+        timer = current_timer.get()
+        if timer is None:
+            return original_render(self, context)
+        timer.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original_render(self, context)
+        finally:
+            timer.template_depth -= 1
+            if not timer.template_depth:
+                timer.template_seconds += time.perf_counter() - started
+
+    render.perf_timed = True
+    Template.render = render
@@ -0,0 +1,83 @@
+"""
+Query budgets: catch N+1 queries in tests and during development.
+
+`query_budget(n)` is a context manager and decorator that raises
+QueryBudgetExceeded when the code it wraps runs more than `n` database
+queries, listing the statements that were repeated most, which is usually
+the N+1 culprit. QueryBudgetMixin adds the same check to test cases, and
+the QUERY_BUDGET setting makes PerformanceMiddleware log any request that
+goes over budget.
+"""
+from collections import Counter
+from contextlib import ContextDecorator
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+# Queries shown in a QueryBudgetExceeded message
+REPORTED_QUERIES = 5
+
+
+class QueryBudgetExceeded(AssertionError):
+    """More queries ran than the budget allowed."""
+
+    def __init__(self, label, budget, queries):
+        self.budget = budget
+        self.queries = queries
+        repeated = Counter(query['sql'] for query in queries).most_common(REPORTED_QUERIES)
+        lines = [f"{label or 'Block'} ran {len(queries)} queries, budget is {budget}. Most repeated:"]
+        lines.extend(f"  {count}x {sql}" for sql, count in repeated)
+        super().__init__('\n'.join(lines))
+
+
+class query_budget(ContextDecorator):
+    """
+    Allow at most `max_queries` queries on database `using` inside the block.
+
+        with query_budget(3):
+            ...
+
+        @query_budget(10, label='label export')
+        def export(...):
+            ...
+    """
+
+    def __init__(self, max_queries, using=DEFAULT_DB_ALIAS, label=None):
+        self.max_queries = max_queries
+        self.using = using
+        self.label = label
+
+    def _recreate_cm(self):
+        # Each call of a decorated function gets its own instance, so recursive
+        # and concurrent calls do not overwrite each other's capture
+        return type(self)(self.max_queries, using=self.using, label=self.label)
+
+    def __enter__(self):
+        self.captured = CaptureQueriesContext(connections[self.using])
+        self.captured.__enter__()
+        return self.captured
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.captured.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None and len(self.captured) > self.max_queries:
+            raise QueryBudgetExceeded(self.label, self.max_queries, self.captured.captured_queries)
+        return False
+
+
+class QueryBudgetMixin:
+    """TestCase mixin asserting query budgets for code blocks and views."""
+
+    def assertQueryBudget(self, max_queries, using=DEFAULT_DB_ALIAS, label=None):
+        return query_budget(max_queries, using=using, label=label)
+
+    def assertViewQueryBudget(self, url, max_queries, data=None, status_code=200):
+        """
+        GET `url` and assert the request, including any streamed content,
+        ran at most `max_queries` queries.
+        """
+        with self.assertQueryBudget(max_queries, label=f"GET {url}"):
+            response = self.client.get(url, data)
+            if response.streaming:
+                response.content_bytes = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status_code)
+        return response
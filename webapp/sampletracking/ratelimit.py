@@ -0,0 +1,145 @@
+"""
+Request rate limiting shared across processes.
+
+Limits are enforced with a sliding-window counter: each key has one counter
+per fixed window, and the rate is estimated from the current window's count
+plus the previous window's count weighted by how much of it still overlaps
+the sliding window. That is one atomic increment and one read per request,
+whatever the limit, and two small counters per key.
+
+Counters live in a pluggable backend. CacheBackend uses the Django cache
+named by RATE_LIMIT_CACHE, so with a shared cache (Redis, Memcached,
+database) every worker process sees the same counts and the cache's own
+expiry bounds memory. Increments are atomic in Redis and Memcached; the
+database cache reads and writes, so concurrent hits on one key may be
+undercounted. A per-process LocMemCache defeats the purpose and is logged.
+A database cache whose table has not been created (`manage.py
+createcachetable`) is logged as an error and replaced by the default cache,
+so requests are still limited, per process, instead of failing.
+LocalBackend keeps counters in a bounded in-process dictionary, for tests
+and single-process development servers.
+"""
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections, router
+from django.utils.module_loading import import_string
+
+RATE_LIMIT_BACKEND = getattr(settings, 'RATE_LIMIT_BACKEND', 'sampletracking.ratelimit.CacheBackend')
+RATE_LIMIT_CACHE = getattr(settings, 'RATE_LIMIT_CACHE', 'default')
+RATE_LIMIT_LOCAL_MAX_KEYS = getattr(settings, 'RATE_LIMIT_LOCAL_MAX_KEYS', 10000)
+
+logger = logging.getLogger('security')
+
+
+def rate_limit_cache(alias=RATE_LIMIT_CACHE):
+    """
+    The cache named `alias`, or the default cache when `alias` is a database
+    cache whose table does not exist yet.
+    """
+    cache = caches[alias]
+    if isinstance(cache, DatabaseCache):
+        connection = connections[router.db_for_read(cache.cache_model_class)]
+        if cache._table not in connection.introspection.table_names():
+            logger.error(
+                f"Rate limit cache '{alias}' has no table '{cache._table}': run `python manage.py "
+                f"createcachetable`. Using the '{DEFAULT_CACHE_ALIAS}' cache until then."
+            )
+            return caches[DEFAULT_CACHE_ALIAS]
+    return cache
+
+
+class CacheBackend:
+    """Counters stored in a Django cache shared by the worker processes."""
+
+    def __init__(self, alias=RATE_LIMIT_CACHE):
+        self.cache = rate_limit_cache(alias)
+        if isinstance(self.cache, LocMemCache):
+            logger.warning(
+                f"Rate limit cache '{alias}' is a per-process LocMemCache: limits are not shared "
+                f"between worker processes. Point RATE_LIMIT_CACHE at a shared cache."
+            )
+
+    def incr(self, key, timeout):
+        """Increment the counter `key`, creating it with `timeout`, and return its value."""
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.set(key, 1, timeout)
+            return 1
+
+    def get(self, key):
+        return self.cache.get(key, 0)
+
+
+class LocalBackend:
+    """
+    Counters in a thread-safe in-process dictionary holding at most
+    `max_keys` counters; the least recently written are evicted first.
+    """
+
+    def __init__(self, max_keys=RATE_LIMIT_LOCAL_MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._counters = OrderedDict()  # key -> (value, expires at)
+        self._lock = Lock()
+
+    def incr(self, key, timeout):
+        now = self.clock()
+        with self._lock:
+            value, expires = self._counters.pop(key, (0, 0))
+            if expires <= now:
+                value, expires = 0, now + timeout
+            self._counters[key] = (value + 1, expires)
+            while len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+            return value + 1
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._counters.get(key, (0, 0))
+        return value if expires > self.clock() else 0
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+
+    def __len__(self):
+        return len(self._counters)
+
+
+def get_backend():
+    """The backend configured by RATE_LIMIT_BACKEND."""
+    return import_string(RATE_LIMIT_BACKEND)()
+
+
+class SlidingWindowRateLimiter:
+    """Allows at most `limit` hits per key in any `window` seconds."""
+
+    def __init__(self, name, limit, window, backend=None):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.backend = backend or get_backend()
+
+    def key(self, key, window_index):
+        return f"ratelimit:{self.name}:{key}:{window_index}"
+
+    def hit(self, key, now=None):
+        """Record a hit for `key` and return True when it exceeds the limit."""
+        if now is None:
+            now = time.time()
+        window_index, offset = divmod(now, self.window)
+        window_index = int(window_index)
+        current = self.backend.incr(self.key(key, window_index), timeout=2 * self.window)
+        previous = self.backend.get(self.key(key, window_index - 1))
+        estimate = previous * (1 - offset / self.window) + current
+        return estimate > self.limit
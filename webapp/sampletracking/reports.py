@@ -0,0 +1,168 @@
+"""
+Comprehensive sample report.
+
+The report lists crude samples with their aliquot, extract and library counts
+and latest child dates, all computed in the database (see
+lineage.with_lineage_summary). It is rendered a page at a time, streamed as
+an export, or, for very large ranges, written to a file by a background
+job (see jobs.py) and downloaded once ready.
+
+Background reports live in REPORTS_DIR as `<token>.<ext>`. While a report is
+being written it is named `<token>.<ext>.part`, and a failed run leaves a
+`<token>.error` file, so any web process can tell a report's state from the
+filesystem alone. The `run_jobs` worker deletes these files once they are
+older than REPORT_RETENTION seconds, unless the report's job has not finished
+(see expire_reports).
+"""
+import logging
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from .exports import EXPORT_BLOCK_ROWS, EXPORT_FORMATS, REPORT_COLUMNS, encode_blocks, iter_blocks, queryset_rows
+from .jobs import submit_job
+from .lineage import with_lineage_summary
+from .models import CrudeSample, Job
+
+logger = logging.getLogger('sampletracking')
+
+REPORTS_DIR = Path(getattr(settings, 'REPORTS_DIR', settings.BASE_DIR / 'reports'))
+
+# Exports with more rows than this are generated in the background
+ASYNC_REPORT_THRESHOLD = getattr(settings, 'ASYNC_REPORT_THRESHOLD', 50000)
+
+REPORT_PAGE_SIZE = 50
+
+# Background report files (finished, partial or failed) are kept this long
+REPORT_RETENTION = getattr(settings, 'REPORT_RETENTION', 24 * 60 * 60)
+
+
+def filter_crude_samples(date_from=None, date_to=None, sample_type=None):
+    """The crude samples matching the report's date range and sample type filters."""
+    crude_samples = CrudeSample.objects.all()
+    if date_from:
+        crude_samples = crude_samples.filter(collection_date__gte=date_from)
+    if date_to:
+        crude_samples = crude_samples.filter(collection_date__lte=date_to)
+    if sample_type and sample_type != 'all':
+        crude_samples = crude_samples.filter(sample_source=sample_type)
+    return crude_samples.order_by('-collection_date', 'subject_id', 'pk')
+
+
+def report_queryset(**filters):
+    """The filtered crude samples annotated with their lineage summary."""
+    return with_lineage_summary(filter_crude_samples(**filters))
+
+
+def report_blocks(filters, fmt='csv'):
+    """Yield the report for `filters` as delimited text blocks."""
+    delimiter = EXPORT_FORMATS[fmt][0]
+    header = [label for label, field in REPORT_COLUMNS]
+    rows = queryset_rows(report_queryset(**filters), [field for label, field in REPORT_COLUMNS])
+    return iter_blocks(header, rows, delimiter)
+
+
+def report_filename(token, fmt='csv', compress=False):
+    return f"{token}.{fmt}.gz" if compress else f"{token}.{fmt}"
+
+
+def _count_rows(blocks, progress):
+    """Pass `blocks` through, calling `progress` with the rows written so far."""
+    for count, block in enumerate(blocks, start=1):
+        yield block
+        progress(count * EXPORT_BLOCK_ROWS)
+
+
+def write_report(token, filters, fmt='csv', compress=False, progress=None):
+    """
+    Write the report for `filters` to REPORTS_DIR under `token`, renaming it
+    into place only once it is complete. `progress`, if given, is called with
+    the approximate number of rows written after each block.
+    """
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = REPORTS_DIR / report_filename(token, fmt, compress)
+    partial = path.with_name(path.name + '.part')
+    blocks = report_blocks(filters, fmt)
+    if progress is not None:
+        blocks = _count_rows(blocks, progress)
+    try:
+        with open(partial, 'wb') as f:
+            for data in encode_blocks(blocks, compress):
+                f.write(data)
+        partial.rename(path)
+    except Exception as e:
+        logger.error(f"Report {token} failed: {e}")
+        partial.unlink(missing_ok=True)
+        (REPORTS_DIR / f"{token}.error").write_text(str(e))
+        raise
+    return path
+
+
+def start_report(filters, fmt='csv', compress=False, user=None):
+    """Queue a job generating the report and return the report's token."""
+    token = uuid.uuid4().hex
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    # Mark the report as running until a worker picks the job up
+    (REPORTS_DIR / (report_filename(token, fmt, compress) + '.part')).touch()
+    submit_job('comprehensive_report', {
+        'token': token, 'filters': filters, 'fmt': fmt, 'compress': compress,
+    }, user=user)
+    return token
+
+
+def report_job(token):
+    """The job generating the report `token`, or None."""
+    return Job.objects.filter(kind='comprehensive_report', params__token=token).first()
+
+
+def report_status(token):
+    """
+    Return ('ready', path), ('running', None), ('failed', message) or
+    (None, None) for an unknown token.
+    """
+    error = REPORTS_DIR / f"{token}.error"
+    if error.exists():
+        return 'failed', error.read_text()
+    for path in REPORTS_DIR.glob(f"{token}.*"):
+        if path.name.endswith('.part'):
+            return 'running', None
+        return 'ready', path
+    return None, None
+
+
+def expire_reports(max_age=REPORT_RETENTION):
+    """
+    Delete the report, partial and error files in REPORTS_DIR last modified
+    more than `max_age` seconds ago, except those of reports whose job is
+    still queued or running. Returns the number of files deleted.
+    """
+    cutoff = time.time() - max_age
+    expired = []
+    for path in REPORTS_DIR.glob('*'):
+        try:
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                expired.append(path)
+        except OSError:
+            continue
+    # A job can wait in the queue, or spend a while before its first write,
+    # for longer than the retention
+    unfinished = set(Job.objects.filter(
+        kind='comprehensive_report',
+        params__token__in={path.name.split('.', 1)[0] for path in expired},
+        status__in=[Job.PENDING, Job.RUNNING],
+    ).values_list('params__token', flat=True)) if expired else set()
+    deleted = 0
+    for path in expired:
+        if path.name.split('.', 1)[0] in unfinished:
+            continue
+        try:
+            path.unlink()
+            deleted += 1
+        except OSError:
+            # Deleted by another worker, or still being written on some platforms
+            continue
+    if deleted:
+        logger.info(f"Deleted {deleted} expired report file(s) from {REPORTS_DIR}")
+    return deleted
@@ -1,10 +1,8 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
-from django.utils import timezone
-from datetime import timedelta
 
-from .models import CrudeSample, Aliquot, Extract, SequenceLibrary
+from .models import CrudeSample, Extract, SequenceLibrary
+from .stats import DashboardStats
 
 
 @login_required
@@ -12,56 +10,26 @@ def dashboard(request):
     """
     Display an overview dashboard of sample statistics
     """
-    today = timezone.now().date()
-    week_ago = today - timedelta(days=7)
-    month_ago = today - timedelta(days=30)
-
-    # Count of each sample type
-    crude_count = CrudeSample.objects.count()
-    aliquot_count = Aliquot.objects.count()
-    extract_count = Extract.objects.count()
-    library_count = SequenceLibrary.objects.count()
-
-    # Recent counts (last 7 days)
-    recent_crude = CrudeSample.objects.filter(date_created__gte=week_ago).count()
-    recent_aliquot = Aliquot.objects.filter(date_created__gte=week_ago).count()
-    recent_extract = Extract.objects.filter(date_created__gte=week_ago).count()
-    recent_library = SequenceLibrary.objects.filter(date_created__gte=week_ago).count()
-
-    # Samples by source
-    source_distribution = CrudeSample.objects.values('sample_source') \
-                                       .annotate(count=Count('id')) \
-                                       .order_by('-count')
-
-    # Libraries awaiting sequencing
-    awaiting_sequencing = SequenceLibrary.objects.filter(date_sequenced__isnull=True).count()
-
-    # Library types distribution
-    library_types = SequenceLibrary.objects.values('library_type') \
-                                     .annotate(count=Count('id')) \
-                                     .order_by('-count')
-
-    # Extract types distribution
-    extract_types = Extract.objects.values('extract_type') \
-                                  .annotate(count=Count('id')) \
-                                  .order_by('-count')
+    stats = DashboardStats()
+    totals = stats.totals()
+    recent = stats.totals(days=7)
 
     # Recent samples
     recent_samples = CrudeSample.objects.order_by('-date_created')[:10]
 
     context = {
-        'crude_count': crude_count,
-        'aliquot_count': aliquot_count,
-        'extract_count': extract_count,
-        'library_count': library_count,
-        'recent_crude': recent_crude,
-        'recent_aliquot': recent_aliquot,
-        'recent_extract': recent_extract,
-        'recent_library': recent_library,
-        'source_distribution': source_distribution,
-        'awaiting_sequencing': awaiting_sequencing,
-        'library_types': library_types,
-        'extract_types': extract_types,
+        'crude_count': totals['crude_samples'],
+        'aliquot_count': totals['aliquots'],
+        'extract_count': totals['extracts'],
+        'library_count': totals['libraries'],
+        'recent_crude': recent['crude_samples'],
+        'recent_aliquot': recent['aliquots'],
+        'recent_extract': recent['extracts'],
+        'recent_library': recent['libraries'],
+        'source_distribution': stats.breakdown(CrudeSample, 'category', 'sample_source'),
+        'awaiting_sequencing': stats.sequencing()['pending'],
+        'library_types': stats.breakdown(SequenceLibrary, 'category', 'library_type'),
+        'extract_types': stats.breakdown(Extract, 'category', 'extract_type'),
         'recent_samples': recent_samples,
     }
 
@@ -0,0 +1,325 @@
+"""
+Cross-model sample search backed by the SampleSearchDocument index.
+
+Each CrudeSample, Aliquot, Extract and SequenceLibrary has one search
+document holding its barcode, root subject ID, type and notes. Documents are
+maintained by signal handlers (see signals.py) and can be rebuilt with the
+`rebuild_search_index` management command.
+
+Matching depends on the database:
+- SQLite: an FTS5 table with the trigram tokenizer, ranked with bm25.
+- PostgreSQL: ILIKE (the ILike lookup) served by pg_trgm GIN indexes,
+  ranked by similarity. Django's icontains renders UPPER(col) LIKE, which
+  those indexes cannot serve.
+- Anything else: case-insensitive substring filters on the document table.
+
+Results can be read ranked by relevance (slicing, for Django's Paginator) or
+newest first with keyset pagination over (date, type, pk) (`page()`), which
+reads only the rows of the requested page however many documents match.
+Keyset pages never count the matches; callers that need the total should
+only ask for it on the first page.
+"""
+import base64
+from datetime import date
+
+from django.db import connection
+from django.db.models import F, Lookup, Q
+from django.urls import reverse
+
+from .lineage import descendant_querysets, root_values
+from .models import CrudeSample, Aliquot, Extract, SequenceLibrary, SampleSearchDocument
+
+# model class -> (result type label, detail URL name)
+SEARCHABLE_MODELS = {
+    CrudeSample: ('Crude Sample', 'crude_sample_detail'),
+    Aliquot: ('Aliquot', 'aliquot_detail'),
+    Extract: ('Extract', 'extract_detail'),
+    SequenceLibrary: ('Sequence Library', 'library_detail'),
+}
+
+MODEL_BY_NAME = {model._meta.model_name: model for model in SEARCHABLE_MODELS}
+
+# The FTS5 trigram tokenizer can only match terms of three or more characters.
+FTS_MIN_QUERY_LENGTH = 3
+
+INDEX_BATCH_SIZE = 2000
+
+SEARCH_PAGE_SIZE = 20
+
+# Keyset order: newest first, then by type and primary key to break ties
+KEYSET_ORDER_BY = ('-date', '-model_name', '-id')
+
+
+def sample_type(instance):
+    if isinstance(instance, Extract):
+        return instance.extract_type
+    if isinstance(instance, SequenceLibrary):
+        return instance.library_type
+    return ''
+
+
+def build_document(instance):
+    return SampleSearchDocument(
+        model_name=instance._meta.model_name,
+        object_id=instance.pk,
+        barcode=instance.barcode,
+        subject_id=root_values(instance)[1] or '',
+        sample_type=sample_type(instance) or '',
+        notes=instance.notes or '',
+        date=instance.date_created,
+    )
+
+
+def index_instance(instance):
+    """Create or update the search document for a single sample."""
+    document = build_document(instance)
+    SampleSearchDocument.objects.update_or_create(
+        model_name=document.model_name,
+        object_id=document.object_id,
+        defaults={
+            'barcode': document.barcode,
+            'subject_id': document.subject_id,
+            'sample_type': document.sample_type,
+            'notes': document.notes,
+            'date': document.date,
+        },
+    )
+
+
+def remove_instance(instance):
+    SampleSearchDocument.objects.filter(
+        model_name=instance._meta.model_name, object_id=instance.pk,
+    ).delete()
+
+
+def update_descendant_subjects(sample):
+    """Propagate a sample's root subject ID to the documents of all its descendants."""
+    subject_id = root_values(sample)[1]
+    for queryset in descendant_querysets(sample):
+        SampleSearchDocument.objects.filter(
+            model_name=queryset.model._meta.model_name,
+            object_id__in=queryset.values('pk'),
+        ).update(subject_id=subject_id)
+
+
+def index_objects(objects):
+    """Bulk-create documents for newly created samples."""
+    SampleSearchDocument.objects.bulk_create(
+        [build_document(obj) for obj in objects], batch_size=INDEX_BATCH_SIZE,
+    )
+
+
+def rebuild_search_index():
+    """Rebuild every search document from the sample tables."""
+    counts = {}
+    for model in SEARCHABLE_MODELS:
+        SampleSearchDocument.objects.filter(model_name=model._meta.model_name).delete()
+        documents = []
+        for obj in model.objects.order_by().iterator(chunk_size=INDEX_BATCH_SIZE):
+            documents.append(build_document(obj))
+            if len(documents) >= INDEX_BATCH_SIZE:
+                SampleSearchDocument.objects.bulk_create(documents)
+                documents = []
+        SampleSearchDocument.objects.bulk_create(documents)
+        counts[model] = SampleSearchDocument.objects.filter(model_name=model._meta.model_name).count()
+    return counts
+
+
+def document_to_result(document):
+    """Convert a search document into the dict rendered by search_results.html."""
+    label, url_name = SEARCHABLE_MODELS[MODEL_BY_NAME[document.model_name]]
+    return {
+        'type': label,
+        'object': document,
+        'barcode': document.barcode,
+        'sample_id': document.subject_id or 'N/A',
+        'date': document.date,
+        'url': reverse(url_name, kwargs={'pk': document.object_id}),
+    }
+
+
+def encode_cursor(document):
+    """Encode the keyset position of a document as an opaque URL-safe token."""
+    position = f"{document.date.isoformat()}|{document.model_name}|{document.pk}"
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a token produced by encode_cursor into a (date, model_name, pk)
+    tuple. Raises ValueError for malformed tokens.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        day, model_name, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        position = (date.fromisoformat(day), model_name, int(pk))
+    except (TypeError, UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid search cursor: {cursor!r}") from e
+    if model_name not in MODEL_BY_NAME:
+        raise ValueError(f"Invalid search cursor: {cursor!r}")
+    return position
+
+
+class SearchPage:
+    """One keyset page of search results and the cursor of the next page."""
+
+    def __init__(self, results, next_cursor=None):
+        self.results = results
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class ILike(Lookup):
+    """`lhs ILIKE rhs` on PostgreSQL, which pg_trgm GIN indexes can serve."""
+
+    lookup_name = 'ilike'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ILIKE {rhs}', (*lhs_params, *rhs_params)
+
+
+class SampleSearchResults:
+    """
+    Ranked search results that are counted and fetched page by page.
+
+    Supports len() and slicing, so it can be handed to Django's Paginator;
+    only the requested page of documents is loaded.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self._count_matches()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        offset = key.start or 0
+        limit = (key.stop if key.stop is not None else self.count()) - offset
+        if limit <= 0:
+            return []
+        return [document_to_result(doc) for doc in self._fetch(offset, limit)]
+
+    def page(self, cursor=None, size=SEARCH_PAGE_SIZE):
+        """
+        Return the `size` newest matches after `cursor` as a SearchPage.
+
+        One extra row is read to tell whether a next page exists. Raises
+        ValueError if `cursor` is malformed.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        documents = self._fetch_after(after, size + 1)
+        next_cursor = encode_cursor(documents[size - 1]) if len(documents) > size else None
+        return SearchPage([document_to_result(doc) for doc in documents[:size]], next_cursor)
+
+    # --- SQLite FTS5 ---
+
+    def _sqlite_where(self):
+        if len(self.query) >= FTS_MIN_QUERY_LENGTH:
+            phrase = '"' + self.query.replace('"', '""') + '"'
+            return 'sampletracking_search_fts MATCH %s', [phrase], 'f.rank, d.date DESC, d.id DESC'
+        pattern = f'%{_escape_like(self.query)}%'
+        where = ' OR '.join(
+            f"f.{column} LIKE %s ESCAPE '\\'" for column in ('barcode', 'subject_id', 'sample_type', 'notes')
+        )
+        return f'({where})', [pattern] * 4, 'd.date DESC, d.id DESC'
+
+    def _sqlite_sql(self, select, order=None, after=None):
+        """
+        Build the match query. `order` is None for a count, or 'rank' /
+        'keyset' for a LIMIT/OFFSET page in relevance or keyset order.
+        """
+        where, params, rank_order_by = self._sqlite_where()
+        sql = (
+            f'SELECT {select} FROM sampletracking_search_fts f '
+            f'JOIN sampletracking_samplesearchdocument d ON d.id = f.rowid '
+            f'WHERE {where}'
+        )
+        if after is not None:
+            sql += ' AND (d.date, d.model_name, d.id) < (%s, %s, %s)'
+            params = params + list(after)
+        if order is not None:
+            order_by = rank_order_by if order == 'rank' else 'd.date DESC, d.model_name DESC, d.id DESC'
+            sql += f' ORDER BY {order_by} LIMIT %s OFFSET %s'
+        return sql, params
+
+    # --- ORM (PostgreSQL trigram and generic fallback) ---
+
+    def _orm_queryset(self):
+        q = self.query
+        if connection.vendor == 'postgresql':
+            pattern = f'%{_escape_like(q)}%'
+
+            def contains(field):
+                return Q(ILike(F(field), pattern))
+        else:
+            def contains(field):
+                return Q(**{f'{field}__icontains': q})
+
+        queryset = SampleSearchDocument.objects.filter(
+            contains('barcode')
+            | (Q(model_name='crudesample') & contains('subject_id'))
+            | contains('sample_type')
+            | contains('notes')
+        )
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramSimilarity
+            from django.db.models.functions import Greatest
+            queryset = queryset.annotate(
+                rank=Greatest(TrigramSimilarity('barcode', q), TrigramSimilarity('notes', q))
+            ).order_by('-rank', '-date', '-id')
+        else:
+            queryset = queryset.order_by('-date', '-id')
+        return queryset
+
+    def _count_matches(self):
+        if connection.vendor == 'sqlite':
+            sql, params = self._sqlite_sql('COUNT(*)')
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchone()[0]
+        return self._orm_queryset().count()
+
+    def _fetch(self, offset, limit):
+        if connection.vendor == 'sqlite':
+            sql, params = self._sqlite_sql('d.*', order='rank')
+            return list(SampleSearchDocument.objects.raw(sql, params + [limit, offset]))
+        return list(self._orm_queryset()[offset:offset + limit])
+
+    def _fetch_after(self, after, limit):
+        """Fetch up to `limit` documents in keyset order, after the position `after`."""
+        if connection.vendor == 'sqlite':
+            sql, params = self._sqlite_sql('d.*', order='keyset', after=after)
+            return list(SampleSearchDocument.objects.raw(sql, params + [limit, 0]))
+        queryset = self._orm_queryset().order_by(*KEYSET_ORDER_BY)
+        if after is not None:
+            day, model_name, pk = after
+            queryset = queryset.filter(
+                Q(date__lt=day)
+                | Q(date=day, model_name__lt=model_name)
+                | Q(date=day, model_name=model_name, id__lt=pk)
+            )
+        return list(queryset[:limit])
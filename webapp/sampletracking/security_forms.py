@@ -10,6 +10,8 @@ from django.contrib.auth.models import User
 import re
 import logging
 
+from .patterns import is_suspicious
+
 logger = logging.getLogger('security')
 
 class SecureLoginForm(AuthenticationForm):
@@ -47,8 +49,7 @@ class SecureLoginForm(AuthenticationForm):
             raise ValidationError("Username contains invalid characters.")
         
         # Check for suspicious patterns
-        suspicious_patterns = ['admin', 'root', 'test', 'guest', 'anonymous']
-        if any(pattern in username.lower() for pattern in suspicious_patterns):
+        if is_suspicious(username, 'username'):
             if not User.objects.filter(username=username).exists():
                 logger.warning(f"Suspicious username attempted: {username}")
                 raise ValidationError("Invalid username.")
@@ -135,12 +136,7 @@ class SecureBarcodeForm(forms.Form):
             raise ValidationError("Barcode contains invalid characters.")
         
         # Check for suspicious patterns
-        suspicious_patterns = [
-            '<script', 'javascript:', 'DROP', 'DELETE', 'INSERT', 
-            'UPDATE', 'SELECT', '--', ';', '/*', '*/'
-        ]
-        
-        if any(pattern.lower() in barcode.lower() for pattern in suspicious_patterns):
+        if is_suspicious(barcode, 'barcode'):
             logger.critical(f"Suspicious barcode pattern: {barcode}")
             raise ValidationError("Invalid barcode format.")
         
@@ -175,13 +171,7 @@ class SecureSearchForm(forms.Form):
             raise ValidationError("Search query is too long.")
         
         # Check for suspicious patterns
-        suspicious_patterns = [
-            '<script', 'javascript:', 'DROP TABLE', 'DELETE FROM', 
-            'INSERT INTO', 'UPDATE ', 'SELECT * FROM', '--', ';',
-            'UNION SELECT', '1=1', 'OR 1=1', 'XSS', 'SCRIPT'
-        ]
-        
-        if any(pattern.lower() in query.lower() for pattern in suspicious_patterns):
+        if is_suspicious(query, 'strict_search'):
             logger.warning(f"Suspicious search query: {query}")
             raise ValidationError("Invalid search query.")
         
@@ -239,8 +229,7 @@ class SecureFileUploadForm(forms.Form):
         
         if description:
             # Check for suspicious content
-            suspicious_patterns = ['<script', 'javascript:', 'onclick', 'onerror']
-            if any(pattern.lower() in description.lower() for pattern in suspicious_patterns):
+            if is_suspicious(description, 'html'):
                 logger.warning(f"Suspicious file description: {description}")
                 raise ValidationError("Description contains invalid content.")
         
@@ -0,0 +1,82 @@
+"""
+Signal handlers for the sampletracking app.
+"""
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from .barcodes import REGISTERED_MODELS, barcode_cache, register, unregister
+from .lineage import propagate_lineage, root_values
+from .models import CrudeSample, Aliquot, Extract
+from .search import SEARCHABLE_MODELS, index_instance, remove_instance, update_descendant_subjects
+from .stats import SNAPSHOT_MODELS, refresh_snapshot, snapshot_date
+
+
+def remember_previous_state(sender, instance, **kwargs):
+    """
+    Keep a copy of the stored row so post_save handlers can see what changed.
+
+    Built from the values the instance was loaded or last saved with (see
+    TimeStampedModel.from_db), so saving costs no extra query.
+    """
+    loaded = getattr(instance, '_loaded_values', None)
+    instance._previous_state = sender(**loaded) if loaded and instance.pk else None
+
+
+def refresh_snapshot_on_change(sender, instance, **kwargs):
+    """Refresh the dashboard snapshot for the days touched by a save or delete."""
+    previous = getattr(instance, '_previous_state', None)
+    dates = {snapshot_date(instance), snapshot_date(previous) if previous else None}
+    dates.discard(None)
+    if dates:
+        transaction.on_commit(lambda: refresh_snapshot(sender, dates))
+
+
+def index_on_save(sender, instance, **kwargs):
+    index_instance(instance)
+
+
+def propagate_lineage_on_change(sender, instance, **kwargs):
+    """
+    Push a changed root subject or crude barcode (a subject edit or a
+    re-parented sample) down to the descendants and their search documents.
+    """
+    previous = getattr(instance, '_previous_state', None)
+    if previous and root_values(previous) != root_values(instance):
+        propagate_lineage(instance)
+        update_descendant_subjects(instance)
+
+
+def unindex_on_delete(sender, instance, **kwargs):
+    remove_instance(instance)
+
+
+def register_barcode(sender, instance, **kwargs):
+    register(instance)
+    previous = getattr(instance, '_previous_state', None)
+    if previous and previous.barcode != instance.barcode:
+        barcode_cache.discard(previous.barcode)
+
+
+def unregister_barcode(sender, instance, **kwargs):
+    unregister(instance)
+
+
+for model in SNAPSHOT_MODELS:
+    uid = f'dashboard_snapshot_{model.__name__}'
+    pre_save.connect(remember_previous_state, sender=model, dispatch_uid=uid)
+    post_save.connect(refresh_snapshot_on_change, sender=model, dispatch_uid=uid)
+    post_delete.connect(refresh_snapshot_on_change, sender=model, dispatch_uid=uid)
+
+for model in SEARCHABLE_MODELS:
+    uid = f'search_index_{model.__name__}'
+    post_save.connect(index_on_save, sender=model, dispatch_uid=uid)
+    post_delete.connect(unindex_on_delete, sender=model, dispatch_uid=uid)
+
+for model in REGISTERED_MODELS:
+    uid = f'barcode_registry_{model.__name__}'
+    post_save.connect(register_barcode, sender=model, dispatch_uid=uid)
+    post_delete.connect(unregister_barcode, sender=model, dispatch_uid=uid)
+
+for model in (CrudeSample, Aliquot, Extract):
+    uid = f'lineage_{model.__name__}'
+    post_save.connect(propagate_lineage_on_change, sender=model, dispatch_uid=uid)
@@ -0,0 +1,266 @@
+"""
+Dashboard statistics for the sample database.
+
+Counts are materialized in the DashboardSnapshot table, one row per
+(model, day, status, category, bucket). Each refresh is a single grouped
+aggregate query per model, and signal handlers refresh only the days touched
+by a change, so reading the dashboards costs one query regardless of how many
+samples exist.
+
+DashboardStats is the single read API used by the web dashboard, the admin
+index, the admin_stats context processor and the admin_dashboard command.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, CharField, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CrudeSample, Aliquot, Extract, SequenceLibrary, Plate, DashboardSnapshot
+
+ADMIN_STATS_CACHE_KEY = 'sampletracking:admin_stats'
+ADMIN_STATS_CACHE_TIMEOUT = getattr(settings, 'ADMIN_STATS_CACHE_TIMEOUT', 60)
+RECENT_ACTIVITY_DAYS = 30
+
+# Windows (in days) DashboardStats counts in its first query: the web
+# dashboard's last week and the admin's recent activity
+DEFAULT_WINDOWS = (7, RECENT_ACTIVITY_DAYS)
+
+SAMPLE_MODELS = (CrudeSample, Aliquot, Extract, SequenceLibrary)
+SNAPSHOT_MODELS = SAMPLE_MODELS + (Plate,)
+
+QUALITY_BUCKET = Case(
+    When(quality_score__gte=80, then=Value('high')),
+    When(quality_score__gte=60, then=Value('medium')),
+    When(quality_score__lt=60, then=Value('low')),
+    default=Value(''),
+    output_field=CharField(),
+)
+
+SEQUENCING_BUCKET = Case(
+    When(date_sequenced__isnull=False, then=Value('sequenced')),
+    default=Value('pending'),
+    output_field=CharField(),
+)
+
+EMPTY = Value('', output_field=CharField())
+
+
+def snapshot_dimensions(model):
+    """
+    Return the (date, status, category, bucket) expressions for `model`.
+    """
+    if model is Plate:
+        return TruncDate('created_at'), EMPTY, F('plate_type'), EMPTY
+    category = {
+        CrudeSample: F('sample_source'),
+        Extract: F('extract_type'),
+        SequenceLibrary: F('library_type'),
+    }.get(model, EMPTY)
+    bucket = {
+        Extract: QUALITY_BUCKET,
+        SequenceLibrary: SEQUENCING_BUCKET,
+    }.get(model, EMPTY)
+    return F('date_created'), F('status'), category, bucket
+
+
+def snapshot_date(instance):
+    """Return the snapshot day an instance is counted under."""
+    if isinstance(instance, Plate):
+        return timezone.localdate(instance.created_at) if instance.created_at else None
+    return instance.date_created
+
+
+def refresh_snapshot(model, dates=None):
+    """
+    Recompute the snapshot rows for `model`, either for the given days or,
+    when `dates` is None, for the whole table.
+
+    Concurrent refreshes of the same model run one after the other: on
+    PostgreSQL they take an advisory lock, and on SQLite the DELETE takes the
+    database's write lock before the counts are read. Otherwise two refreshes
+    could both delete and both insert, doubling the counts.
+    """
+    date, status, category, bucket = snapshot_dimensions(model)
+    queryset = model.objects.annotate(
+        snap_date=date, snap_status=status, snap_category=category, snap_bucket=bucket,
+    )
+    stale = DashboardSnapshot.objects.filter(model_name=model._meta.model_name)
+    if dates is not None:
+        dates = list(dates)
+        queryset = queryset.filter(snap_date__in=dates)
+        stale = stale.filter(date__in=dates)
+
+    groups = (
+        queryset.order_by()
+        .values('snap_date', 'snap_status', 'snap_category', 'snap_bucket')
+        .annotate(count=Count('pk'))
+    )
+    with transaction.atomic():
+        lock_snapshot(model)
+        stale.delete()
+        DashboardSnapshot.objects.bulk_create([
+            DashboardSnapshot(
+                model_name=model._meta.model_name,
+                date=group['snap_date'],
+                status=group['snap_status'] or '',
+                category=group['snap_category'] or '',
+                bucket=group['snap_bucket'] or '',
+                count=group['count'],
+            )
+            for group in groups
+        ], batch_size=1000)
+    invalidate_admin_stats()
+
+
+def lock_snapshot(model):
+    """Hold a transaction-scoped lock on `model`'s snapshot rows (PostgreSQL only)."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(hashtext(%s))',
+                [f'sampletracking.dashboardsnapshot.{model._meta.model_name}'],
+            )
+
+
+def rebuild_snapshot():
+    """Rebuild the snapshot for every tracked model from scratch."""
+    for model in SNAPSHOT_MODELS:
+        refresh_snapshot(model)
+
+
+class DashboardStats:
+    """
+    Read-side API over the DashboardSnapshot table.
+
+    Counts are summed in the database by model, status, category and bucket,
+    over all time and over each of `windows` (in days) at once, so a single
+    query returns a few rows whatever the size of the snapshot. Counts over
+    any other window cost one more query each.
+    """
+
+    def __init__(self, today=None, windows=DEFAULT_WINDOWS):
+        self.today = today or timezone.localdate()
+        self.groups = {}
+        self._aggregate([None, *windows])
+
+    def _aggregate(self, windows):
+        sums = {
+            f'count_{number}': Sum('count', filter=None if days is None else Q(
+                date__gte=self.today - timedelta(days=days),
+            ))
+            for number, days in enumerate(windows)
+        }
+        for days in windows:
+            self.groups[days] = defaultdict(list)
+        for group in (
+            DashboardSnapshot.objects.order_by()
+            .values('model_name', 'status', 'category', 'bucket')
+            .annotate(**sums)
+        ):
+            for number, days in enumerate(windows):
+                count = group[f'count_{number}']
+                if count:
+                    self.groups[days][group['model_name']].append(
+                        {'status': group['status'], 'category': group['category'],
+                         'bucket': group['bucket'], 'count': count}
+                    )
+
+    def _rows(self, model, days=None, **filters):
+        if days not in self.groups:
+            self._aggregate([days])
+        for row in self.groups[days][model._meta.model_name]:
+            if all(row[dimension] == value for dimension, value in filters.items()):
+                yield row
+
+    def count(self, model, days=None, **filters):
+        """
+        Number of `model` rows, optionally limited to the last `days` days and
+        to a given status, category or bucket.
+        """
+        return sum(row['count'] for row in self._rows(model, days, **filters))
+
+    def breakdown(self, model, dimension, label=None, days=None):
+        """
+        Counts grouped by `dimension` ('status', 'category' or 'bucket'), as a
+        list of {label: value, 'count': n} dictionaries ordered by count.
+        """
+        label = label or dimension
+        totals = defaultdict(int)
+        for row in self._rows(model, days):
+            totals[row[dimension]] += row['count']
+        return [
+            {label: value, 'count': count}
+            for value, count in sorted(totals.items(), key=lambda item: -item[1])
+        ]
+
+    def totals(self, days=None):
+        return {
+            'crude_samples': self.count(CrudeSample, days),
+            'aliquots': self.count(Aliquot, days),
+            'extracts': self.count(Extract, days),
+            'libraries': self.count(SequenceLibrary, days),
+            'plates': self.count(Plate, days),
+        }
+
+    def quality_metrics(self):
+        return {
+            'high_quality': self.count(Extract, bucket='high'),
+            'medium_quality': self.count(Extract, bucket='medium'),
+            'low_quality': self.count(Extract, bucket='low'),
+        }
+
+    def sequencing(self):
+        return {
+            'sequenced': self.count(SequenceLibrary, bucket='sequenced'),
+            'pending': self.count(SequenceLibrary, bucket='pending'),
+        }
+
+    def problems(self):
+        contaminated = self.count(CrudeSample, status='CONTAMINATED')
+        exhausted = self.count(CrudeSample, status='EXHAUSTED')
+        return {
+            'contaminated': contaminated,
+            'exhausted': exhausted,
+            'total_issues': contaminated + exhausted,
+        }
+
+
+def compute_admin_stats(days=RECENT_ACTIVITY_DAYS):
+    """
+    Compute the admin dashboard statistics from the snapshot table.
+    """
+    stats = DashboardStats()
+    recent_activity = stats.totals(days)
+    recent_activity['total'] = sum(recent_activity.values())
+
+    return {
+        'totals': stats.totals(),
+        'recent_activity': recent_activity,
+        'status_breakdowns': {
+            'available': stats.count(CrudeSample, status='AVAILABLE'),
+            'awaiting_receipt': stats.count(CrudeSample, status='AWAITING_RECEIPT'),
+            'in_process': stats.count(CrudeSample, status='IN_PROCESS'),
+            'contaminated': stats.count(CrudeSample, status='CONTAMINATED'),
+            'exhausted': stats.count(CrudeSample, status='EXHAUSTED'),
+            'archived': stats.count(CrudeSample, status='ARCHIVED'),
+        },
+        'quality_metrics': stats.quality_metrics(),
+        'sequencing': stats.sequencing(),
+        'problems': stats.problems(),
+    }
+
+
+def get_admin_stats():
+    """
+    Return the admin dashboard statistics, computing them on a cache miss.
+    """
+    return cache.get_or_set(ADMIN_STATS_CACHE_KEY, compute_admin_stats, ADMIN_STATS_CACHE_TIMEOUT)
+
+
+def invalidate_admin_stats():
+    cache.delete(ADMIN_STATS_CACHE_KEY)
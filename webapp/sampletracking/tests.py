@@ -2,7 +2,7 @@
 Comprehensive test suite for the MGML Sample Tracking System.
 Tests cover models, forms, and views to ensure data integrity and security.
 """
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.contrib.auth.models import User, Group, Permission
 from django.urls import reverse
 from django.utils import timezone
@@ -18,6 +18,7 @@ from .forms import (
     ExtractForm,
     SequenceLibraryForm
 )
+from .querybudget import QueryBudgetMixin
 
 
 class ModelTestCase(TestCase):
@@ -713,4 +714,1500 @@ class HistoryTestCase(TestCase):
         history = sample.history.all()
         # Note: history_user would be set by middleware in actual requests
         self.assertEqual(history[0].status, 'ARCHIVED')
-        self.assertEqual(history[1].status, 'AVAILABLE')
\ No newline at end of file
+        self.assertEqual(history[1].status, 'AVAILABLE')
+
+class LegacyImportTestCase(TestCase):
+    """Test the batched legacy data import."""
+
+    def setUp(self):
+        """Write a small harmonized TSV to a temporary file."""
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tsv_path = f"{self.tmpdir.name}/harmonized.tsv"
+        with open(self.tsv_path, 'w') as f:
+            f.write('subject_id\tcollection_date\tsample_source\tsequence_filename\tExtract Type\tAnalysis Type\n')
+            f.write('SUBJ-0001\t2024-10-05\tStool\tp01_s1\tDNA\tMSS\n')
+            f.write('SUBJ-0001\t2024-11-15\tSkin\tp01_s2\tDNA\tWGS\n')
+            f.write('SUBJ-0002\t2024-10-08\tStool\tp02_s1\tMetabolomics\tMET\n')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_import_builds_lineage(self):
+        """Test that every row gets a full lineage and an analysis ID."""
+        from io import StringIO
+        from django.core.management import call_command
+        from analysis.models import AnalysisID
+
+        call_command('import_legacy_data', self.tsv_path, '--chunk-size', '2', stdout=StringIO())
+
+        self.assertEqual(CrudeSample.objects.count(), 3)
+        self.assertEqual(Aliquot.objects.count(), 3)
+        self.assertEqual(Extract.objects.count(), 3)
+        self.assertEqual(SequenceLibrary.objects.count(), 2)
+        self.assertEqual(AnalysisID.objects.count(), 3)
+
+        library = SequenceLibrary.objects.get(barcode='p01_s1-ALIQ01-EXT01-LIB01')
+        self.assertEqual(library.parent.parent.parent_barcode.subject_id, 'SUBJ-0001')
+        self.assertEqual(library.history.count(), 1)
+
+        from .barcodes import lookup
+        self.assertEqual(lookup('p01_s1-ALIQ01-EXT01-LIB01'), (('sequencelibrary', library.pk),))
+        self.assertEqual((library.root_crude_barcode, library.root_subject_id), ('p01_s1', 'SUBJ-0001'))
+
+    def test_import_is_idempotent(self):
+        """Test that re-running the import does not duplicate samples or IDs."""
+        from io import StringIO
+        from django.core.management import call_command
+        from analysis.models import AnalysisID
+
+        call_command('import_legacy_data', self.tsv_path, stdout=StringIO())
+        call_command('import_legacy_data', self.tsv_path, stdout=StringIO())
+
+        self.assertEqual(CrudeSample.objects.count(), 3)
+        self.assertEqual(SequenceLibrary.objects.count(), 2)
+        self.assertEqual(AnalysisID.objects.count(), 3)
+
+
+class AdminStatsTestCase(TestCase):
+    """Test the dashboard snapshot and the cached admin statistics."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crude_sample = CrudeSample.objects.create(
+                barcode='CS001',
+                subject_id='SUBJ-0001',
+                date_created=date.today(),
+                collection_date=date.today(),
+                sample_source='Stool',
+                status='AVAILABLE',
+            )
+
+    def test_context_processor_is_lazy(self):
+        """Test that no queries run until a template touches admin_stats."""
+        from django.test import RequestFactory
+        from .context_processors import admin_stats
+
+        with self.assertNumQueries(0):
+            context = admin_stats(RequestFactory().get('/'))
+        with self.assertNumQueries(1):
+            self.assertEqual(context['admin_stats']['totals']['crude_samples'], 1)
+
+    def test_stats_are_cached_and_invalidated(self):
+        """Test that stats are served from cache until a sample changes."""
+        from .stats import get_admin_stats
+
+        with self.assertNumQueries(1):
+            stats = get_admin_stats()
+        self.assertEqual(stats['status_breakdowns']['available'], 1)
+        self.assertEqual(stats['recent_activity']['total'], 1)
+
+        with self.assertNumQueries(0):
+            get_admin_stats()
+
+        self.crude_sample.status = 'CONTAMINATED'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crude_sample.save()
+        stats = get_admin_stats()
+        self.assertEqual(stats['status_breakdowns']['available'], 0)
+        self.assertEqual(stats['problems']['total_issues'], 1)
+
+    def test_snapshot_moves_with_date_change(self):
+        """Test that changing a sample's date refreshes both affected days."""
+        from .stats import DashboardStats
+
+        self.crude_sample.date_created = date.today() - timedelta(days=60)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crude_sample.save()
+        stats = DashboardStats()
+        self.assertEqual(stats.count(CrudeSample), 1)
+        self.assertEqual(stats.count(CrudeSample, days=30), 0)
+
+    def test_stats_aggregated_in_database(self):
+        """Test that counts come from one grouped query, plus one per extra window."""
+        from .stats import DashboardStats
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CrudeSample.objects.create(
+                barcode='CS002', subject_id='SUBJ-0002', date_created=date.today() - timedelta(days=10),
+                collection_date=date.today() - timedelta(days=10), sample_source='Blood', status='AVAILABLE',
+            )
+        with self.assertNumQueries(1):
+            stats = DashboardStats()
+            self.assertEqual(stats.count(CrudeSample), 2)
+            self.assertEqual(stats.count(CrudeSample, days=7), 1)
+            self.assertEqual(stats.count(CrudeSample, days=30, status='AVAILABLE'), 2)
+        with self.assertNumQueries(1):
+            self.assertCountEqual(stats.breakdown(CrudeSample, 'category', 'sample_source', days=14),
+                                  [{'sample_source': 'Stool', 'count': 1}, {'sample_source': 'Blood', 'count': 1}])
+
+    def test_snapshot_matches_full_rebuild(self):
+        """Test that incremental refreshes agree with a full rebuild."""
+        from .models import DashboardSnapshot
+        from .stats import rebuild_snapshot
+
+        with self.captureOnCommitCallbacks(execute=True):
+            aliquot = Aliquot.objects.create(
+                barcode='AL001', parent_barcode=self.crude_sample, date_created=date.today(),
+            )
+            Extract.objects.create(
+                barcode='EX001', parent=aliquot, extract_type='DNA', quality_score=85, date_created=date.today(),
+            )
+        incremental = sorted(DashboardSnapshot.objects.values_list('model_name', 'date', 'status', 'category', 'bucket', 'count'))
+        rebuild_snapshot()
+        rebuilt = sorted(DashboardSnapshot.objects.values_list('model_name', 'date', 'status', 'category', 'bucket', 'count'))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_refresh_replaces_snapshot_rows(self):
+        """Test that refreshing twice keeps one row per group, which the database enforces."""
+        from .models import DashboardSnapshot
+        from .stats import DashboardStats, refresh_snapshot
+
+        refresh_snapshot(CrudeSample, [date.today()])
+        refresh_snapshot(CrudeSample, [date.today()])
+        self.assertEqual(DashboardStats().count(CrudeSample), 1)
+
+        row = DashboardSnapshot.objects.get(model_name='crudesample')
+        row.pk = None
+        with self.assertRaises(IntegrityError):
+            row.save()
+
+    def test_save_does_not_reread_the_row(self):
+        """Test that saving a loaded sample detects changes without selecting it again."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .stats import DashboardStats
+
+        sample = CrudeSample.objects.get(pk=self.crude_sample.pk)
+        sample.date_created = date.today() - timedelta(days=60)
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                sample.save()
+        self.assertFalse([
+            q['sql'] for q in queries
+            if q['sql'].startswith('SELECT') and 'FROM "sampletracking_crudesample"' in q['sql']
+        ])
+        self.assertEqual(DashboardStats().count(CrudeSample, days=30), 0)
+
+    def test_dashboard_command_reads_snapshot(self):
+        """Test the admin_dashboard command reads the same snapshot as the web dashboards."""
+        from io import StringIO
+        from django.core.management import call_command
+        from .stats import DashboardStats
+
+        stats = DashboardStats()
+        self.assertEqual(stats.breakdown(CrudeSample, 'category', 'sample_source'),
+                         [{'sample_source': 'Stool', 'count': 1}])
+
+        out = StringIO()
+        call_command('admin_dashboard', '--format', 'json', '--refresh', stdout=out)
+        self.assertIn('"crude_samples": 1', out.getvalue())
+
+
+class SampleSearchTestCase(TestCase):
+    """Test the full-text sample search index."""
+
+    def setUp(self):
+        self.crude_sample = CrudeSample.objects.create(
+            barcode='CS001',
+            subject_id='SUBJ-0001',
+            date_created=date.today(),
+            collection_date=date.today(),
+            sample_source='Stool',
+        )
+        self.aliquot = Aliquot.objects.create(
+            barcode='ALQ001',
+            parent_barcode=self.crude_sample,
+            date_created=date.today(),
+            notes='Thawed once',
+        )
+        self.extract = Extract.objects.create(
+            barcode='EXT001',
+            parent=self.aliquot,
+            extract_type='DNA',
+            date_created=date.today(),
+        )
+
+    def test_signals_maintain_documents(self):
+        """Test that saves and deletes keep the index in sync."""
+        from .models import SampleSearchDocument
+
+        self.assertEqual(SampleSearchDocument.objects.count(), 3)
+        document = SampleSearchDocument.objects.get(model_name='extract', object_id=self.extract.pk)
+        self.assertEqual(document.subject_id, 'SUBJ-0001')
+        self.assertEqual(document.sample_type, 'DNA')
+
+        self.extract.delete()
+        self.assertFalse(SampleSearchDocument.objects.filter(model_name='extract').exists())
+
+    def test_subject_change_propagates_to_descendants(self):
+        """Test that changing a crude sample's subject updates its lineage."""
+        from .models import SampleSearchDocument
+
+        self.crude_sample.subject_id = 'SUBJ-0002'
+        self.crude_sample.save()
+        self.assertEqual(
+            set(SampleSearchDocument.objects.values_list('subject_id', flat=True)), {'SUBJ-0002'}
+        )
+
+    def test_search_matches_barcodes_and_notes(self):
+        """Test trigram matching on barcodes, notes and crude sample subjects."""
+        from .search import SampleSearchResults
+
+        self.assertEqual([r['barcode'] for r in SampleSearchResults('ALQ0')], ['ALQ001'])
+        self.assertEqual([r['barcode'] for r in SampleSearchResults('thawed')], ['ALQ001'])
+        self.assertEqual([r['barcode'] for r in SampleSearchResults('SUBJ-0001')], ['CS001'])
+        self.assertEqual(SampleSearchResults('nomatch').count(), 0)
+
+    def test_short_query_falls_back_to_substring_match(self):
+        """Test that queries below the trigram length still match."""
+        from .search import SampleSearchResults
+
+        results = SampleSearchResults('T0')
+        self.assertEqual(results.count(), 1)
+        self.assertEqual(results[0]['barcode'], 'EXT001')
+
+    def test_results_are_fetched_page_by_page(self):
+        """Test that slicing loads only the requested page."""
+        from .search import SampleSearchResults
+
+        for i in range(2, 8):
+            CrudeSample.objects.create(
+                barcode=f'CS00{i}', subject_id='SUBJ-0009',
+                date_created=date.today() - timedelta(days=i),
+                collection_date=date.today(), sample_source='Stool',
+            )
+        results = SampleSearchResults('CS00')
+        with self.assertNumQueries(1):
+            self.assertEqual(results.count(), 7)
+        with self.assertNumQueries(1):
+            page = results[2:5]
+        self.assertEqual([r['barcode'] for r in page], ['CS003', 'CS004', 'CS005'])
+        self.assertEqual(page[0]['url'], reverse('crude_sample_detail', kwargs={'pk': CrudeSample.objects.get(barcode='CS003').pk}))
+
+    def test_rebuild_command(self):
+        """Test that the rebuild command restores a cleared index."""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import SampleSearchDocument
+
+        SampleSearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(SampleSearchDocument.objects.count(), 3)
+        self.assertEqual(SampleSearchDocument.objects.get(model_name='aliquot').subject_id, 'SUBJ-0001')
+
+    def test_keyset_pages_cover_all_matches(self):
+        """Test that following next-page cursors visits every match once, newest first."""
+        from .search import SampleSearchResults
+
+        for i in range(2, 8):
+            CrudeSample.objects.create(
+                barcode=f'CS00{i}', subject_id='SUBJ-0009',
+                date_created=date.today() - timedelta(days=i % 3),
+                collection_date=date.today(), sample_source='Stool',
+            )
+        results = SampleSearchResults('00')
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = results.page(cursor, size=3)
+            seen.extend(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(len(seen), 9)
+        self.assertEqual(len({(r['type'], r['barcode']) for r in seen}), 9)
+        dates = [r['date'] for r in seen]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    def test_invalid_cursor(self):
+        """Test that malformed cursors are rejected."""
+        from .search import SampleSearchResults
+
+        with self.assertRaises(ValueError):
+            SampleSearchResults('CS0').page('not-a-cursor')
+
+    def test_search_view_uses_cursors(self):
+        """Test that the search view links to the next page with a cursor."""
+        user = User.objects.create_user(username='searcher', password='searchpass')
+        for model in ('crudesample', 'aliquot', 'extract', 'sequencelibrary'):
+            user.user_permissions.add(Permission.objects.get(codename=f'view_{model}'))
+        self.client.login(username='searcher', password='searchpass')
+
+        url = reverse('search')
+        response = self.client.get(url, {'q': '001'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result_count'], 3)
+        self.assertFalse(response.context['page_obj'].has_next)
+        self.assertContains(response, 'ALQ001')
+
+        # Later pages are not counted
+        from .search import SampleSearchResults
+        cursor = SampleSearchResults('001').page(size=1).next_cursor
+        response = self.client.get(url, {'q': '001', 'cursor': cursor})
+        self.assertIsNone(response.context['result_count'])
+        self.assertEqual(len(response.context['results']), 2)
+        self.assertContains(response, 'More results for')
+
+        response = self.client.get(url, {'q': '001', 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_errors_are_reported(self):
+        """Test that a database error while fetching results shows a message, not a server error."""
+        from unittest import mock
+        from django.contrib.messages import get_messages
+        from django.db import OperationalError
+        from .search import SampleSearchResults
+
+        user = User.objects.create_user(username='searcher', password='searchpass')
+        for model in ('crudesample', 'aliquot', 'extract', 'sequencelibrary'):
+            user.user_permissions.add(Permission.objects.get(codename=f'view_{model}'))
+        self.client.login(username='searcher', password='searchpass')
+
+        with mock.patch.object(SampleSearchResults, '_fetch_after', side_effect=OperationalError('fts5: syntax error')):
+            response = self.client.get(reverse('search'), {'q': '001'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['results']), [])
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            ['An error occurred during search. Please try again.'],
+        )
+
+    def test_postgresql_search_uses_ilike(self):
+        """Test that PostgreSQL matches with ILIKE, which the trigram indexes serve."""
+        from django.db import connection
+        from .search import SampleSearchResults
+
+        if connection.vendor != 'postgresql':
+            self.skipTest('PostgreSQL only')
+        sql = str(SampleSearchResults('ALQ0')._orm_queryset().query)
+        self.assertIn('ILIKE', sql)
+        self.assertNotIn('UPPER(', sql)
+
+
+class BarcodeRegistryTestCase(TestCase):
+    """Test the barcode registry, its LRU cache and the scan endpoints."""
+
+    def setUp(self):
+        from .barcodes import barcode_cache
+        barcode_cache.clear()
+        self.crude_sample = CrudeSample.objects.create(
+            barcode='CS001',
+            subject_id='SUBJ-0001',
+            date_created=date.today(),
+            collection_date=date.today(),
+            sample_source='Stool',
+        )
+        self.aliquot = Aliquot.objects.create(
+            barcode='CS001-ALIQ01',
+            parent_barcode=self.crude_sample,
+            date_created=date.today(),
+        )
+        self.plate = Plate.objects.create(barcode='PLATE01')
+
+        self.user = User.objects.create_user(username='receiver', password='receivepass')
+        self.user.user_permissions.add(Permission.objects.get(codename='change_crudesample'))
+        self.client.login(username='receiver', password='receivepass')
+
+    def test_signals_maintain_registry(self):
+        """Test that saves and deletes keep the registry in sync."""
+        from .barcodes import lookup
+
+        self.assertEqual(lookup('CS001'), (('crudesample', self.crude_sample.pk),))
+        self.assertEqual(lookup('PLATE01'), (('plate', self.plate.pk),))
+
+        self.plate.barcode = 'PLATE02'
+        self.plate.save()
+        self.assertEqual(lookup('PLATE01'), ())
+        self.assertEqual(lookup('PLATE02'), (('plate', self.plate.pk),))
+
+        self.plate.delete()
+        self.assertEqual(lookup('PLATE02'), ())
+
+    def test_repeated_scans_hit_the_cache(self):
+        """Test that lookups are cached and a scan resolves with a single indexed query."""
+        from .barcodes import barcode_cache, get_by_barcode, lookup
+
+        lookup('CS001')
+        with self.assertNumQueries(0):
+            self.assertEqual(lookup('CS001'), (('crudesample', self.crude_sample.pk),))
+        self.assertEqual(barcode_cache.hits, 1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_by_barcode('CS001', CrudeSample), self.crude_sample)
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_by_barcode('CS001', Aliquot))
+
+    def test_receive_scan_ignores_stale_cache_entries(self):
+        """Test that the scan form re-reads a barcode renamed behind the cache's back."""
+        from .barcodes import lookup
+        from .models import BarcodeRegistry
+
+        # No children, so the rename below leaves no dangling parent_barcode
+        childless = CrudeSample.objects.create(
+            barcode='CS002',
+            subject_id='SUBJ-0002',
+            date_created=date.today(),
+            collection_date=date.today(),
+            sample_source='Stool',
+        )
+        lookup('CS002')
+        # Simulate a rename made by another process: no signals, no cache eviction
+        CrudeSample.objects.filter(pk=childless.pk).update(barcode='CS009')
+        BarcodeRegistry.objects.filter(barcode='CS002').update(barcode='CS009')
+
+        response = self.client.post(reverse('find_sample_to_receive'), {'barcode': 'CS002'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'No sample found')
+        self.assertEqual(lookup('CS002'), ())
+
+    def test_stale_cache_entry_is_not_returned(self):
+        """Test that a barcode changed behind the cache's back is re-resolved."""
+        from .barcodes import get_by_barcode
+        from .models import BarcodeRegistry
+
+        get_by_barcode('CS001-ALIQ01', Aliquot)
+        # Simulate a rename made by another process: no signals, no cache eviction
+        Aliquot.objects.filter(pk=self.aliquot.pk).update(barcode='CS001-ALIQ02')
+        BarcodeRegistry.objects.filter(model_name='aliquot').update(barcode='CS001-ALIQ02')
+
+        self.assertIsNone(get_by_barcode('CS001-ALIQ01', Aliquot))
+        self.assertEqual(get_by_barcode('CS001-ALIQ02', Aliquot).pk, self.aliquot.pk)
+
+    def test_prefix_lookup(self):
+        """Test that prefix lookups are ordered and limited."""
+        from .barcodes import prefix_lookup
+
+        self.assertEqual(
+            [barcode for barcode, model_name, object_id in prefix_lookup('CS0')],
+            ['CS001', 'CS001-ALIQ01'],
+        )
+        self.assertEqual(len(prefix_lookup('CS0', limit=1)), 1)
+        self.assertEqual(prefix_lookup('cs0'), [])
+
+    def test_lookup_endpoints(self):
+        """Test the exact and prefix JSON endpoints."""
+        self.user.user_permissions.add(*Permission.objects.filter(
+            codename__in=['view_crudesample', 'view_aliquot', 'view_plate'],
+        ))
+        response = self.client.get(reverse('barcode_lookup'), {'barcode': 'CS001-ALIQ01'})
+        self.assertEqual(response.status_code, 200)
+        match = response.json()['matches'][0]
+        self.assertEqual(match['model'], 'aliquot')
+        self.assertEqual(match['url'], reverse('aliquot_detail', kwargs={'pk': self.aliquot.pk}))
+
+        response = self.client.get(reverse('barcode_lookup'), {'barcode': 'MISSING'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('barcode_lookup'), {'barcode': 'bad barcode;'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse('barcode_prefix_lookup'), {'prefix': 'PL'})
+        self.assertEqual(response.json()['matches'][0]['type'], 'Plate')
+
+    def test_lookup_endpoints_require_view_permissions(self):
+        """Test that the JSON endpoints only list barcodes the user may view."""
+        response = self.client.get(reverse('barcode_prefix_lookup'), {'prefix': 'CS0'})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(reverse('barcode_lookup'), {'barcode': 'CS001'})
+        self.assertEqual(response.status_code, 403)
+
+        self.user.user_permissions.add(Permission.objects.get(codename='view_crudesample'))
+        response = self.client.get(reverse('barcode_prefix_lookup'), {'prefix': 'CS0'})
+        self.assertEqual([match['barcode'] for match in response.json()['matches']], ['CS001'])
+        response = self.client.get(reverse('barcode_lookup'), {'barcode': 'CS001-ALIQ01'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_scan_to_receive(self):
+        """Test that scanning a crude sample barcode leads to the receive form."""
+        response = self.client.post(reverse('find_sample_to_receive'), {'barcode': 'CS001'})
+        self.assertRedirects(response, reverse('receive_sample', kwargs={'barcode': 'CS001'}),
+                             fetch_redirect_response=False)
+
+        # The scan form screens the same words it always has; SELECT is allowed
+        CrudeSample.objects.create(
+            barcode='SELECTA-01', subject_id='SUBJ-0002', date_created=date.today(),
+            collection_date=date.today(), sample_source='Stool',
+        )
+        response = self.client.post(reverse('find_sample_to_receive'), {'barcode': 'SELECTA-01'})
+        self.assertRedirects(response, reverse('receive_sample', kwargs={'barcode': 'SELECTA-01'}),
+                             fetch_redirect_response=False)
+        response = self.client.post(reverse('find_sample_to_receive'), {'barcode': 'CS001-DROP'})
+        self.assertContains(response, 'Invalid barcode format.')
+
+        response = self.client.post(reverse('find_sample_to_receive'), {'barcode': 'CS001-ALIQ01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'not a crude sample')
+
+
+class LineageReportTestCase(TestCase):
+    """Test the database-side lineage aggregates behind the daily report."""
+
+    def setUp(self):
+        self.day = date(2024, 10, 5)
+        self.crude_sample = CrudeSample.objects.create(
+            barcode='CS001', subject_id='SUBJ-0001', date_created=self.day,
+            collection_date=self.day, sample_source='Stool',
+        )
+        CrudeSample.objects.create(
+            barcode='CS002', subject_id='SUBJ-0002', date_created=self.day,
+            collection_date=self.day, sample_source='Stool',
+        )
+        for i, offset in enumerate((3, 1), start=1):
+            aliquot = Aliquot.objects.create(
+                barcode=f'ALQ00{i}', parent_barcode=self.crude_sample,
+                date_created=self.day + timedelta(days=offset),
+            )
+            extract = Extract.objects.create(
+                barcode=f'EXT00{i}', parent=aliquot, extract_type='DNA',
+                date_created=self.day + timedelta(days=offset + 1),
+            )
+        SequenceLibrary.objects.create(
+            barcode='LIB001', parent=extract, date_created=self.day + timedelta(days=7),
+        )
+
+    def test_earliest_dates_in_one_query(self):
+        """Test that earliest descendant dates are computed per crude sample."""
+        from .lineage import with_lineage_dates
+
+        with self.assertNumQueries(1):
+            rows = {
+                cs.barcode: (cs.first_aliquot_date, cs.first_extract_date, cs.first_library_date)
+                for cs in with_lineage_dates(CrudeSample.objects.all())
+            }
+        self.assertEqual(rows['CS001'], (
+            self.day + timedelta(days=1), self.day + timedelta(days=2), self.day + timedelta(days=7),
+        ))
+        self.assertEqual(rows['CS002'], (None, None, None))
+
+    def test_report_view(self):
+        """Test that the daily report lists each crude sample with its lineage dates."""
+        User.objects.create_user(username='reporter', password='reportpass')
+        self.client.login(username='reporter', password='reportpass')
+
+        response = self.client.post(reverse('daily_status_report'), {'report_date': '2024-10-05'})
+        self.assertEqual(response.status_code, 200)
+        report = response.context['report_data']
+        self.assertEqual([row['patient_id'] for row in report], ['SUBJ-0001', 'SUBJ-0002'])
+        self.assertEqual(report[0]['aliquot_date'], self.day + timedelta(days=1))
+        self.assertEqual(report[0]['library_date'], self.day + timedelta(days=7))
+
+
+class LineageColumnsTestCase(TestCase):
+    """Test the denormalized root subject and crude barcode columns."""
+
+    def setUp(self):
+        self.crude_sample = CrudeSample.objects.create(
+            barcode='CS001', subject_id='SUBJ-0001', date_created=date.today(),
+            collection_date=date.today(), sample_source='Stool',
+        )
+        self.other_crude = CrudeSample.objects.create(
+            barcode='CS002', subject_id='SUBJ-0002', date_created=date.today(),
+            collection_date=date.today(), sample_source='Stool',
+        )
+        self.aliquot = Aliquot.objects.create(
+            barcode='ALQ001', parent_barcode=self.crude_sample, date_created=date.today(),
+        )
+        self.extract = Extract.objects.create(
+            barcode='EXT001', parent=self.aliquot, extract_type='DNA', date_created=date.today(),
+        )
+        self.library = SequenceLibrary.objects.create(
+            barcode='LIB001', parent=self.extract, date_created=date.today(),
+        )
+
+    def roots(self):
+        return [
+            (obj.root_crude_barcode, obj.root_subject_id)
+            for obj in (
+                Aliquot.objects.get(pk=self.aliquot.pk),
+                Extract.objects.get(pk=self.extract.pk),
+                SequenceLibrary.objects.get(pk=self.library.pk),
+            )
+        ]
+
+    def test_columns_set_on_save(self):
+        """Test that descendants copy the root columns from their parent."""
+        self.assertEqual(self.roots(), [('CS001', 'SUBJ-0001')] * 3)
+        extract = Extract.objects.get(pk=self.extract.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(extract), 'EXT001 (SUBJ-0001)')
+
+    def test_subject_change_propagates(self):
+        """Test that editing a crude sample's subject updates its lineage."""
+        from .models import SampleSearchDocument
+
+        self.crude_sample.subject_id = 'SUBJ-0009'
+        self.crude_sample.save()
+        self.assertEqual(self.roots(), [('CS001', 'SUBJ-0009')] * 3)
+        self.assertEqual(SampleSearchDocument.objects.get(model_name='sequencelibrary').subject_id, 'SUBJ-0009')
+
+    def test_reparenting_propagates(self):
+        """Test that moving an aliquot to another crude sample updates its descendants."""
+        self.aliquot.parent_barcode = self.other_crude
+        self.aliquot.save()
+        self.assertEqual(self.roots(), [('CS002', 'SUBJ-0002')] * 3)
+
+    def test_repair_command(self):
+        """Test that the repair command finds and fixes out-of-sync rows."""
+        from io import StringIO
+        from django.core.management import call_command
+
+        Extract.objects.update(root_subject_id='', root_crude_barcode='')
+        SequenceLibrary.objects.update(root_subject_id='WRONG')
+
+        out = StringIO()
+        call_command('repair_lineage', '--dry-run', stdout=out)
+        self.assertIn('Extracts: 1 out of sync', out.getvalue())
+        self.assertEqual(self.roots()[1], ('', ''))
+
+        call_command('repair_lineage', stdout=StringIO())
+        self.assertEqual(self.roots(), [('CS001', 'SUBJ-0001')] * 3)
+
+    def test_orphans_rejected_by_database(self):
+        """Test that derived samples without a parent still raise IntegrityError."""
+        from django.db import transaction
+
+        for model, fields in (
+            (Aliquot, {'parent_barcode': None}),
+            (Extract, {'parent': None, 'extract_type': 'DNA'}),
+            (SequenceLibrary, {'parent': None}),
+        ):
+            with self.subTest(model=model.__name__):
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    model.objects.create(barcode=f'ORPHAN-{model.__name__}', date_created=date.today(), **fields)
+
+
+class StreamingExportTestCase(TestCase):
+    """Test the streaming label, sample and report exports."""
+
+    def setUp(self):
+        self.crude_sample = CrudeSample.objects.create(
+            barcode='CS001', subject_id='SUBJ-0001', date_created=date(2024, 10, 5),
+            collection_date=date(2024, 10, 5), sample_source='Stool',
+        )
+        self.aliquot = Aliquot.objects.create(
+            barcode='ALQ001', parent_barcode=self.crude_sample, date_created=date(2024, 10, 6),
+        )
+        self.user = User.objects.create_user(username='exporter', password='exportpass')
+        self.client.login(username='exporter', password='exportpass')
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_label_export(self):
+        """Test that labels stream with the root subject ID, as CSV or gzipped TSV."""
+        import gzip
+
+        response = self.client.post(reverse('export_labels'), {
+            'model_type': 'aliquot', 'selected_samples': [self.aliquot.pk],
+        })
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(self.content(response).decode(), 'SubjectID,Barcode\r\nSUBJ-0001,ALQ001\r\n')
+
+        response = self.client.post(reverse('export_labels'), {
+            'model_type': 'aliquot', 'selected_samples': [self.aliquot.pk], 'format': 'tsv', 'gzip': '1',
+        })
+        self.assertIn('sample_labels.tsv.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(self.content(response)).decode(), 'SubjectID\tBarcode\r\nSUBJ-0001\tALQ001\r\n')
+
+        response = self.client.post(reverse('export_labels'), {'model_type': 'aliquot'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_sample_export_columns(self):
+        """Test exporting a whole model with chosen columns."""
+        url = reverse('export_samples', kwargs={'model_type': 'crudesample'})
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.user.user_permissions.add(Permission.objects.get(codename='view_crudesample'))
+        response = self.client.get(url, {'columns': 'barcode,subject_id'})
+        self.assertEqual(self.content(response).decode(), 'barcode,subject_id\r\nCS001,SUBJ-0001\r\n')
+
+        response = self.client.get(url, {'columns': 'barcode,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_blocks_are_bounded(self):
+        """Test that rows are written in fixed-size blocks."""
+        from .exports import iter_blocks
+
+        blocks = list(iter_blocks(['n'], ([i] for i in range(1200)), block_rows=500))
+        self.assertEqual(len(blocks), 3)
+        self.assertEqual(''.join(blocks).count('\r\n'), 1201)
+
+    def test_report_export(self):
+        """Test that the comprehensive report exports its aggregated rows."""
+        response = self.client.get(reverse('comprehensive_report'), {'export': 'csv', 'sample_type': 'Stool'})
+        lines = self.content(response).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:6], ['Subject ID', 'Barcode', 'Sample Type', 'Collection Date', 'Status', 'Aliquots'])
+        self.assertEqual(lines[1], 'SUBJ-0001,CS001,Stool,2024-10-05,AWAITING_RECEIPT,1,0,0,2024-10-06,,')
+
+
+class ComprehensiveReportTestCase(TestCase):
+    """Test the paginated, aggregated comprehensive report."""
+
+    def setUp(self):
+        for i in range(55):
+            CrudeSample.objects.create(
+                barcode=f'CS{i:03d}', subject_id=f'SUBJ-{i:04d}', date_created=date(2024, 10, 5),
+                collection_date=date(2024, 10, 5), sample_source='Stool',
+            )
+        aliquot = Aliquot.objects.create(
+            barcode='ALQ000', parent_barcode=CrudeSample.objects.get(barcode='CS000'), date_created=date(2024, 10, 7),
+        )
+        Extract.objects.create(barcode='EXT000', parent=aliquot, date_created=date(2024, 10, 8))
+        User.objects.create_user(username='reporter', password='reportpass')
+        self.client.login(username='reporter', password='reportpass')
+
+    def test_report_is_paginated_and_aggregated(self):
+        """Test that one page is rendered with database-side counts."""
+        from .reports import REPORT_PAGE_SIZE, report_queryset
+
+        response = self.client.get(reverse('comprehensive_report'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_samples'], 55)
+        self.assertEqual(len(response.context['report_data']), REPORT_PAGE_SIZE)
+
+        with self.assertNumQueries(1):
+            first = report_queryset(sample_type='Stool').get(barcode='CS000')
+        self.assertEqual((first.aliquot_count, first.extract_count, first.library_count), (1, 1, 0))
+        self.assertEqual(first.latest_extract_date, date(2024, 10, 8))
+        self.assertIsNone(first.latest_library_date)
+
+        response = self.client.get(reverse('comprehensive_report'), {'page': 2})
+        self.assertEqual(len(response.context['report_data']), 5)
+
+    def test_background_report(self):
+        """Test that an asynchronous export is queued, written by a worker and downloaded."""
+        import tempfile
+        from io import StringIO
+        from pathlib import Path
+        from unittest import mock
+        from django.core.management import call_command
+        from . import reports
+        from .models import Job
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(reports, 'REPORTS_DIR', Path(tmpdir)):
+            response = self.client.get(reverse('comprehensive_report'), {'export': 'csv', 'async': '1'})
+            self.assertEqual(response.status_code, 302)
+
+            status_page = self.client.get(response['Location'])
+            self.assertEqual(status_page.status_code, 200)
+            self.assertEqual(status_page.context['status'], 'running')
+            self.assertEqual(status_page.context['job'].status, Job.PENDING)
+
+            call_command('run_jobs', '--once', '--workers', '0', stdout=StringIO())
+            job = Job.objects.get(kind='comprehensive_report')
+            self.assertEqual(job.status, Job.DONE)
+            self.assertEqual((job.progress, job.total), (55, 55))
+
+            response = self.client.get(response['Location'])
+            self.assertEqual(response['Content-Disposition'], 'attachment; filename="comprehensive_report.csv"')
+            self.assertEqual(b''.join(response.streaming_content).count(b'\n'), 56)
+
+            self.assertEqual(reports.report_status('0' * 32), (None, None))
+            response = self.client.get(reverse('report_download', kwargs={'token': 'not-a-token'}))
+            self.assertEqual(response.status_code, 404)
+
+    def test_expired_reports_are_deleted(self):
+        """Test that the job worker deletes report files older than REPORT_RETENTION."""
+        import os
+        import tempfile
+        import time
+        from io import StringIO
+        from pathlib import Path
+        from unittest import mock
+        from django.core.management import call_command
+        from . import reports
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(reports, 'REPORTS_DIR', Path(tmpdir)):
+            expired = time.time() - reports.REPORT_RETENTION - 60
+            for name in ('old.csv', 'old.tsv.part', 'old.error'):
+                (Path(tmpdir) / name).write_text('x')
+                os.utime(Path(tmpdir) / name, (expired, expired))
+            (Path(tmpdir) / 'new.csv').write_text('x')
+
+            call_command('run_jobs', '--once', '--workers', '0', stdout=StringIO())
+            self.assertEqual(sorted(path.name for path in Path(tmpdir).iterdir()), ['new.csv'])
+
+    def test_expiry_skips_unfinished_reports(self):
+        """Test that expired files of queued or running report jobs are kept."""
+        import os
+        import tempfile
+        import time
+        from pathlib import Path
+        from unittest import mock
+        from . import reports
+        from .jobs import submit_job
+        from .models import Job
+
+        queued, running, done = 'a' * 32, 'b' * 32, 'c' * 32
+        for token in (queued, running, done):
+            submit_job('comprehensive_report', {'token': token, 'filters': {}, 'fmt': 'csv', 'compress': False})
+        Job.objects.filter(params__token=running).update(status=Job.RUNNING)
+        Job.objects.filter(params__token=done).update(status=Job.DONE)
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(reports, 'REPORTS_DIR', Path(tmpdir)):
+            expired = time.time() - reports.REPORT_RETENTION - 60
+            for name in (f'{queued}.csv.part', f'{running}.csv.part', f'{done}.csv'):
+                (Path(tmpdir) / name).write_text('x')
+                os.utime(Path(tmpdir) / name, (expired, expired))
+
+            self.assertEqual(reports.expire_reports(), 1)
+            self.assertEqual(
+                sorted(path.name for path in Path(tmpdir).iterdir()),
+                [f'{queued}.csv.part', f'{running}.csv.part'],
+            )
+
+    def test_download_of_expired_report(self):
+        """Test that a report deleted between the status check and the download is a 404."""
+        import tempfile
+        from pathlib import Path
+        from unittest import mock
+        from . import views
+
+        token = 'd' * 32
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(views, 'report_status', return_value=('ready', Path(tmpdir) / f'{token}.csv')):
+            response = self.client.get(reverse('report_download', kwargs={'token': token}))
+        self.assertEqual(response.status_code, 404)
+
+
+class JobQueueTestCase(TestCase):
+    """Test the database-backed background job queue."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jobuser', password='jobpass')
+        self.client.login(username='jobuser', password='jobpass')
+
+    def run_worker(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('run_jobs', '--once', '--workers', '0', stdout=out)
+        return out.getvalue()
+
+    def test_jobs_are_claimed_once_in_order(self):
+        """Test that pending jobs are claimed oldest first and never twice."""
+        from .jobs import claim_next_job, submit_job
+        from .models import Job
+
+        first = submit_job('security_audit', {'days': 1})
+        second = submit_job('security_audit', {'days': 2})
+        self.assertEqual(claim_next_job(), first.pk)
+        self.assertEqual(claim_next_job(), second.pk)
+        self.assertIsNone(claim_next_job())
+        self.assertEqual(Job.objects.filter(status=Job.RUNNING).count(), 2)
+
+        with self.assertRaises(ValueError):
+            submit_job('no_such_job')
+
+    def test_stale_running_jobs_are_failed(self):
+        """Test that a job whose worker stopped sending heartbeats is failed on the next claim."""
+        from .jobs import JOB_STALE_AFTER, JobContext, claim_next_job, submit_job
+        from .models import Job
+
+        abandoned = submit_job('security_audit', {'days': 1})
+        alive = submit_job('security_audit', {'days': 2})
+        self.assertEqual(claim_next_job(), abandoned.pk)
+        self.assertEqual(claim_next_job(), alive.pk)
+
+        long_ago = timezone.now() - timedelta(seconds=JOB_STALE_AFTER + 60)
+        Job.objects.update(started_at=long_ago, heartbeat_at=long_ago)
+        JobContext(alive).progress(1, 2)
+
+        self.assertIsNone(claim_next_job())
+        abandoned.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(abandoned.status, Job.FAILED)
+        self.assertIn('stopped responding', abandoned.error)
+        self.assertIsNotNone(abandoned.finished_at)
+        self.assertEqual(alive.status, Job.RUNNING)
+
+    def test_security_audit_job(self):
+        """Test that a queued security audit runs and stores its report."""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import Job
+
+        call_command('security_audit', '--background', '--days', '3', stdout=StringIO())
+        job = Job.objects.get()
+        self.assertEqual((job.kind, job.status, job.params), ('security_audit', Job.PENDING, {'days': 3}))
+
+        output = self.run_worker()
+        self.assertIn('1 jobs run', output)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.percent, 100)
+        self.assertIn('Security Audit Report - Last 3 days', job.result['report'])
+        self.assertIsNotNone(job.finished_at)
+
+    def test_import_job_records_failure(self):
+        """Test that a failing job is marked failed with its error."""
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import Job
+
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv') as f:
+            f.write('subject_id\tcollection_date\nS1\t2024-01-01\n')
+            f.flush()
+            call_command('import_legacy_data', f.name, '--background', stdout=StringIO())
+            self.run_worker()
+
+        job = Job.objects.get(kind='import_legacy_data')
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('Missing required columns', job.error)
+        self.assertIsNone(job.result)
+
+    def test_job_status_endpoint(self):
+        """Test that job progress can be polled by its owner only."""
+        from .jobs import submit_job
+
+        job = submit_job('security_audit', {'days': 7}, user=self.user)
+        response = self.client.get(reverse('job_status', kwargs={'pk': job.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'PENDING')
+        self.assertIsNone(response.json()['result'])
+
+        self.run_worker()
+        data = self.client.get(reverse('job_status', kwargs={'pk': job.pk})).json()
+        self.assertEqual(data['status'], 'DONE')
+        self.assertIn('report', data['result'])
+
+        User.objects.create_user(username='other', password='otherpass')
+        self.client.login(username='other', password='otherpass')
+        response = self.client.get(reverse('job_status', kwargs={'pk': job.pk}))
+        self.assertEqual(response.status_code, 404)
+
+
+class JobProgressTestCase(TransactionTestCase):
+    """Test that a running job's progress is committed while it runs."""
+
+    def read_job_elsewhere(self, pk):
+        """Read a Job row from another thread, i.e. another database connection."""
+        import threading
+        from django.db import connection
+        from .models import Job
+
+        seen = {}
+
+        def read():
+            try:
+                seen['job'] = Job.objects.values('progress', 'total', 'message').get(pk=pk)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        return seen['job']
+
+    def test_import_progress_is_visible_to_other_connections(self):
+        """Test that import progress can be polled from another connection mid-import."""
+        import tempfile
+        from unittest import mock
+        from .jobs import JobContext, claim_next_job, run_job, submit_job
+        from .models import Job
+
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv') as f:
+            f.write('subject_id\tcollection_date\tsample_source\tsequence_filename\tExtract Type\tAnalysis Type\n')
+            for i in range(3):
+                f.write(f'SUBJ-{i}\t2024-10-0{i + 1}\tStool\tjob_s{i}\tDNA\tMSS\n')
+            f.flush()
+            job = submit_job('import_legacy_data', {'path': f.name, 'chunk_size': 1})
+            self.assertEqual(claim_next_job(), job.pk)
+
+            polled = []
+            report = JobContext.progress
+
+            def progress(context, done, total=None, message=None):
+                report(context, done, total, message)
+                polled.append(self.read_job_elsewhere(job.pk))
+
+            with mock.patch.object(JobContext, 'progress', progress):
+                self.assertEqual(run_job(job.pk), Job.DONE)
+
+        self.assertEqual(
+            [(p['progress'], p['total']) for p in polled],
+            [(0, 3), (1, 3), (2, 3), (3, 3), (3, 3)],
+        )
+        self.assertEqual(polled[-1]['message'], 'Import complete')
+        self.assertEqual(CrudeSample.objects.count(), 3)
+
+
+class NearDuplicateBarcodeTestCase(TestCase):
+    """Test near-duplicate barcode clustering and its use in the security audit."""
+
+    def test_clusters(self):
+        """Test that barcodes within two substitutions are clustered transitively."""
+        from .near_duplicates import near_duplicate_clusters
+
+        barcodes = [
+            'CS-1000', 'CS-1001', 'CS-1011',  # chain of single substitutions
+            'CS-1999',                         # three substitutions from each of them
+            'XY-0000', 'XY-0099',              # two substitutions
+            'CS-10000',                        # different length
+            'AB', 'AC',                        # too short to check
+        ]
+        clusters = near_duplicate_clusters(barcodes)
+        self.assertEqual(clusters, [['CS-1000', 'CS-1001', 'CS-1011'], ['XY-0000', 'XY-0099']])
+        self.assertEqual(near_duplicate_clusters(barcodes, max_distance=1), [['CS-1000', 'CS-1001', 'CS-1011']])
+        self.assertEqual(near_duplicate_clusters([]), [])
+
+    def test_matches_pairwise_comparison(self):
+        """Test that clustering agrees with a brute-force pairwise comparison, whatever the group sizes."""
+        import random
+        from unittest import mock
+        from . import near_duplicates
+        from .near_duplicates import near_duplicate_clusters
+
+        rng = random.Random(7)
+        barcodes = sorted({''.join(rng.choice('AB01') for _ in range(5)) for _ in range(60)})
+        parent = {barcode: barcode for barcode in barcodes}
+
+        def find(barcode):
+            while parent[barcode] != barcode:
+                barcode = parent[barcode]
+            return barcode
+
+        for i, first in enumerate(barcodes):
+            for second in barcodes[i + 1:]:
+                if sum(a != b for a, b in zip(first, second)) <= 2:
+                    parent[find(first)] = find(second)
+        expected = {}
+        for barcode in barcodes:
+            expected.setdefault(find(barcode), []).append(barcode)
+        expected = sorted(group for group in expected.values() if len(group) > 1)
+
+        self.assertEqual(sorted(near_duplicate_clusters(barcodes)), expected)
+        # Every pigeonhole group compared by masked columns instead of pair by pair
+        with mock.patch.object(near_duplicates, 'MAX_PAIRWISE_GROUP', 1):
+            self.assertEqual(sorted(near_duplicate_clusters(barcodes)), expected)
+
+    def test_security_audit_reports_clusters(self):
+        """Test that the security audit lists near-duplicate barcode clusters."""
+        from io import StringIO
+        from django.core.management import call_command
+
+        for barcode in ('CS-1000', 'CS-1001', 'ZZ-9999'):
+            CrudeSample.objects.create(
+                barcode=barcode, subject_id='SUBJ-1', date_created=date(2024, 10, 5),
+                collection_date=date(2024, 10, 5), sample_source='Stool',
+            )
+        out = StringIO()
+        call_command('security_audit', stdout=out)
+        output = out.getvalue()
+        self.assertIn('Crude Samples: 1 near-duplicate clusters (2 barcodes)', output)
+        self.assertIn('Crude Sample: CS-1000, CS-1001', output)
+        self.assertNotIn('ZZ-9999', output)
+
+
+class RateLimiterTestCase(TestCase):
+    """Test the sliding-window rate limiter and its use in SecurityMiddleware."""
+
+    def test_sliding_window(self):
+        """Test that the previous window's hits count in proportion to their overlap."""
+        from .ratelimit import LocalBackend, SlidingWindowRateLimiter
+
+        limiter = SlidingWindowRateLimiter('test', limit=10, window=60, backend=LocalBackend())
+        self.assertFalse(any(limiter.hit('1.2.3.4', now=600 + i) for i in range(10)))
+        self.assertTrue(limiter.hit('1.2.3.4', now=615))
+        self.assertFalse(limiter.hit('5.6.7.8', now=615))
+
+        # Halfway through the next window half of the 11 earlier hits still count
+        self.assertFalse(any(limiter.hit('1.2.3.4', now=690) for _ in range(4)))
+        self.assertTrue(limiter.hit('1.2.3.4', now=690))
+        # Two windows later the old hits no longer count
+        self.assertFalse(limiter.hit('1.2.3.4', now=800))
+
+    def test_local_backend_is_bounded(self):
+        """Test that the local backend evicts the oldest counters and expires them."""
+        from .ratelimit import LocalBackend
+
+        now = [0.0]
+        backend = LocalBackend(max_keys=3, clock=lambda: now[0])
+        for key in 'abcd':
+            backend.incr(key, timeout=10)
+        self.assertEqual(len(backend), 3)
+        self.assertEqual(backend.get('a'), 0)
+        self.assertEqual(backend.incr('d', timeout=10), 2)
+
+        now[0] = 11.0
+        self.assertEqual(backend.get('d'), 0)
+        self.assertEqual(backend.incr('d', timeout=10), 1)
+
+    def test_cache_backend(self):
+        """Test that the cache backend counts in the shared rate limit cache."""
+        from django.core.cache import caches
+        from django.core.cache.backends.locmem import LocMemCache
+        from .ratelimit import RATE_LIMIT_CACHE, CacheBackend
+
+        self.assertNotIsInstance(caches[RATE_LIMIT_CACHE], LocMemCache)
+        caches[RATE_LIMIT_CACHE].clear()
+        backend = CacheBackend()
+        self.assertEqual([backend.incr('counter', timeout=60) for _ in range(3)], [1, 2, 3])
+        self.assertEqual(backend.get('counter'), 3)
+        self.assertEqual(backend.get('missing'), 0)
+
+        with self.assertLogs('security', level='WARNING') as logs:
+            CacheBackend('default')
+        self.assertIn('per-process LocMemCache', logs.output[0])
+
+    def test_missing_cache_table_falls_back(self):
+        """Test that a database rate limit cache without its table is replaced by the default cache."""
+        from django.conf import settings
+        from django.core.cache import caches
+        from django.test import override_settings
+        from .ratelimit import RATE_LIMIT_CACHE, CacheBackend
+
+        missing = {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'no_such_cache_table'}
+        with override_settings(CACHES={**settings.CACHES, RATE_LIMIT_CACHE: missing}):
+            with self.assertLogs('security', level='ERROR') as logs:
+                backend = CacheBackend()
+            self.assertIs(backend.cache, caches['default'])
+            self.assertEqual(backend.incr('counter', timeout=60), 1)
+        self.assertIn('createcachetable', logs.output[0])
+
+    def test_middleware_rate_limit(self):
+        """Test that SecurityMiddleware answers 429 once an IP exceeds its limit."""
+        from django.core.cache import caches
+        from django.http import HttpResponse
+        from django.test import RequestFactory, override_settings
+        from .middleware import SecurityMiddleware
+        from .ratelimit import RATE_LIMIT_CACHE
+
+        caches[RATE_LIMIT_CACHE].clear()
+        with override_settings(MAX_REQUESTS_PER_MINUTE=3):
+            middleware = SecurityMiddleware(lambda request: HttpResponse('ok'))
+            other = SecurityMiddleware(lambda request: HttpResponse('ok'))
+        factory = RequestFactory()
+        with self.assertLogs('security', level='WARNING'):
+            statuses = [middleware(factory.get('/', REMOTE_ADDR='10.0.0.1')).status_code for _ in range(4)]
+            self.assertEqual(statuses, [200, 200, 200, 429])
+            self.assertEqual(middleware(factory.get('/', REMOTE_ADDR='10.0.0.2')).status_code, 200)
+            # The other instance (another worker) shares the counters
+            self.assertEqual(other(factory.get('/', REMOTE_ADDR='10.0.0.1')).status_code, 429)
+
+
+class SuspiciousPatternTestCase(TestCase):
+    """Test the compiled suspicious-pattern matchers and their callers."""
+
+    def test_matcher(self):
+        """Test that a matcher finds any pattern regardless of case."""
+        from .patterns import PatternMatcher, is_suspicious
+
+        matcher = PatternMatcher(['DROP TABLE', 'drop', '<script', 'a.b'])
+        self.assertEqual(matcher.search('x; Drop Table samples'), 'drop table')
+        self.assertEqual(matcher.search('<SCRIPT>alert(1)</script>'), '<script')
+        self.assertIsNone(matcher.search('axb'))  # patterns are literal, not regexes
+        self.assertIsNone(matcher.search(''))
+        self.assertFalse(PatternMatcher([]).matches('anything'))
+
+        self.assertTrue(is_suspicious('CS-001;DELETE', 'barcode'))
+        self.assertFalse(is_suspicious('CS-001-ALIQ01', 'barcode'))
+        self.assertTrue(is_suspicious('sqlmap/1.7', 'user_agent'))
+
+    def test_middleware_detection(self):
+        """Test that SecurityMiddleware screens paths, user agents and forwarded headers."""
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .middleware import SecurityMiddleware
+
+        middleware = SecurityMiddleware(lambda request: HttpResponse('ok'))
+        factory = RequestFactory()
+        self.assertFalse(middleware.detect_suspicious_activity(factory.get('/search/', {'q': 'SUBJ-0042'})))
+        self.assertTrue(middleware.detect_suspicious_activity(factory.get('/static/../../etc/passwd')))
+        self.assertTrue(middleware.detect_suspicious_activity(factory.get('/', HTTP_USER_AGENT='Nikto/2.5')))
+        self.assertTrue(middleware.detect_suspicious_activity(
+            factory.get('/', HTTP_X_FORWARDED_HOST='evil.php')
+        ))
+
+    def test_search_rejects_suspicious_query(self):
+        """Test that the search view returns nothing for an injection attempt."""
+        from django.contrib.auth.models import Permission
+
+        user = User.objects.create_user(username='searcher', password='searchpass')
+        user.user_permissions.add(*Permission.objects.filter(codename__in=[
+            'view_crudesample', 'view_aliquot', 'view_extract', 'view_sequencelibrary',
+        ]))
+        self.client.login(username='searcher', password='searchpass')
+        with self.assertLogs('sampletracking', level='WARNING'):
+            response = self.client.get(reverse('search'), {'q': "x'; DROP TABLE samples"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['results']), 0)
+
+    def test_benchmark_command(self):
+        """Test that the micro-benchmark reports both strategies."""
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('benchmark_patterns', '--iterations', '10', stdout=out)
+        self.assertIn('Compiled matcher', out.getvalue())
+        self.assertIn('µs per request', out.getvalue())
+
+
+class PerformanceInstrumentationTestCase(TestCase):
+    """Test the request performance middleware, endpoint and command."""
+
+    def setUp(self):
+        import tempfile
+        from pathlib import Path
+        from unittest import mock
+        from . import perf
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        patcher = mock.patch.object(perf, 'PERF_STATS_DIR', Path(tmpdir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        perf.performance_stats.reset()
+
+        self.staff = User.objects.create_user(username='perfstaff', password='perfpass', is_staff=True)
+        User.objects.create_user(username='perfuser', password='perfpass')
+
+    def test_rolling_histogram(self):
+        """Test bucketing, percentiles and expiry of old slots."""
+        from .perf import RollingHistogram, percentile
+
+        histogram = RollingHistogram((10, 100, 1000), window=120)
+        for value in [5] * 90 + [50] * 9 + [5000]:
+            histogram.add(value, now=1000)
+        data = histogram.to_dict(now=1000)
+        self.assertEqual(data['counts'], [90, 9, 0, 1])
+        self.assertEqual((percentile(data, 0.5), percentile(data, 0.95), percentile(data, 1.0)), (10, 100, 5000))
+
+        # Values are kept per minute: the first slot starts at 960
+        histogram.add(20, now=1050)
+        self.assertEqual(histogram.to_dict(now=1050)['count'], 101)
+        self.assertEqual(histogram.to_dict(now=1130)['counts'], [0, 1, 0, 0])
+
+    def test_requests_are_recorded(self):
+        """Test that the middleware records queries, templates and size per view."""
+        from .perf import performance_stats
+
+        self.client.login(username='perfuser', password='perfpass')
+        self.client.get(reverse('comprehensive_report'))
+        self.client.get(reverse('comprehensive_report'))
+
+        metrics = performance_stats.snapshot()['comprehensive_report']
+        self.assertEqual(metrics['wall_ms']['count'], 2)
+        self.assertGreater(metrics['queries']['max'], 0)
+        self.assertGreater(metrics['template_ms']['sum'], 0)
+        self.assertGreater(metrics['response_bytes']['sum'], 0)
+        self.assertLessEqual(metrics['db_ms']['sum'], metrics['wall_ms']['sum'])
+
+    def test_streaming_responses_are_measured(self):
+        """Test that a streamed export is recorded once its body has been sent."""
+        from .perf import performance_stats
+
+        User.objects.create_superuser(username='perfadmin', email='perf@example.com', password='perfpass')
+        self.client.login(username='perfadmin', password='perfpass')
+        response = self.client.get(reverse('export_samples', args=['extract']))
+        self.assertTrue(response.streaming)
+        self.assertNotIn('export_samples', performance_stats.snapshot())
+
+        body = b''.join(response.streaming_content)
+        metrics = performance_stats.snapshot()['export_samples']
+        self.assertEqual(metrics['wall_ms']['count'], 1)
+        self.assertEqual(metrics['response_bytes']['sum'], len(body))
+        self.assertGreater(metrics['queries']['max'], 0)
+
+    def test_flush_expires_old_snapshots(self):
+        """Test that snapshots not rewritten within the window are deleted."""
+        import os
+        import time
+        from . import perf
+
+        old = perf.PERF_STATS_DIR / '1.json'
+        recent = perf.PERF_STATS_DIR / '2.json'
+        perf.PERF_STATS_DIR.mkdir(parents=True, exist_ok=True)
+        for path in (old, recent):
+            path.write_text('{"written": 0, "views": {}}')
+        long_ago = time.time() - perf.PERF_WINDOW_MINUTES * 60 - 60
+        os.utime(old, (long_ago, long_ago))
+
+        perf.performance_stats.flush()
+        self.assertFalse(old.exists())
+        self.assertTrue(recent.exists())
+        self.assertTrue((perf.PERF_STATS_DIR / f"{os.getpid()}.json").exists())
+
+    def test_endpoint_and_command_merge_processes(self):
+        """Test that snapshots flushed by other processes are merged in."""
+        import json
+        import os
+        from io import StringIO
+        from django.core.management import call_command
+        from . import perf
+
+        perf.performance_stats.record('other_view', {'wall_ms': 250, 'queries': 3})
+        perf.performance_stats.flush()
+        # Pretend the snapshot was written by another worker
+        (perf.PERF_STATS_DIR / f"{os.getpid()}.json").rename(perf.PERF_STATS_DIR / '1.json')
+        perf.performance_stats.reset()
+
+        self.client.login(username='perfuser', password='perfpass')
+        self.assertEqual(self.client.get(reverse('performance_stats')).status_code, 403)
+
+        self.client.login(username='perfstaff', password='perfpass')
+        data = self.client.get(reverse('performance_stats')).json()
+        views = {row['view']: row for row in data['views']}
+        self.assertEqual(views['other_view']['requests'], 1)
+        self.assertEqual(views['other_view']['p95_ms'], 250)
+        self.assertEqual(views['other_view']['avg_queries'], 3)
+
+        out = StringIO()
+        call_command('performance_stats', stdout=out)
+        self.assertIn('other_view (1 requests)', out.getvalue())
+        out = StringIO()
+        call_command('performance_stats', '--json', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['other_view']['wall_ms']['count'], 1)
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """
+    Pin the number of queries of every list, detail, search, report, export
+    and admin changelist view, so it stays the same at 10, 100 and 1000 rows.
+    """
+
+    # view -> maximum queries, for a superuser (no permission lookups)
+    VIEW_BUDGETS = {
+        'crude_sample_list': 4,
+        'aliquot_list': 4,
+        'extract_list': 4,
+        'library_list': 4,
+        'crude_sample_detail': 4,
+        'aliquot_detail': 4,
+        'extract_detail': 4,
+        'library_detail': 5,
+        'search': 4,
+        'daily_status_report': 4,
+        'comprehensive_report': 4,
+        'comprehensive_report_export': 4,
+        'export_samples': 3,
+    }
+    ADMIN_CHANGELIST_BUDGET = 8
+    SIZES = (10, 100, 1000)
+
+    def setUp(self):
+        User.objects.create_superuser(username='budget', email='budget@example.com', password='budgetpass')
+        self.client.login(username='budget', password='budgetpass')
+        self.plate = Plate.objects.create(barcode='PLATE-BUDGET')
+        self.rows = 0
+
+    def grow_to(self, size):
+        """Bulk-create full lineages until there are `size` of each sample type."""
+        from .search import rebuild_search_index
+
+        new = range(self.rows, size)
+        CrudeSample.objects.bulk_create([
+            CrudeSample(barcode=f'CS{i:05d}', subject_id=f'SUBJ-{i:05d}', collection_date=date(2024, 1, 1),
+                        date_created=date(2024, 1, 1), sample_source='Stool')
+            for i in new
+        ])
+        Aliquot.objects.bulk_create([
+            Aliquot(barcode=f'AL{i:05d}', parent_barcode_id=f'CS{i:05d}', root_crude_barcode=f'CS{i:05d}',
+                    root_subject_id=f'SUBJ-{i:05d}', date_created=date(2024, 1, 2))
+            for i in new
+        ])
+        Extract.objects.bulk_create([
+            Extract(barcode=f'EX{i:05d}', parent_id=f'AL{i:05d}', root_crude_barcode=f'CS{i:05d}',
+                    root_subject_id=f'SUBJ-{i:05d}', date_created=date(2024, 1, 3))
+            for i in new
+        ])
+        extract_pks = dict(Extract.objects.values_list('barcode', 'pk'))
+        SequenceLibrary.objects.bulk_create([
+            SequenceLibrary(barcode=f'LB{i:05d}', parent_id=extract_pks[f'EX{i:05d}'], plate=self.plate,
+                            well=f'W{i}', root_crude_barcode=f'CS{i:05d}', root_subject_id=f'SUBJ-{i:05d}',
+                            date_created=date(2024, 1, 4))
+            for i in new
+        ])
+        rebuild_search_index()
+        self.rows = size
+
+    def view_requests(self):
+        """(name, method, url, data) for every pinned view."""
+        first = {model: model.objects.order_by('pk').values_list('pk', flat=True).first()
+                 for model in (CrudeSample, Aliquot, Extract, SequenceLibrary)}
+        return [
+            ('crude_sample_list', 'get', reverse('crude_sample_list'), None),
+            ('aliquot_list', 'get', reverse('aliquot_list'), None),
+            ('extract_list', 'get', reverse('extract_list'), None),
+            ('library_list', 'get', reverse('library_list'), None),
+            ('crude_sample_detail', 'get', reverse('crude_sample_detail', args=[first[CrudeSample]]), None),
+            ('aliquot_detail', 'get', reverse('aliquot_detail', args=[first[Aliquot]]), None),
+            ('extract_detail', 'get', reverse('extract_detail', args=[first[Extract]]), None),
+            ('library_detail', 'get', reverse('library_detail', args=[first[SequenceLibrary]]), None),
+            ('search', 'get', reverse('search'), {'q': 'SUBJ'}),
+            ('daily_status_report', 'post', reverse('daily_status_report'), {'report_date': '2024-01-01'}),
+            ('comprehensive_report', 'get', reverse('comprehensive_report'), None),
+            ('comprehensive_report_export', 'get', reverse('comprehensive_report'), {'export': 'csv'}),
+            ('export_samples', 'get', reverse('export_samples', args=['extract']), None),
+        ]
+
+    def test_budget_context_manager(self):
+        """Test that query_budget raises with the repeated queries listed."""
+        from .querybudget import QueryBudgetExceeded, query_budget
+
+        with query_budget(1):
+            CrudeSample.objects.count()
+        with self.assertRaises(QueryBudgetExceeded) as caught:
+            with query_budget(2, label='loop'):
+                for _ in range(3):
+                    list(CrudeSample.objects.filter(pk=1))
+        self.assertIn('loop ran 3 queries, budget is 2', str(caught.exception))
+        self.assertIn('3x SELECT', str(caught.exception))
+
+        @query_budget(0)
+        def count():
+            return CrudeSample.objects.count()
+        with self.assertRaises(QueryBudgetExceeded):
+            count()
+
+        @query_budget(2, label='recursive')
+        def count_down(depth):
+            CrudeSample.objects.count()
+            if depth:
+                count_down(depth - 1)
+        count_down(1)
+        # The innermost call is within budget; the outer one, counting its own, is not
+        with self.assertRaises(QueryBudgetExceeded) as caught:
+            count_down(2)
+        self.assertIn('recursive ran 3 queries', str(caught.exception))
+
+    def test_view_query_counts_do_not_grow(self):
+        """Test every pinned view at 10, 100 and 1000 rows."""
+        for size in self.SIZES:
+            self.grow_to(size)
+            for name, method, url, data in self.view_requests():
+                with self.subTest(view=name, rows=size):
+                    with self.assertQueryBudget(self.VIEW_BUDGETS[name], label=f"{name} at {size} rows"):
+                        response = getattr(self.client, method)(url, data)
+                        if response.streaming:
+                            self.assertEqual(b''.join(response.streaming_content).count(b'\n'), size + 1)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_admin_changelist_query_counts_do_not_grow(self):
+        """Test every sample and plate admin changelist at 10, 100 and 1000 rows."""
+        for size in self.SIZES:
+            self.grow_to(size)
+            for model_name in ('crudesample', 'aliquot', 'extract', 'sequencelibrary', 'plate'):
+                with self.subTest(model=model_name, rows=size):
+                    self.assertViewQueryBudget(
+                        reverse(f'admin:sampletracking_{model_name}_changelist'), self.ADMIN_CHANGELIST_BUDGET,
+                    )
+
+    def test_middleware_logs_requests_over_budget(self):
+        """Test that QUERY_BUDGET makes the performance middleware log offenders."""
+        from django.test import override_settings
+
+        self.grow_to(10)
+        with override_settings(QUERY_BUDGET=1), self.assertLogs('sampletracking', level='WARNING') as logs:
+            self.client.get(reverse('crude_sample_list'))
+        self.assertIn('Query budget exceeded: crude_sample_list ran 4 queries (budget 1)', logs.output[0])
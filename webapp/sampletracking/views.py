@@ -1,18 +1,18 @@
 from django.views.generic import ListView, CreateView, UpdateView, DetailView, TemplateView, FormView, View
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, permission_required
 from django.urls import reverse_lazy, reverse
 from django.contrib import messages
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
-from django.db.models import Q
 from datetime import datetime, time
 import logging
 import re
-import csv
-from django.http import HttpResponse
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, HttpResponseBadRequest, Http404, JsonResponse
+from django.db import DatabaseError
 
-from .models import CrudeSample, Aliquot, Extract, SequenceLibrary
+from .models import CrudeSample, Aliquot, Extract, SequenceLibrary, Job
 from .forms import (
     CrudeSampleForm, 
     AliquotForm, 
@@ -21,6 +21,30 @@ from .forms import (
     AccessioningForm,
     ReportForm
 )
+from . import barcodes
+from .exports import (
+    EXPORT_FORMATS,
+    LABEL_HEADER,
+    label_fields,
+    queryset_rows,
+    resolve_columns,
+    stream_blocks,
+    streaming_export,
+)
+from .lineage import with_lineage_dates
+from .patterns import is_suspicious
+from .perf import PERF_WINDOW_MINUTES, collect_stats, summarize
+from .reports import (
+    ASYNC_REPORT_THRESHOLD,
+    REPORT_PAGE_SIZE,
+    filter_crude_samples,
+    report_blocks,
+    report_job,
+    report_queryset,
+    report_status,
+    start_report,
+)
+from .search import MODEL_BY_NAME as SEARCH_MODEL_BY_NAME, SEARCHABLE_MODELS, SampleSearchResults, SearchPage
 
 # Set up logging for security events
 logger = logging.getLogger('sampletracking')
@@ -30,6 +54,8 @@ MAX_LOGIN_ATTEMPTS = 5
 BARCODE_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
 MAX_SEARCH_QUERY_LENGTH = 100
 MIN_SEARCH_QUERY_LENGTH = 2
+MIN_BARCODE_PREFIX_LENGTH = 2
+MAX_BARCODE_PREFIX_RESULTS = 100
 
 
 class HomeView(TemplateView):
@@ -184,7 +210,9 @@ class ReceiveSampleView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView)
 
     def get_object(self, queryset=None):
         barcode = self.kwargs.get('barcode')
-        sample = get_object_or_404(CrudeSample, barcode=barcode)
+        sample = barcodes.get_by_barcode(barcode, CrudeSample)
+        if sample is None:
+            raise Http404(f"No crude sample with barcode '{barcode}'.")
         return sample
 
     def get_context_data(self, **kwargs):
@@ -230,16 +258,21 @@ def find_sample_to_receive(request):
             return render(request, 'sampletracking/find_sample_form.html')
         
         # Check for suspicious patterns
-        suspicious_patterns = ['<script', 'javascript:', 'DROP', 'DELETE', 'INSERT', 'UPDATE', '--', ';']
-        if any(pattern.lower() in barcode.lower() for pattern in suspicious_patterns):
+        if is_suspicious(barcode, 'scanned_barcode'):
             logger.critical(f"Suspicious barcode pattern detected from user {request.user.username}: {barcode}")
             messages.error(request, "Invalid barcode format.")
             return render(request, 'sampletracking/find_sample_form.html')
         
         try:
-            if CrudeSample.objects.filter(barcode=barcode).exists():
+            if barcodes.get_by_barcode(barcode, CrudeSample) is not None:
                 logger.info(f"Barcode search successful by user {request.user.username}: {barcode}")
                 return redirect('receive_sample', barcode=barcode)
+            # Only to explain the error, but still never from a stale cache entry
+            model_names = [model_name for model_name, object_id in barcodes.lookup(barcode, cached=False)]
+            if model_names:
+                label = barcodes.MODEL_BY_NAME[model_names[0]]._meta.verbose_name
+                logger.info(f"Non-receivable barcode scanned by user {request.user.username}: {barcode} ({label})")
+                messages.error(request, f"Barcode '{barcode}' belongs to a {label}, not a crude sample.")
             else:
                 logger.info(f"Barcode not found by user {request.user.username}: {barcode}")
                 messages.error(request, f"No sample found with barcode '{barcode}'. Please register it first.")
@@ -250,6 +283,62 @@ def find_sample_to_receive(request):
     return render(request, 'sampletracking/find_sample_form.html')
 
 
+def barcode_entry(barcode, model_name, object_id):
+    """Describe a barcode registry entry for the lookup endpoints."""
+    model = barcodes.MODEL_BY_NAME[model_name]
+    url_name = SEARCHABLE_MODELS.get(model, (None, None))[1]
+    return {
+        'barcode': barcode,
+        'type': model._meta.verbose_name,
+        'model': model_name,
+        'pk': object_id,
+        'url': reverse(url_name, kwargs={'pk': object_id}) if url_name else None,
+    }
+
+
+def visible_entries(user, entries):
+    """Keep the barcode registry entries of the models `user` may view."""
+    return [entry for entry in entries if user.has_perm(f'sampletracking.view_{entry[-2]}')]
+
+
+@login_required
+@permission_required('sampletracking.view_crudesample', raise_exception=True)
+def barcode_lookup(request):
+    """
+    Resolve a scanned barcode to the sample or plate that owns it (JSON).
+    Only samples and plates of types the user may view are listed.
+    """
+    barcode = request.GET.get('barcode', '').strip()
+    if not barcode or len(barcode) > 255 or not BARCODE_PATTERN.match(barcode):
+        return JsonResponse({'error': 'Invalid barcode.'}, status=400)
+
+    entries = visible_entries(request.user, barcodes.lookup(barcode))
+    matches = [barcode_entry(barcode, *entry) for entry in entries]
+    return JsonResponse({'barcode': barcode, 'found': bool(matches), 'matches': matches},
+                        status=200 if matches else 404)
+
+
+@login_required
+@permission_required('sampletracking.view_crudesample', raise_exception=True)
+def barcode_prefix_lookup(request):
+    """
+    List the barcodes starting with a prefix, for scanner autocompletion (JSON).
+    Only samples and plates of types the user may view are listed.
+    """
+    prefix = request.GET.get('prefix', '').strip()
+    if len(prefix) < MIN_BARCODE_PREFIX_LENGTH or len(prefix) > 255 or not BARCODE_PATTERN.match(prefix):
+        return JsonResponse({'error': 'Invalid barcode prefix.'}, status=400)
+    try:
+        limit = int(request.GET.get('limit', barcodes.PREFIX_LOOKUP_LIMIT))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit.'}, status=400)
+    limit = max(1, min(limit, MAX_BARCODE_PREFIX_RESULTS))
+
+    entries = visible_entries(request.user, barcodes.prefix_lookup(prefix, limit))
+    matches = [barcode_entry(*entry) for entry in entries]
+    return JsonResponse({'prefix': prefix, 'matches': matches})
+
+
 @login_required
 def collection_landing(request):
     """
@@ -449,94 +538,55 @@ class SampleSearchView(PermissionRequiredMixin, ListView):
             query = query[:MAX_SEARCH_QUERY_LENGTH]
         
         # Check for suspicious patterns that might indicate injection attempts
-        suspicious_patterns = ['<script', 'javascript:', 'DROP TABLE', 'DELETE FROM', 'INSERT INTO', 'UPDATE ', '--', ';']
-        if any(pattern.lower() in query.lower() for pattern in suspicious_patterns):
+        if is_suspicious(query, 'search'):
             logger.warning(f"Suspicious search query detected from user {self.request.user.username}: {query}")
             return []
         
+        # Nothing is read yet: the results are fetched page by page from the
+        # search index (paginate_queryset) and only counted for the first
+        # page (get_context_data), which is where search errors are handled
+        logger.info(f"Search completed by user {self.request.user.username}")
+        return SampleSearchResults(query)
+    
+    def search_failed(self, error):
+        logger.error(f"Search error for user {self.request.user.username}: {str(error)}")
+        messages.error(self.request, "An error occurred during search. Please try again.")
+    
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Page through search results with keyset cursors instead of page
+        numbers, so only the rows of the current page are read.
+        """
+        if not isinstance(queryset, SampleSearchResults):
+            return super().paginate_queryset(queryset, page_size)
         try:
-            # Search across all sample types with optimized queries
-            crude_samples = CrudeSample.objects.filter(
-                Q(barcode__icontains=query) | 
-                Q(subject_id__icontains=query) |
-                Q(notes__icontains=query)
-            ).select_related('created_by', 'updated_by')
-            
-            aliquots = Aliquot.objects.filter(
-                Q(barcode__icontains=query) |
-                Q(notes__icontains=query)
-            ).select_related('parent_barcode', 'created_by', 'updated_by')
-            
-            extracts = Extract.objects.filter(
-                Q(barcode__icontains=query) |
-                Q(notes__icontains=query) |
-                Q(extract_type__icontains=query)
-            ).select_related('parent', 'parent__parent_barcode', 'created_by', 'updated_by')
-
-            libraries = SequenceLibrary.objects.filter(
-                Q(barcode__icontains=query) |
-                Q(notes__icontains=query) |
-                Q(library_type__icontains=query)
-            ).select_related('parent', 'parent__parent', 'parent__parent__parent_barcode', 'plate', 'created_by', 'updated_by')
-            
-            # Combine results with type information
-            results = []
-            for sample in crude_samples:
-                results.append({
-                    'type': 'Crude Sample',
-                    'object': sample,
-                    'barcode': sample.barcode,
-                    'sample_id': sample.subject_id if sample.subject_id else 'N/A',
-                    'date': sample.date_created,
-                    'url': reverse('crude_sample_detail', kwargs={'pk': sample.pk})
-                })
-            for sample in aliquots:
-                results.append({
-                    'type': 'Aliquot',
-                    'object': sample,
-                    'barcode': sample.barcode,
-                    'sample_id': sample.parent_barcode.subject_id if sample.parent_barcode and sample.parent_barcode.subject_id else 'N/A',
-                    'date': sample.date_created,
-                    'url': reverse('aliquot_detail', kwargs={'pk': sample.pk})
-                })
-            for sample in extracts:
-                # Get subject_id through parent aliquot -> crude sample chain
-                sample_id = 'N/A'
-                if sample.parent and sample.parent.parent_barcode:
-                    sample_id = sample.parent.parent_barcode.subject_id if sample.parent.parent_barcode.subject_id else 'N/A'
-                results.append({
-                    'type': 'Extract',
-                    'object': sample,
-                    'barcode': sample.barcode,
-                    'sample_id': sample_id,
-                    'date': sample.date_created,
-                    'url': reverse('extract_detail', kwargs={'pk': sample.pk})
-                })
-            for sample in libraries:
-                # Get subject_id through parent extract -> aliquot -> crude sample chain
-                sample_id = 'N/A'
-                if sample.parent and sample.parent.parent and sample.parent.parent.parent_barcode:
-                    sample_id = sample.parent.parent.parent_barcode.subject_id if sample.parent.parent.parent_barcode.subject_id else 'N/A'
-                results.append({
-                    'type': 'Sequence Library',
-                    'object': sample,
-                    'barcode': sample.barcode,
-                    'sample_id': sample_id,
-                    'date': sample.date_created,
-                    'url': reverse('library_detail', kwargs={'pk': sample.pk})
-                })
-            
-            logger.info(f"Search completed by user {self.request.user.username}: {len(results)} results found")
-            return sorted(results, key=lambda x: x['date'], reverse=True)
-            
-        except Exception as e:
-            logger.error(f"Search error for user {self.request.user.username}: {str(e)}")
-            messages.error(self.request, "An error occurred during search. Please try again.")
-            return []
+            page = queryset.page(self.request.GET.get('cursor'), page_size)
+        except ValueError:
+            raise Http404("Invalid page cursor.")
+        except DatabaseError as e:
+            self.search_failed(e)
+            page = SearchPage([])
+        return None, page, page.results, page.has_next
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['query'] = self.request.GET.get('q', '')
+        if isinstance(self.object_list, SampleSearchResults):
+            cursor = self.request.GET.get('cursor', '')
+            page = context['page_obj']
+            # Counting every match would defeat keyset pagination, so the
+            # total is shown on the first page only
+            if cursor:
+                context['result_count'] = None
+            elif page.has_next:
+                try:
+                    context['result_count'] = self.object_list.count()
+                except DatabaseError as e:
+                    self.search_failed(e)
+                    context['result_count'] = None
+            else:
+                context['result_count'] = len(page)
+            context['cursor'] = cursor
         return context
 
 
@@ -550,143 +600,147 @@ class ReportView(LoginRequiredMixin, FormView):
     def form_valid(self, form):
         report_date = form.cleaned_data['report_date']
         
-        # 1. Get all crude samples for the selected day.
-        crude_samples = list(CrudeSample.objects.filter(collection_date=report_date).order_by('subject_id'))
-        
-        # Get all barcodes from these crude samples to use in subsequent queries.
-        crude_barcodes = [cs.barcode for cs in crude_samples]
-
-        # 2. Get all aliquots that are children of these crude samples.
-        aliquots = Aliquot.objects.filter(parent_barcode__barcode__in=crude_barcodes).select_related('parent_barcode')
-        aliquot_barcodes = [a.barcode for a in aliquots]
-
-        # 3. Get all extracts that are children of these aliquots.
-        extracts = Extract.objects.filter(parent__barcode__in=aliquot_barcodes).select_related('parent')
-        extract_pks = [e.pk for e in extracts]
-
-        # 4. Get all libraries that are children of these extracts.
-        libraries = SequenceLibrary.objects.filter(parent_id__in=extract_pks).select_related('parent')
-
-        # Create sets for quick lookups
-        aliquot_parent_barcodes = {a.parent_barcode.barcode for a in aliquots}
-        extract_parent_barcodes = {e.parent.barcode for e in extracts}
-        library_parent_pks = {l.parent.pk for l in libraries}
-
-        # Build the final report data structure
-        report_data = []
-        for cs in crude_samples:
-            # Get the earliest aliquot date for this crude sample
-            aliquot_date = None
-            child_aliquots = [a for a in aliquots if a.parent_barcode.barcode == cs.barcode]
-            if child_aliquots:
-                aliquot_date = min(a.date_created for a in child_aliquots)
-            
-            # Get the earliest extract date for the children of this crude sample
-            extract_date = None
-            child_aliquot_barcodes = {a.barcode for a in child_aliquots}
-            child_extracts = [e for e in extracts if e.parent.barcode in child_aliquot_barcodes]
-            if child_extracts:
-                extract_date = min(e.date_created for e in child_extracts)
-
-            # Get the earliest library date for the grandchildren of this crude sample
-            library_date = None
-            child_extract_pks = {e.pk for e in child_extracts}
-            child_libraries = [l for l in libraries if l.parent.pk in child_extract_pks]
-            if child_libraries:
-                library_date = min(l.date_created for l in child_libraries)
-
-            report_data.append({
+        # Earliest aliquot, extract and library dates are aggregated in the
+        # database, so the report is a single query however busy the day was.
+        crude_samples = with_lineage_dates(
+            CrudeSample.objects.filter(collection_date=report_date)
+        ).order_by('subject_id')
+
+        report_data = [
+            {
                 'patient_id': cs.subject_id,
                 'sample_type': cs.get_sample_source_display(),
                 'collection_date': cs.collection_date,
-                'aliquot_date': aliquot_date,
-                'extract_date': extract_date,
-                'library_date': library_date,
-            })
+                'aliquot_date': cs.first_aliquot_date,
+                'extract_date': cs.first_extract_date,
+                'library_date': cs.first_library_date,
+            }
+            for cs in crude_samples
+        ]
 
         # Pass the processed data and the date back to the template context
         context = self.get_context_data(form=form, report_data=report_data, report_date=report_date)
         return self.render_to_response(context)
 
 
-class ComprehensiveReportView(LoginRequiredMixin, TemplateView):
+class ComprehensiveReportView(LoginRequiredMixin, ListView):
     """
     View for generating comprehensive sample reports with filtering options.
+
+    Child counts and latest child dates are computed in the database and the
+    report is paginated, so only one page of crude samples is loaded.
+    `?export=csv|tsv` streams the whole filtered report instead; very large
+    exports (or `async=1`) are generated in the background.
     """
     template_name = 'sampletracking/comprehensive_report.html'
+    context_object_name = 'report_data'
+    paginate_by = REPORT_PAGE_SIZE
+    
+    def get_filters(self):
+        return {
+            'date_from': self.request.GET.get('date_from'),
+            'date_to': self.request.GET.get('date_to'),
+            'sample_type': self.request.GET.get('sample_type'),
+        }
+    
+    def get_queryset(self):
+        return report_queryset(**self.get_filters())
+    
+    def get(self, request, *args, **kwargs):
+        fmt = request.GET.get('export')
+        if fmt in EXPORT_FORMATS:
+            return self.export(fmt, compress=bool(request.GET.get('gzip')))
+        return super().get(request, *args, **kwargs)
+    
+    def export(self, fmt, compress=False):
+        filters = self.get_filters()
+        if self.request.GET.get('async') or filter_crude_samples(**filters).count() > ASYNC_REPORT_THRESHOLD:
+            token = start_report(filters, fmt, compress, user=self.request.user)
+            logger.info(f"Background report {token} queued by user {self.request.user.username}")
+            return redirect('report_download', token=token)
+        return stream_blocks('comprehensive_report', report_blocks(filters, fmt), fmt, compress)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        # Get filter parameters from request
-        date_from = self.request.GET.get('date_from')
-        date_to = self.request.GET.get('date_to')
-        sample_type = self.request.GET.get('sample_type')
-        
-        # Start with all crude samples
-        crude_samples = CrudeSample.objects.all()
-        
-        # Apply date filters
-        if date_from:
-            crude_samples = crude_samples.filter(collection_date__gte=date_from)
-        if date_to:
-            crude_samples = crude_samples.filter(collection_date__lte=date_to)
-        
-        # Apply sample type filter
-        if sample_type and sample_type != 'all':
-            crude_samples = crude_samples.filter(sample_source=sample_type)
-        
-        # Order by collection date and prefetch related objects to avoid N+1 queries
-        crude_samples = crude_samples.order_by('-collection_date', 'subject_id').prefetch_related(
-            'aliquots',
-            'aliquots__extracts', 
-            'aliquots__extracts__libraries'
-        )
-        
-        # Build report data efficiently
-        report_data = []
-        for cs in crude_samples:
-            # Get all related objects from prefetched data
-            aliquots = list(cs.aliquots.all())
-            extracts = []
-            libraries = []
-            
-            for aliquot in aliquots:
-                aliquot_extracts = list(aliquot.extracts.all())
-                extracts.extend(aliquot_extracts)
-                
-                for extract in aliquot_extracts:
-                    libraries.extend(list(extract.libraries.all()))
-            
-            # Calculate counts and latest items
-            latest_aliquot = max(aliquots, key=lambda x: x.date_created) if aliquots else None
-            latest_extract = max(extracts, key=lambda x: x.date_created) if extracts else None
-            latest_library = max(libraries, key=lambda x: x.date_created) if libraries else None
-            
-            report_data.append({
-                'crude_sample': cs,
-                'aliquot_count': len(aliquots),
-                'extract_count': len(extracts),
-                'library_count': len(libraries),
-                'latest_aliquot': latest_aliquot,
-                'latest_extract': latest_extract,
-                'latest_library': latest_library,
-            })
-        
-        # Get sample type choices for filter dropdown
-        sample_type_choices = CrudeSample.SAMPLE_SOURCE_CHOICES
-        
+        filters = self.get_filters()
         context.update({
-            'report_data': report_data,
-            'sample_type_choices': sample_type_choices,
-            'date_from': date_from,
-            'date_to': date_to,
-            'selected_sample_type': sample_type,
-            'total_samples': len(report_data),
+            'sample_type_choices': CrudeSample.SAMPLE_SOURCE_CHOICES,
+            'date_from': filters['date_from'],
+            'date_to': filters['date_to'],
+            'selected_sample_type': filters['sample_type'],
+            'total_samples': context['paginator'].count,
         })
-        
         return context
 
+
+@login_required
+def report_download(request, token):
+    """
+    Download a background report once ready, or show its progress.
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', token):
+        raise Http404("Unknown report.")
+    status, detail = report_status(token)
+    if status is None:
+        raise Http404("Unknown report.")
+    if status == 'ready':
+        try:
+            report = open(detail, 'rb')
+        except FileNotFoundError:
+            # Expired between the status check and the open
+            raise Http404("Unknown report.")
+        return FileResponse(report, as_attachment=True,
+                            filename=detail.name.replace(token, 'comprehensive_report'))
+    job = report_job(token)
+    if status == 'running' and job is not None and job.status == Job.FAILED:
+        status, detail = 'failed', job.error.strip().splitlines()[-1]
+    return render(request, 'sampletracking/report_status.html', {
+        'status': status,
+        'error': detail if status == 'failed' else None,
+        'job': job,
+    })
+
+
+@login_required
+def job_status(request, pk):
+    """
+    Poll a background job's progress as JSON. Users can see their own jobs;
+    staff can see all of them.
+    """
+    job = get_object_or_404(Job, pk=pk)
+    if job.created_by_id != request.user.pk and not request.user.is_staff:
+        raise Http404("Unknown job.")
+    return JsonResponse({
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'percent': job.percent,
+        'message': job.message,
+        'result': job.result if job.status == Job.DONE else None,
+        'error': job.error if job.status == Job.FAILED else '',
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    })
+
+
+@login_required
+def performance_stats(request):
+    """
+    Per-view request timings, query counts and response sizes over the last
+    PERF_WINDOW_MINUTES minutes, slowest first, as JSON. Staff only.
+    """
+    if not request.user.is_staff:
+        raise PermissionDenied
+    stats = collect_stats()
+    data = {'window_minutes': PERF_WINDOW_MINUTES, 'views': summarize(stats)}
+    if request.GET.get('histograms'):
+        data['histograms'] = stats
+    return JsonResponse(data)
+
+
 class SampleSubmittedView(TemplateView):
     """
     A generic success page that can link back to the creation form.
@@ -708,39 +762,53 @@ class SampleSubmittedView(TemplateView):
         return context
 
 class ExportLabelsView(LoginRequiredMixin, View):
+    """
+    Stream the subject ID and barcode of the selected samples for label
+    printing, as CSV (default) or TSV, optionally gzip-compressed.
+    """
     def post(self, request, *args, **kwargs):
         sample_pks = request.POST.getlist('selected_samples')
         model_type = request.POST.get('model_type')
+        fmt = request.POST.get('format', 'csv')
 
         if not sample_pks:
             messages.error(request, "You didn\'t select any samples to export.")
             # Redirect back to the referring page, or a default
             return redirect(request.META.get('HTTP_REFERER', 'home'))
 
-        response = HttpResponse(
-            content_type='text/csv',
-            headers={'Content-Disposition': 'attachment; filename="sample_labels.csv"'},
-        )
-
-        writer = csv.writer(response)
-        writer.writerow(['SubjectID', 'Barcode'])
-
-        queryset = None
-        if model_type == 'crudesample':
-            queryset = CrudeSample.objects.filter(pk__in=sample_pks)
-            for sample in queryset:
-                writer.writerow([sample.subject_id, sample.barcode])
-        elif model_type == 'aliquot':
-            queryset = Aliquot.objects.filter(pk__in=sample_pks).select_related('parent_barcode')
-            for sample in queryset:
-                writer.writerow([sample.parent_barcode.subject_id, sample.barcode])
-        elif model_type == 'extract':
-            queryset = Extract.objects.filter(pk__in=sample_pks).select_related('parent__parent_barcode')
-            for sample in queryset:
-                writer.writerow([sample.parent.parent_barcode.subject_id, sample.barcode])
-        elif model_type == 'sequencelibrary':
-            queryset = SequenceLibrary.objects.filter(pk__in=sample_pks).select_related('parent__parent__parent_barcode')
-            for sample in queryset:
-                writer.writerow([sample.parent.parent.parent_barcode.subject_id, sample.barcode])
-
-        return response
\ No newline at end of file
+        model = SEARCH_MODEL_BY_NAME.get(model_type)
+        if model is None or fmt not in EXPORT_FORMATS:
+            messages.error(request, "Invalid export request.")
+            return redirect(request.META.get('HTTP_REFERER', 'home'))
+
+        # Derived samples carry their root subject ID, so no joins are needed
+        rows = queryset_rows(model.objects.filter(pk__in=sample_pks).order_by('barcode'), label_fields(model))
+        return streaming_export('sample_labels', LABEL_HEADER, rows, fmt, compress=bool(request.POST.get('gzip')))
+
+
+class SampleExportView(LoginRequiredMixin, View):
+    """
+    Stream every row of one sample model with the requested columns.
+
+    Query parameters: `columns` (comma-separated field names, default all),
+    `format` (csv or tsv) and `gzip`.
+    """
+    def get(self, request, model_type, *args, **kwargs):
+        model = SEARCH_MODEL_BY_NAME.get(model_type)
+        if model is None:
+            raise Http404("Unknown sample type.")
+        if not request.user.has_perm(f'sampletracking.view_{model_type}'):
+            raise PermissionDenied
+
+        fmt = request.GET.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return HttpResponseBadRequest("Unsupported export format.")
+        requested = [column.strip() for column in request.GET.get('columns', '').split(',') if column.strip()]
+        try:
+            columns = resolve_columns(model, requested)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        logger.info(f"Export of {model_type} ({len(columns)} columns) by user {request.user.username}")
+        rows = queryset_rows(model.objects.order_by('pk'), columns)
+        return streaming_export(model._meta.model_name, columns, rows, fmt, compress=bool(request.GET.get('gzip')))